@@ -0,0 +1,160 @@
+"""
+ASGI front for the LLM-bound endpoints.
+
+The chat, analyzer, summary, patient-reply and disease-insight routes spend
+nearly all their time waiting on model APIs. Under gunicorn each of those
+waits pins one of the worker's threads; here they are coroutines awaiting the
+async gateway, so one worker keeps hundreds of them in flight. Every other
+route (news, trends, payments, Meet, the SSE streams) is served by the
+unchanged Flask app, mounted underneath through a WSGI bridge.
+"""
+import asyncio
+import traceback
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from . import create_app, services
+from .payment_routes import verified_uid
+from groq_service import get_health_assistant
+from patient_chat_service import get_patient_service
+from cerebras_service import generate_medical_summary_async
+
+
+async def _json_body(request):
+    # Mirrors Flask's request.get_json(): None when the body is not JSON
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+async def _upload(request):
+    """(bytes, error response) for the multipart "file" field."""
+    form = await request.form()
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        return None, JSONResponse({"error": "No file part in the request"}, status_code=400)
+    if not file.filename:
+        return None, JSONResponse({"error": "No file selected for uploading"}, status_code=400)
+    return await file.read(), None
+
+
+async def health_assistant_chat(request):
+    """Handle chat messages to Health Assistant AI."""
+    try:
+        data = await _json_body(request)
+
+        if not data or 'message' not in data:
+            return JSONResponse({'error': 'Message is required'}, status_code=400)
+
+        assistant = get_health_assistant()
+        result = await assistant.agenerate_response(
+            data['message'], data.get('conversation_id'), data.get('medicalContext')
+        )
+        return JSONResponse(result)
+
+    except Exception as e:
+        print(f"Health Assistant Error: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'success': False,
+            'error': str(e),
+            'response': 'I apologize, but I encountered an error. Please try again.'
+        }, status_code=500)
+
+
+async def process_analyzer_report(request):
+    try:
+        data, error = await _upload(request)
+        if error:
+            return error
+        return JSONResponse(await services.analyze_comprehensive_async(data))
+
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({"error": f"An error occurred during comprehensive analysis: {e}"}, status_code=500)
+
+
+async def generate_summary(request):
+    try:
+        data = await _json_body(request)
+        texts = data.get('texts', [])
+        file_urls = data.get('file_urls', [])
+
+        if not texts and not file_urls:
+            return JSONResponse({'summary': "No content to summarize."})
+
+        file_timings = []
+        summary = await generate_medical_summary_async(
+            texts,
+            file_urls=file_urls,
+            file_timings=file_timings,
+            uid=await asyncio.to_thread(verified_uid, request.headers.get('Authorization')),
+            patient_id=data.get('patient_id'),
+            refresh=bool(data.get('refresh')),
+        )
+        return JSONResponse({'summary': summary, 'file_timings': file_timings})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def patient_chat_reply(request):
+    """Generate an AI reply for the patient persona."""
+    try:
+        data = await _json_body(request)
+        service = get_patient_service()
+        reply = await service.agenerate_patient_reply(data.get('history', []), data.get('patientContext', {}))
+        return JSONResponse({'reply': reply})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def disease_insight(request):
+    """Generate AI insight for disease metrics."""
+    try:
+        data = await _json_body(request)
+        disease = data.get('disease')
+        metrics = data.get('metrics')
+
+        if not disease or not metrics:
+            return JSONResponse({'error': 'Missing disease or metrics data'}, status_code=400)
+
+        assistant = get_health_assistant()
+        return JSONResponse(await assistant.analyze_disease_progress_async(disease.get('name'), metrics))
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+ASYNC_ROUTES = [
+    Route('/api/health-assistant/chat', health_assistant_chat, methods=['POST']),
+    Route('/api/analyzer/process', process_analyzer_report, methods=['POST']),
+    Route('/api/generate-summary', generate_summary, methods=['POST']),
+    Route('/api/chat/patient-reply', patient_chat_reply, methods=['POST']),
+    Route('/api/disease-insight', disease_insight, methods=['POST']),
+]
+
+
+def create_asgi_app(flask_app=None):
+    """
+    ASGI application: the async routes above, with everything else falling
+    through to `flask_app` (by default a fresh `create_app()`).
+    """
+    flask_app = flask_app or create_app()
+
+    # Same CORS policy Flask-CORS applies to /api/* (also answers the preflights)
+    api = Starlette(
+        routes=ASYNC_ROUTES,
+        middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    )
+    return Starlette(routes=[
+        *(Route(route.path, endpoint=api) for route in ASYNC_ROUTES),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ])
@@ -0,0 +1,221 @@
+"""
+Single-pass keyword engine for health-news classification.
+
+Every keyword list used to classify an article (health/India filters, category,
+urgency, tags, Indian and global locations) is compiled into one regex. A scan of
+the article text finds every keyword occurrence, overlapping ones included, and
+all facets are derived from that one set of matches.
+"""
+import re
+
+_GLOBAL_COORDS = {
+    'geneva': [46.20, 6.14],
+    'london': [51.51, -0.13],
+    'new york': [40.71, -74.01],
+    'tokyo': [35.68, 139.65],
+    'sydney': [-33.87, 151.21],
+    'paris': [48.86, 2.35],
+    'washington': [38.90, -77.04],
+    'beijing': [39.90, 116.41],
+    'berlin': [52.52, 13.40],
+    'rome': [41.90, 12.49],
+    'who': [46.20, 6.14],
+    'cdc': [33.75, -84.39],
+}
+_DEFAULT_GLOBAL_LOCS = [
+    [40.71, -74.01], [51.51, -0.13], [46.20, 6.14],
+    [35.68, 139.65], [-33.87, 151.21]
+]
+
+_CITY_COORDS = {
+    'new delhi': [28.61, 77.21], 'delhi': [28.61, 77.21],
+    'mumbai': [19.08, 72.88],   'bombay': [19.08, 72.88],
+    'bengaluru': [12.97, 77.59],'bangalore': [12.97, 77.59],
+    'chennai': [13.08, 80.27],  'madras': [13.08, 80.27],
+    'kolkata': [22.57, 88.36],  'calcutta': [22.57, 88.36],
+    'hyderabad': [17.39, 78.49],
+    'pune': [18.52, 73.86],
+    'ahmedabad': [23.02, 72.57],
+    'jaipur': [26.91, 75.79],
+    'lucknow': [26.85, 80.95],
+    'kerala': [10.85, 76.27],   'kochi': [9.93, 76.26],
+    'karnataka': [15.32, 75.71],
+    'tamil nadu': [11.13, 78.66],
+    'gujarat': [22.26, 71.19],
+    'rajasthan': [27.02, 74.22],
+}
+_DEFAULT_LOCS = [
+    [28.61, 77.21], [19.08, 72.88], [12.97, 77.59],
+    [13.08, 80.27], [22.57, 88.36], [17.39, 78.49],
+]
+_CAT_KW = {
+    'ALERT':    ['dengue','malaria','outbreak','surge','emergency','warning','alert','epidemic','virus','infection','spike'],
+    'POLICY':   ['ayushman','budget','scheme','ministry','policy','government','regulation','bill','coverage','insurance','niti'],
+    'RESEARCH': ['study','research','trial','artificial intelligence',' ai ','technology','innovation','icmr','findings','deployed','clinical'],
+    'UPDATE':   ['who','milestone','achievement','reduction','improvement','progress','target','goal','commend'],
+}
+_URGENT_KW  = ['emergency','urgent','surge','outbreak','alert','critical','spike','epidemic','warning']
+_HEALTH_TAGS = {
+    'dengue':'Dengue','malaria':'Malaria','covid':'COVID-19','cancer':'Cancer',
+    'diabetes':'Diabetes','tuberculosis':'Tuberculosis',' tb ':'Tuberculosis',
+    'cholera':'Cholera','zika':'Zika','mpox':'Mpox','vaccine':'Vaccine',
+    'vaccination':'Vaccine','mental health':'Mental Health','ayushman':'Ayushman',
+    'budget':'Budget','research':'Research','outbreak':'Outbreak',
+    'monsoon':'Monsoon','who':'WHO','icmr':'ICMR','hospital':'Hospital',
+}
+
+_INDIA_NAMES = ['india', 'indian', 'bharat']
+_INDIAN_STATE_KEYWORDS = [
+    'maharashtra', 'uttar pradesh', 'bihar', 'punjab', 'haryana', 
+    'assam', 'odisha', 'madhya pradesh', 'telangana', 'andhra pradesh', 
+    'goa', 'kashmir', 'himachal', 'uttarakhand', 'jharkhand', 
+    'chhattisgarh', 'sikkim', 'manipur', 'meghalaya', 'mizoram', 
+    'nagaland', 'tripura', 'arunachal'
+]
+_HEALTH_KEYWORDS = [
+    'health', 'healthcare', 'disease', 'hospital', 'medical', 'medicine', 
+    'vaccine', 'vaccination', 'outbreak', 'virus', 'infection', 'patient', 
+    'doctor', 'clinical', 'drug', 'treatment', 'pharma', 'epidemic', 
+    'pandemic', 'illness', 'dengue', 'malaria', 'covid', 'cancer', 
+    'diabetes', 'tuberculosis', 'cholera', 'zika', 'mpox', 'surgeon', 
+    'cardiac', 'hiv', 'aids', 'pathogen', 'fda', 'icmr', 'who', 
+    'ayushman', 'hygiene', 'sanitation', 'pediatric', 'nursing', 'nurse', 
+    'physician', 'clinic', 'flu', 'fever', 'symptoms', 'diagnose', 
+    'diagnosis', 'antibiotic', 'allergy', 'asthma', 'mental', 'nutrition', 
+    'vitamin', 'diet', 'covid-19', 'h5n1', 'h1n1', 'heart', 'brain', 
+    'lung', 'stroke', 'wellness', 'pfizer', 'moderna', 'astrazeneca', 
+    'covaxin', 'covishield', 'surgery', 'surgical', 'therapy', 'therapeutic', 
+    'infectious', 'epidemiology', 'pathology', 'sleep', 'fitness', 
+    'exercise', 'workout', 'obesity', 'overweight', 'calorie', 'calories', 
+    'injury', 'injuries', 'pain', 'aches', 'kidney', 'liver', 'kidneys', 
+    'stomach', 'intestinal', 'digestive', 'digestion', 'nutritionist', 
+    'medicinal', 'pulse', 'blood', 'anatomy', 'hygienic', 'immune', 
+    'immunity', 'vaccines', 'medicines', 'hospitals', 'doctors', 'patients',
+    'diseases', 'viruses', 'infections', 'clinics', 'symptom', 'therapies',
+    'telemedicine', 'biomedicine', 'ehealth', 'mhealth', 'healthtech'
+]
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+def _is_whole_word(text, start, end):
+    """Same test as wrapping the keyword in `\\b...\\b`."""
+    return (start == 0 or not _is_word_char(text[start - 1])) and (
+        end == len(text) or not _is_word_char(text[end])
+    )
+
+
+def _trie_pattern(node):
+    """Regex for a character trie; at every node longer continuations are tried first."""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    return f'(?:{body})?' if '' in node else body
+
+
+class KeywordMatcher:
+    """
+    Finds all occurrences of a keyword set in one `re.finditer` pass.
+
+    The keywords are folded into a trie-shaped regex (a flat alternation of a few
+    hundred literals makes `re` try each one at every position) wrapped in a
+    zero-width lookahead, so the scan reports the longest keyword starting at every
+    position. Shorter keywords starting at the same position are necessarily
+    prefixes of it and are expanded from a precomputed table.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = sorted(set(keywords), key=len, reverse=True)
+        trie = {}
+        for kw in self.keywords:
+            node = trie
+            for ch in kw:
+                node = node.setdefault(ch, {})
+            node[''] = True
+        self._pattern = re.compile(f'(?=({_trie_pattern(trie)}))')
+        self._prefixes = {
+            kw: [k for k in self.keywords if kw.startswith(k)] for kw in self.keywords
+        }
+
+    def finditer(self, text):
+        """Yield (keyword, start, end) for every occurrence in `text`."""
+        for match in self._pattern.finditer(text):
+            start = match.start()
+            for kw in self._prefixes[match.group(1)]:
+                yield kw, start, start + len(kw)
+
+
+_BOUNDED_INDIA_KEYWORDS = set(_INDIA_NAMES) | set(_CITY_COORDS) | set(_INDIAN_STATE_KEYWORDS)
+_BOUNDED_HEALTH_KEYWORDS = set(_HEALTH_KEYWORDS)
+_BOUNDED_KEYWORDS = _BOUNDED_INDIA_KEYWORDS | _BOUNDED_HEALTH_KEYWORDS
+_URGENT_SET = set(_URGENT_KW)
+
+_MATCHER = KeywordMatcher(
+    list(_BOUNDED_INDIA_KEYWORDS)
+    + list(_BOUNDED_HEALTH_KEYWORDS)
+    + [kw for kws in _CAT_KW.values() for kw in kws]
+    + _URGENT_KW
+    + list(_HEALTH_TAGS)
+    + list(_GLOBAL_COORDS)
+)
+
+
+def classify_article(title, desc='', source_name=''):
+    """
+    Classify one article in a single pass over its text.
+
+    Matching rules are those of the previous per-facet helpers:
+    - `is_health` / `is_indian`: whole-word matches (`\\b...\\b`); only `is_indian`
+      also looks at the source name.
+    - `category`, `urgent`, `tags`, `location`, `global_location`: substring matches
+      on "title desc", first hit in table order wins. Locations are None when no
+      place is mentioned; see `default_location` / `default_global_location`.
+    """
+    article = f"{title} {desc or ''}".lower()
+    article_end = len(article)
+    text = f"{article} {(source_name or '').lower()}"
+
+    substrings = set()
+    is_health = is_indian = False
+    for kw, start, end in _MATCHER.finditer(text):
+        in_article = end <= article_end
+        if in_article:
+            substrings.add(kw)
+        if kw in _BOUNDED_KEYWORDS and _is_whole_word(text, start, end):
+            is_indian = is_indian or kw in _BOUNDED_INDIA_KEYWORDS
+            is_health = is_health or (in_article and kw in _BOUNDED_HEALTH_KEYWORDS)
+
+    category = next((cat for cat, kws in _CAT_KW.items() if any(k in substrings for k in kws)), 'UPDATE')
+
+    tags = []
+    for kw, tag in _HEALTH_TAGS.items():
+        if kw in substrings and tag not in tags:
+            tags.append(tag)
+        if len(tags) >= 3:
+            break
+
+    location = next((coords for city, coords in _CITY_COORDS.items() if city in substrings), None)
+    global_location = next((coords for place, coords in _GLOBAL_COORDS.items() if place in substrings), None)
+
+    return {
+        'is_health': is_health,
+        'is_indian': is_indian,
+        'category': category,
+        'urgent': not substrings.isdisjoint(_URGENT_SET),
+        'tags': tags or ['Health', 'India'],
+        'location': location,
+        'global_location': global_location,
+    }
+
+
+def default_location(idx):
+    """Spread unplaced Indian articles across a few default map pins."""
+    return _DEFAULT_LOCS[idx % len(_DEFAULT_LOCS)]
+
+
+def default_global_location(idx):
+    """Spread unplaced world articles across a few default map pins."""
+    return _DEFAULT_GLOBAL_LOCS[idx % len(_DEFAULT_GLOBAL_LOCS)]
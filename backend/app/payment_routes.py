@@ -7,6 +7,7 @@ import traceback
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from .services import _TRENDS_CACHE # Import if needed, or just standard libs
+from utils.cache_manager import CacheManager
 
 # Explicitly load .env so key lookups don't depend on another module being
 # imported first (previously this only worked because services.py ran load_dotenv).
@@ -57,6 +58,23 @@ def _get_db():
         return None
 
 
+def verified_uid(authorization):
+    """uid from an "Authorization: Bearer <Firebase ID token>" header value, or None if missing or invalid."""
+    if not authorization or not authorization.startswith('Bearer '):
+        return None
+    try:
+        import firebase_admin
+        from firebase_admin import auth
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app()
+
+        return auth.verify_id_token(authorization[len('Bearer '):]).get('uid')
+    except Exception as e:
+        print(f"ID token verification failed: {e}")
+        return None
+
+
 def _persist_subscription(uid, fields):
     """Write subscription fields onto the user document. Best-effort."""
     if not uid:
@@ -76,6 +94,33 @@ def _persist_subscription(uid, fields):
         return False
 
 
+_PREMIUM_STATUSES = {'active', 'authenticated'}
+_PREMIUM_TTL = 300  # seconds a tier lookup is reused
+_premium_cache = CacheManager(
+    expiration_hours=_PREMIUM_TTL / 3600,
+    max_entries=int(os.getenv('PREMIUM_CACHE_MAX_ENTRIES', 10000)),
+)
+
+
+def is_premium_user(uid):
+    """True if the user's Firestore document has an active Premium subscription (cached briefly)."""
+    if not uid:
+        return False
+    cached = _premium_cache.get(uid)
+    if cached is not None:
+        return cached
+    premium = False
+    db = _get_db()
+    if db:
+        try:
+            user = db.collection('users').document(uid).get().to_dict() or {}
+            premium = user.get('subscriptionTier') == 'Premium' and user.get('subscriptionStatus') in _PREMIUM_STATUSES
+        except Exception as e:
+            print(f"Premium lookup error: {e}")
+    _premium_cache.set(uid, premium)
+    return premium
+
+
 def _resolve_plan_id(plan_type, selected_plan):
     """Return a fixed plan_id from env, or create one on the fly as a fallback."""
     fixed = PLAN_IDS.get(plan_type)
@@ -1,111 +1,55 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 import traceback
-import re
+import json
+from io import BytesIO
 from gemini_service import get_health_assistant as get_gemini_assistant
 
 app = Blueprint('health_routes', __name__)
 
 from . import services
+from .news_classifier import classify_article, default_location, default_global_location
 import traceback
 import sys
 import os
 import time
+import threading
 import requests as http_requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from datetime import datetime
+from utils.cache_manager import CACHE_DIR
+from utils.news_archive import create_news_archive, headline_key
+from utils.response_cache import EncodedResponse, response_cache
+from utils.llm_gateway import llm_gateway
+from utils.job_queue import PRIORITY_PREMIUM, PRIORITY_STANDARD, JobWorkers, callback_url_error, create_job_queue
+from .payment_routes import is_premium_user, verified_uid
 
 # ── News API helpers ──────────────────────────────────────────────────────────
 
 _news_cache = {'data': None, 'ts': 0}
 _NEWS_TTL = 1800  # 30 min
-_historical_articles = []
+_NEWS_REFRESH_AHEAD = 300  # refresh this long before the TTL runs out
+_news_refresh_lock = threading.Lock()  # single-flight: one NewsAPI refresh at a time
+_news_refresher_started = False
+_news_refresher_lock_file = None  # held for the process's lifetime by the worker that polls NewsAPI
+_news_failed_at = 0  # last failed refresh; no refresh is retried for _NEWS_RETRY_AFTER seconds
+_NEWS_RETRY_AFTER = 60
+# Every refresh is archived; thin NewsAPI responses and cold starts are topped up from it
+_news_archive = create_news_archive()
+
+# Shared keep-alive session so refreshes reuse TLS connections to newsapi.org,
+# and a small pool to run the independent upstream calls side by side
+_NEWS_API_BASE = 'https://newsapi.org/v2'
+_NEWS_DEADLINE = 10  # seconds for the whole fan-out
+_news_session = http_requests.Session()
+_news_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+_news_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='newsapi')
 
 # Startup validation: warn if News API key is missing
 _news_api_key_present = bool(os.getenv('News_API_key') or os.getenv('NEWS_API_KEY'))
 if not _news_api_key_present:
     print('[⚠ NEWS] NEWS_API_KEY not found in environment — /api/health-news will return 500')
 
-_GLOBAL_COORDS = {
-    'geneva': [46.20, 6.14],
-    'london': [51.51, -0.13],
-    'new york': [40.71, -74.01],
-    'tokyo': [35.68, 139.65],
-    'sydney': [-33.87, 151.21],
-    'paris': [48.86, 2.35],
-    'washington': [38.90, -77.04],
-    'beijing': [39.90, 116.41],
-    'berlin': [52.52, 13.40],
-    'rome': [41.90, 12.49],
-    'who': [46.20, 6.14],
-    'cdc': [33.75, -84.39],
-}
-_DEFAULT_GLOBAL_LOCS = [
-    [40.71, -74.01], [51.51, -0.13], [46.20, 6.14],
-    [35.68, 139.65], [-33.87, 151.21]
-]
-
-def _detect_global_location(text, idx):
-    t = text.lower()
-    for place, coords in _GLOBAL_COORDS.items():
-        if place in t:
-            return coords
-    return _DEFAULT_GLOBAL_LOCS[idx % len(_DEFAULT_GLOBAL_LOCS)]
-
-
-_CITY_COORDS = {
-    'new delhi': [28.61, 77.21], 'delhi': [28.61, 77.21],
-    'mumbai': [19.08, 72.88],   'bombay': [19.08, 72.88],
-    'bengaluru': [12.97, 77.59],'bangalore': [12.97, 77.59],
-    'chennai': [13.08, 80.27],  'madras': [13.08, 80.27],
-    'kolkata': [22.57, 88.36],  'calcutta': [22.57, 88.36],
-    'hyderabad': [17.39, 78.49],
-    'pune': [18.52, 73.86],
-    'ahmedabad': [23.02, 72.57],
-    'jaipur': [26.91, 75.79],
-    'lucknow': [26.85, 80.95],
-    'kerala': [10.85, 76.27],   'kochi': [9.93, 76.26],
-    'karnataka': [15.32, 75.71],
-    'tamil nadu': [11.13, 78.66],
-    'gujarat': [22.26, 71.19],
-    'rajasthan': [27.02, 74.22],
-}
-_DEFAULT_LOCS = [
-    [28.61, 77.21], [19.08, 72.88], [12.97, 77.59],
-    [13.08, 80.27], [22.57, 88.36], [17.39, 78.49],
-]
-_CAT_KW = {
-    'ALERT':    ['dengue','malaria','outbreak','surge','emergency','warning','alert','epidemic','virus','infection','spike'],
-    'POLICY':   ['ayushman','budget','scheme','ministry','policy','government','regulation','bill','coverage','insurance','niti'],
-    'RESEARCH': ['study','research','trial','artificial intelligence',' ai ','technology','innovation','icmr','findings','deployed','clinical'],
-    'UPDATE':   ['who','milestone','achievement','reduction','improvement','progress','target','goal','commend'],
-}
-_URGENT_KW  = ['emergency','urgent','surge','outbreak','alert','critical','spike','epidemic','warning']
-_HEALTH_TAGS = {
-    'dengue':'Dengue','malaria':'Malaria','covid':'COVID-19','cancer':'Cancer',
-    'diabetes':'Diabetes','tuberculosis':'Tuberculosis',' tb ':'Tuberculosis',
-    'cholera':'Cholera','zika':'Zika','mpox':'Mpox','vaccine':'Vaccine',
-    'vaccination':'Vaccine','mental health':'Mental Health','ayushman':'Ayushman',
-    'budget':'Budget','research':'Research','outbreak':'Outbreak',
-    'monsoon':'Monsoon','who':'WHO','icmr':'ICMR','hospital':'Hospital',
-}
-
-def _categorize(text):
-    t = text.lower()
-    for cat, kws in _CAT_KW.items():
-        if any(k in t for k in kws):
-            return cat
-    return 'UPDATE'
-
-def _detect_location(text, idx):
-    t = text.lower()
-    for city, coords in _CITY_COORDS.items():
-        if city in t:
-            return coords
-    return _DEFAULT_LOCS[idx % len(_DEFAULT_LOCS)]
-
-def _is_urgent(text):
-    t = text.lower()
-    return any(k in t for k in _URGENT_KW)
-
 def _short_pin(title, max_len=30):
     words = title.split()[:6]
     pin = ' '.join(words)
@@ -119,17 +63,6 @@ def _fmt_date(dt_str):
     except Exception:
         return (dt_str or '')[:10]
 
-def _extract_tags(title, desc):
-    combined = (title + ' ' + (desc or '')).lower()
-    tags = []
-    for kw, tag in _HEALTH_TAGS.items():
-        if kw in combined and tag not in tags:
-            tags.append(tag)
-        if len(tags) >= 3:
-            break
-    return tags or ['Health', 'India']
-
-
 # Add parent directory to path to import groq_service
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from groq_service import get_health_assistant
@@ -146,8 +79,16 @@ def generate_summary_route():
         if not texts and not file_urls:
             return jsonify({'summary': "No content to summarize."})
             
-        summary = generate_medical_summary(texts, file_urls=file_urls)
-        return jsonify({'summary': summary})
+        file_timings = []
+        summary = generate_medical_summary(
+            texts,
+            file_urls=file_urls,
+            file_timings=file_timings,
+            uid=verified_uid(request.headers.get('Authorization')),
+            patient_id=data.get('patient_id'),
+            refresh=bool(data.get('refresh')),
+        )
+        return jsonify({'summary': summary, 'file_timings': file_timings})
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -155,8 +96,8 @@ def generate_summary_route():
 @app.route('/api/disease-trends', methods=['GET'])
 def get_disease_trends():
     try:
-        trends = services.get_trends_data()
-        return jsonify(trends)
+        body, etag = services.get_trends_payload()
+        return response_cache.get('disease-trends', etag, lambda: EncodedResponse(body)).to_response()
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"An error occurred: {e}"}), 500
@@ -208,14 +149,153 @@ def process_analyzer_report():
         traceback.print_exc()
         return jsonify({"error": f"An error occurred during comprehensive analysis: {e}"}), 500
 
+@app.route('/api/analyzer/batch', methods=['POST'])
+def process_analyzer_batch():
+    """Analyse several uploads ("files", repeated) into one merged analysis and summary."""
+    try:
+        files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+        if not files:
+            return jsonify({"error": "No files selected for uploading"}), 400
+        if len(files) > services.ANALYZER_BATCH_MAX_FILES:
+            return jsonify({"error": f"At most {services.ANALYZER_BATCH_MAX_FILES} files per batch"}), 400
+
+        results = services.analyze_batch([(f.filename, f.read()) for f in files])
+        return jsonify(results)
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"An error occurred during batch analysis: {e}"}), 500
+
+# Background analysis: submitting returns a job id at once and the three cores
+# run on worker threads; clients poll the job or receive it at a callback URL
+_analysis_jobs = create_job_queue()
+_analysis_workers = JobWorkers(
+    _analysis_jobs, services.run_analysis_job, workers=int(os.getenv('ANALYZER_JOB_WORKERS', 2))
+) if _analysis_jobs else None
+
+@app.route('/api/analyzer/jobs', methods=['POST'])
+def submit_analyzer_job():
+    """Queue an upload for analysis; premium users go in the priority lane."""
+    try:
+        if not _analysis_jobs:
+            return jsonify({"error": "Background analysis is unavailable"}), 503
+
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part in the request"}), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            return jsonify({"error": "No file selected for uploading"}), 400
+
+        callback_url = request.form.get('callback_url') or None
+        if callback_url:
+            error = callback_url_error(callback_url)
+            if error:
+                return jsonify({"error": error}), 400
+
+        # The lane follows the signed-in user (Firebase ID token), never a form field
+        uid = verified_uid(request.headers.get('Authorization'))
+        priority = PRIORITY_PREMIUM if is_premium_user(uid) else PRIORITY_STANDARD
+        job_id = _analysis_jobs.submit(
+            'analyzer', file.read(), priority=priority, params={'uid': uid}, callback_url=callback_url, owner=uid
+        )
+        _analysis_workers.start()
+        _analysis_workers.notify()
+
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'lane': 'premium' if priority == PRIORITY_PREMIUM else 'standard',
+            'status_url': f"/api/analyzer/jobs/{job_id}",
+        }), 202
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"Could not queue the analysis: {e}"}), 500
+
+@app.route('/api/analyzer/jobs/<job_id>', methods=['GET'])
+def get_analyzer_job(job_id):
+    """
+    Status, stage/progress and (once done) the result of a queued analysis. A job
+    submitted by a signed-in user is only shown to that user (404 to anyone else).
+    """
+    if not _analysis_jobs:
+        return jsonify({"error": "Background analysis is unavailable"}), 503
+    job = _analysis_jobs.get_for(job_id, verified_uid(request.headers.get('Authorization')))
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job['status'] in ('queued', 'running'):
+        # e.g. a fresh instance picking up jobs queued before a restart
+        _analysis_workers.start()
+    return jsonify(job)
+
+def _resume_analysis_jobs():
+    """Start the workers at import if jobs were left queued by a previous process."""
+    try:
+        if _analysis_jobs and _analysis_jobs.pending():
+            print(f"[Jobs] resuming {_analysis_jobs.pending()} queued analyses")
+            _analysis_workers.start()
+    except Exception as e:
+        print(f"[Jobs] could not resume queued analyses: {e}")
+
+@app.route('/api/llm/metrics', methods=['GET'])
+def llm_metrics():
+    """Rolling p50/p95 latency, error rate and breaker state per provider/model."""
+    return jsonify(llm_gateway.stats())
+
+@app.route('/api/analyzer/metrics', methods=['GET'])
+def analyzer_metrics():
+    """Which Core 1 path (text layer, OCR, vision) documents took, and how long each took on average."""
+    metrics = services.get_analyzer_metrics()
+    if _analysis_jobs:
+        metrics['jobs'] = _analysis_jobs.stats()
+    return jsonify(metrics)
+
+def _sse(event, payload):
+    """Format one server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def _sse_response(events):
+    """Wrap an iterator of (event, payload) tuples as a text/event-stream response."""
+    def generate():
+        for event, payload in events:
+            yield _sse(event, payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/analyzer/process/stream', methods=['POST'])
+def process_analyzer_report_stream():
+    """Server-sent events variant of /api/analyzer/process (extraction -> verification -> summary tokens)."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request"}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        return jsonify({"error": "No file selected for uploading"}), 400
+
+    # Buffer the upload so the generator does not depend on the request stream
+    file_stream = BytesIO(file.read())
+    return _sse_response(services.analyze_comprehensive_stream(file_stream))
+
+RESOURCE_DISTRIBUTION_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resource_distribution.json')
+
+def _load_resource_distribution():
+    with open(RESOURCE_DISTRIBUTION_FILE, 'r') as f:
+        return EncodedResponse.from_data(json.load(f))
+
 @app.route('/api/resource-distribution', methods=['GET'])
 def get_resource_distribution():
     try:
-        import json
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resource_distribution.json')
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        return jsonify(data)
+        # Re-read only when the file changes; otherwise serve the pre-encoded bytes
+        stat = os.stat(RESOURCE_DISTRIBUTION_FILE)
+        version = (stat.st_mtime_ns, stat.st_size)
+        return response_cache.get('resource-distribution', version, _load_resource_distribution).to_response()
     except Exception as e:
         print(f"Error loading resource data: {e}")
         return jsonify({"error": "Data unavailable"}), 500
@@ -252,6 +332,20 @@ def health_assistant_chat():
             'response': 'I apologize, but I encountered an error. Please try again.'
         }), 500
 
+@app.route('/api/health-assistant/chat/stream', methods=['POST'])
+def health_assistant_chat_stream():
+    """Stream the Health Assistant reply as server-sent events (start -> delta* -> done)."""
+    data = request.get_json()
+
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+
+    assistant = get_health_assistant()
+    events = assistant.generate_response_stream(
+        data['message'], data.get('conversation_id'), data.get('medicalContext')
+    )
+    return _sse_response(events)
+
 @app.route('/api/health-assistant/context', methods=['GET'])
 def health_assistant_context():
     """Get current disease trends context."""
@@ -286,6 +380,16 @@ def clear_conversation():
         print(f"Clear Conversation Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/health-assistant/metrics', methods=['GET'])
+def health_assistant_metrics():
+    """Expose conversation store size/eviction metrics."""
+    try:
+        assistant = get_health_assistant()
+        return jsonify(assistant.conversations.stats())
+    except Exception as e:
+        print(f"Metrics Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/chat/patient-reply', methods=['POST'])
 def patient_chat_reply():
     """Generate an AI reply for the patient persona."""
@@ -322,60 +426,6 @@ def get_disease_insight():
         return jsonify({'error': str(e)}), 500
 
 
-def _is_indian_article(title, desc, source_name):
-    combined = f"{title} {desc or ''} {source_name or ''}".lower()
-    
-    # Match India, Indian, Bharat with word boundaries to avoid matching Indiana
-    if re.search(r'\b(india|indian|bharat)\b', combined):
-        return True
-    
-    # Check major cities/states from _CITY_COORDS
-    for place in _CITY_COORDS.keys():
-        if re.search(rf'\b{re.escape(place)}\b', combined):
-            return True
-            
-    # Check other Indian states/keywords
-    indian_keywords = [
-        'maharashtra', 'uttar pradesh', 'bihar', 'punjab', 'haryana', 
-        'assam', 'odisha', 'madhya pradesh', 'telangana', 'andhra pradesh', 
-        'goa', 'kashmir', 'himachal', 'uttarakhand', 'jharkhand', 
-        'chhattisgarh', 'sikkim', 'manipur', 'meghalaya', 'mizoram', 
-        'nagaland', 'tripura', 'arunachal'
-    ]
-    for kw in indian_keywords:
-        if re.search(rf'\b{re.escape(kw)}\b', combined):
-            return True
-            
-    return False
-def _is_health_article(title, desc):
-    combined = f"{title} {desc or ''}".lower()
-    health_keywords = [
-        'health', 'healthcare', 'disease', 'hospital', 'medical', 'medicine', 
-        'vaccine', 'vaccination', 'outbreak', 'virus', 'infection', 'patient', 
-        'doctor', 'clinical', 'drug', 'treatment', 'pharma', 'epidemic', 
-        'pandemic', 'illness', 'dengue', 'malaria', 'covid', 'cancer', 
-        'diabetes', 'tuberculosis', 'cholera', 'zika', 'mpox', 'surgeon', 
-        'cardiac', 'hiv', 'aids', 'pathogen', 'fda', 'icmr', 'who', 
-        'ayushman', 'hygiene', 'sanitation', 'pediatric', 'nursing', 'nurse', 
-        'physician', 'clinic', 'flu', 'fever', 'symptoms', 'diagnose', 
-        'diagnosis', 'antibiotic', 'allergy', 'asthma', 'mental', 'nutrition', 
-        'vitamin', 'diet', 'covid-19', 'h5n1', 'h1n1', 'heart', 'brain', 
-        'lung', 'stroke', 'wellness', 'pfizer', 'moderna', 'astrazeneca', 
-        'covaxin', 'covishield', 'surgery', 'surgical', 'therapy', 'therapeutic', 
-        'infectious', 'epidemiology', 'pathology', 'sleep', 'fitness', 
-        'exercise', 'workout', 'obesity', 'overweight', 'calorie', 'calories', 
-        'injury', 'injuries', 'pain', 'aches', 'kidney', 'liver', 'kidneys', 
-        'stomach', 'intestinal', 'digestive', 'digestion', 'nutritionist', 
-        'medicinal', 'pulse', 'blood', 'anatomy', 'hygienic', 'immune', 
-        'immunity', 'vaccines', 'medicines', 'hospitals', 'doctors', 'patients',
-        'diseases', 'viruses', 'infections', 'clinics', 'symptom', 'therapies',
-        'telemedicine', 'biomedicine', 'ehealth', 'mhealth', 'healthtech'
-    ]
-    for kw in health_keywords:
-        if re.search(rf'\b{re.escape(kw)}\b', combined):
-            return True
-    return False
-
 _FALLBACK_ARTICLES = [
     {
         'category': 'ALERT',
@@ -440,47 +490,173 @@ _FALLBACK_ARTICLES = [
 ]
 
 
+def _warm_news_cache(newer_than=None):
+    """
+    Seed the cache from the archive at startup so a new instance serves real news
+    immediately. The seed carries the archive's last refresh time, so it is only
+    refetched (in the background) once that copy is due.
+
+    With `newer_than`, only loads an archive refreshed after that time and still
+    fresh: how workers pick up the refresher worker's fetches. Returns True if loaded.
+    """
+    global _news_cache
+    if not _news_archive:
+        return False
+    try:
+        updated = _news_archive.last_updated()
+        if newer_than is not None and (updated <= newer_than or time.time() - updated >= _NEWS_TTL - _NEWS_REFRESH_AHEAD):
+            return False
+        archived = _news_archive.recent(12)
+        if archived:
+            print(f"[NewsArchive] loading {len(archived)} archived articles")
+            _news_cache = {'data': _news_payload(archived), 'ts': updated}
+            return True
+    except Exception as e:
+        print(f"[NewsArchive] warm load failed: {e}")
+    return False
+
+def _news_age():
+    return time.time() - _news_cache['ts']
+
+def _refresh_news(blocking):
+    """
+    Rebuild the news cache unless another thread already is (single-flight).
+    Non-blocking callers return immediately if a refresh is in flight; blocking
+    callers wait for it and reuse its result.
+    """
+    global _news_cache, _news_failed_at
+    if not _news_refresh_lock.acquire(blocking=blocking):
+        return
+    try:
+        # Another thread may have refreshed while we waited for the lock
+        if _news_cache['data'] and _news_age() < _NEWS_TTL - _NEWS_REFRESH_AHEAD:
+            return
+        # ...or just failed to, in which case waiting requests do not all retry
+        if time.time() - _news_failed_at < _NEWS_RETRY_AFTER:
+            return
+        # The refresher worker archives every fetch; reuse it rather than calling NewsAPI again
+        if _warm_news_cache(newer_than=_news_cache['ts']):
+            return
+        result = _build_health_news()
+        _news_cache = {'data': result, 'ts': time.time()}
+    except Exception as e:
+        _news_failed_at = time.time()
+        print(f"[NewsAPI] refresh failed, keeping previous copy: {e}")
+    finally:
+        _news_refresh_lock.release()
+
+def _news_refresher_loop():
+    """Keep the cache warm so user requests never wait on NewsAPI."""
+    while True:
+        wait = (_NEWS_TTL - _NEWS_REFRESH_AHEAD) - _news_age()
+        if wait > 0:
+            time.sleep(wait)
+            continue
+        _refresh_news(blocking=True)
+        if _news_age() >= _NEWS_TTL - _NEWS_REFRESH_AHEAD:
+            # Refresh failed; back off instead of spinning
+            time.sleep(60)
+
+def _claim_news_refresher():
+    """
+    Whether this process should run the refresher: the first worker to take an
+    exclusive lock on a file in CACHE_DIR does, so polling does not scale with
+    the worker count. The others load its fetches from the news archive.
+    """
+    global _news_refresher_lock_file
+    if not _news_archive:
+        return True
+    try:
+        import fcntl
+    except ImportError:
+        return True  # Windows dev server: a single process
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        lock_file = open(os.path.join(CACHE_DIR, 'news_refresher.lock'), 'w')
+    except OSError as e:
+        print(f"[NewsAPI] no refresher lock ({e}), refreshing in this worker")
+        return True
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _news_refresher_lock_file = lock_file
+    return True
+
+def _start_news_refresher():
+    global _news_refresher_started
+    if _news_refresher_started or not _news_api_key_present:
+        return
+    _news_refresher_started = True
+    if not _claim_news_refresher():
+        return
+    print(f"[NewsAPI] refresher running in worker {os.getpid()}")
+    threading.Thread(target=_news_refresher_loop, name='news-refresher', daemon=True).start()
+
 @app.route('/api/health-news', methods=['GET'])
 def get_health_news():
-    """Fetch & cache India health news from News API, fallback to world health news, previous news, and curated news."""
-    global _news_cache, _historical_articles
-    if _news_cache['data'] and (time.time() - _news_cache['ts']) < _NEWS_TTL:
-        return jsonify(_news_cache['data'])
-
+    """Serve cached India health news; refreshes happen single-flight, ahead of expiry, in the background."""
+    _start_news_refresher()
+
+    if not _news_cache['data']:
+        # Cold start: one thread fetches, concurrent requests wait for its result
+        _refresh_news(blocking=True)
+    elif _news_age() >= _NEWS_TTL - _NEWS_REFRESH_AHEAD and time.time() - _news_failed_at >= _NEWS_RETRY_AFTER:
+        # Stale-while-revalidate: answer from the old copy, refresh off the request path
+        threading.Thread(target=_refresh_news, args=(False,), daemon=True).start()
+
+    snapshot = _news_cache
+    if not snapshot['data']:
+        # Cold start and the refresh failed: curated articles, not cached, so the next request retries
+        return EncodedResponse.from_data(_news_payload([])).to_response()
+
+    # Encoded once per refresh; the refresh timestamp identifies the copy
+    return response_cache.get('health-news', snapshot['ts'], lambda: EncodedResponse.from_data(snapshot['data'])).to_response()
+
+def _fetch_news(endpoint, params):
+    """One NewsAPI call over the shared session; returns its articles or [] on any failure."""
+    try:
+        r = _news_session.get(f'{_NEWS_API_BASE}/{endpoint}', params=params, timeout=(3.05, _NEWS_DEADLINE))
+        if r.status_code == 200:
+            return r.json().get('articles', [])
+        print(f"[NewsAPI] {endpoint} returned {r.status_code}")
+    except Exception as e:
+        print(f"[NewsAPI] {endpoint} error: {e}")
+    return []
+
+def _fetch_news_concurrently(calls):
+    """Run (endpoint, params) calls in parallel under one overall deadline, preserving order."""
+    futures = [_news_executor.submit(_fetch_news, endpoint, params) for endpoint, params in calls]
+    wait(futures, timeout=_NEWS_DEADLINE)
+    results = []
+    for (endpoint, _), future in zip(calls, futures):
+        if future.done():
+            results.append(future.result())
+        else:
+            print(f"[NewsAPI] {endpoint} missed the {_NEWS_DEADLINE}s deadline")
+            future.cancel()
+            results.append([])
+    return results
+
+def _build_health_news():
+    """Fetch India health news from News API, fallback to world health news, archived news, and curated news."""
     api_key = os.getenv('News_API_key') or os.getenv('NEWS_API_KEY')
     raw_headlines = []
     raw_everything = []
-    raw_world = []
 
-    # Attempt to fetch India news
+    # Fetch India headlines and India search concurrently: one timeout, not two in a row
     if api_key:
-        try:
-            r = http_requests.get(
-                'https://newsapi.org/v2/top-headlines',
-                params={'country': 'in', 'category': 'health', 'pageSize': 15, 'apiKey': api_key},
-                timeout=10,
-            )
-            if r.status_code == 200:
-                raw_headlines = r.json().get('articles', [])
-        except Exception as e:
-            print(f"[NewsAPI] top-headlines error: {e}")
-
-        try:
-            r2 = http_requests.get(
-                'https://newsapi.org/v2/everything',
-                params={
-                    'q': 'India AND (health OR disease OR hospital OR medicine OR vaccine OR outbreak)',
-                    'language': 'en',
-                    'sortBy': 'publishedAt',
-                    'pageSize': 20,
-                    'apiKey': api_key,
-                },
-                timeout=10,
-            )
-            if r2.status_code == 200:
-                raw_everything = r2.json().get('articles', [])
-        except Exception as e:
-            print(f"[NewsAPI] everything error: {e}")
+        raw_headlines, raw_everything = _fetch_news_concurrently([
+            ('top-headlines', {'country': 'in', 'category': 'health', 'pageSize': 15, 'apiKey': api_key}),
+            ('everything', {
+                'q': 'India AND (health OR disease OR hospital OR medicine OR vaccine OR outbreak)',
+                'language': 'en',
+                'sortBy': 'publishedAt',
+                'pageSize': 20,
+                'apiKey': api_key,
+            }),
+        ])
 
     # Deduplicate and filter India news
     seen = set()
@@ -491,9 +667,10 @@ def get_health_news():
         t = a.get('title') or ''
         desc = a.get('description') or ''
         if t and t not in seen:
-            if _is_health_article(t, desc):
+            facets = classify_article(t.strip(), desc.strip())
+            if facets['is_health']:
                 seen.add(t)
-                india_articles.append(a)
+                india_articles.append((a, facets))
             
     # 2. Process everything search results, filtering for Indian context & health context
     for a in raw_everything:
@@ -501,63 +678,54 @@ def get_health_news():
         desc = a.get('description') or ''
         src = (a.get('source') or {}).get('name') or ''
         if t and t not in seen:
-            if _is_health_article(t, desc) and _is_indian_article(t, desc, src):
+            facets = classify_article(t.strip(), desc.strip(), src)
+            if facets['is_health'] and facets['is_indian']:
                 seen.add(t)
-                india_articles.append(a)
+                india_articles.append((a, facets))
 
-    # Normalise to frontend schema
+    # Normalise to frontend schema, reusing the facets computed while filtering
     articles = []
-    for idx, a in enumerate(india_articles[:12]):
+    for idx, (a, facets) in enumerate(india_articles[:12]):
         title = (a.get('title') or '').strip()
         desc  = (a.get('description') or '').strip()
-        combined = title + ' ' + desc
-        cat = _categorize(combined)
         articles.append({
             'id':        str(idx + 1),
-            'category':  cat,
+            'category':  facets['category'],
             'headline':  title,
             'excerpt':   desc,
             'source':    (a.get('source') or {}).get('name', 'Unknown'),
             'date':      _fmt_date(a.get('publishedAt', '')),
-            'tags':      _extract_tags(title, desc),
-            'location':  _detect_location(combined, idx),
-            'urgent':    _is_urgent(combined),
+            'tags':      facets['tags'],
+            'location':  facets['location'] or default_location(idx),
+            'urgent':    facets['urgent'],
             'url':       a.get('url', ''),
             'imageUrl':  a.get('urlToImage') or '',
         })
 
-    # If we have fewer than 6 articles, try to fetch World health news to fill the space
+    # If we have fewer than 6 articles, try to fetch World health news to fill the space.
+    # Only then, so a normal refresh costs two NewsAPI calls of the free tier's quota, not three
     if len(articles) < 6 and api_key:
-        try:
-            r_world = http_requests.get(
-                'https://newsapi.org/v2/top-headlines',
-                params={'category': 'health', 'pageSize': 15, 'apiKey': api_key},
-                timeout=10,
-            )
-            if r_world.status_code == 200:
-                raw_world = r_world.json().get('articles', [])
-        except Exception as e:
-            print(f"[NewsAPI] world health news error: {e}")
-
         world_count = 0
+        raw_world, = _fetch_news_concurrently([
+            ('top-headlines', {'category': 'health', 'pageSize': 15, 'apiKey': api_key}),
+        ])
         for a in raw_world:
             title = (a.get('title') or '').strip()
             desc  = (a.get('description') or '').strip()
-            combined = title + ' ' + desc
             # Check if this article isn't already seen or duplicate
             if title and title not in seen:
                 seen.add(title)
-                cat = _categorize(combined)
+                facets = classify_article(title, desc)
                 articles.append({
                     'id':        f"w_{world_count + 1}",
-                    'category':  cat,
+                    'category':  facets['category'],
                     'headline':  title,
                     'excerpt':   desc,
                     'source':    (a.get('source') or {}).get('name', 'Unknown'),
                     'date':      _fmt_date(a.get('publishedAt', '')),
-                    'tags':      _extract_tags(title, desc),
-                    'location':  _detect_global_location(combined, world_count),
-                    'urgent':    _is_urgent(combined),
+                    'tags':      facets['tags'],
+                    'location':  facets['global_location'] or default_global_location(world_count),
+                    'urgent':    facets['urgent'],
                     'url':       a.get('url', ''),
                     'imageUrl':  a.get('urlToImage') or '',
                 })
@@ -565,23 +733,25 @@ def get_health_news():
                 if len(articles) >= 8:
                     break
 
-    # Prepend new successful fetches to historical articles to keep them remembered
-    if articles:
-        current_headlines = {a['headline'].lower() for a in articles}
-        filtered_historical = [h for h in _historical_articles if h['headline'].lower() not in current_headlines]
-        _historical_articles = (articles + filtered_historical)[:50]
+    # Archive new successful fetches so later refreshes and new instances remember them
+    if articles and _news_archive:
+        try:
+            _news_archive.add(articles)
+        except Exception as e:
+            print(f"[NewsArchive] write failed: {e}")
 
-    # If we still have fewer than 6 articles, fill from historical list
-    if len(articles) < 6 and _historical_articles:
-        existing_headlines = {a['headline'].lower() for a in articles}
-        for hist in _historical_articles:
-            if hist['headline'].lower() not in existing_headlines:
-                hist_copy = hist.copy()
-                hist_copy['id'] = str(len(articles) + 1)
-                articles.append(hist_copy)
-                if len(articles) >= 6:
-                    break
+    # If we still have fewer than 6 articles, fill from the archive
+    if len(articles) < 6 and _news_archive:
+        existing_keys = {headline_key(a['headline']) for a in articles}
+        try:
+            articles.extend(_news_archive.recent(6 - len(articles), exclude=existing_keys))
+        except Exception as e:
+            print(f"[NewsArchive] read failed: {e}")
 
+    return _news_payload(articles)
+
+def _news_payload(articles):
+    """Top up with curated articles if needed, number them and build the ticker."""
     # If still fewer than 6, fall back to our high-quality curated fallback list
     if len(articles) < 6:
         existing_headlines = {a['headline'].lower() for a in articles}
@@ -599,6 +769,7 @@ def get_health_news():
         art['id'] = str(idx + 1)
 
     ticker = [f"{n['category']}: {n['headline']}" for n in articles[:8]]
-    result = {'articles': articles, 'ticker': ticker}
-    _news_cache = {'data': result, 'ts': time.time()}
-    return jsonify(result)
+    return {'articles': articles, 'ticker': ticker}
+
+_warm_news_cache()
+_resume_analysis_jobs()
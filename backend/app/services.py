@@ -5,16 +5,48 @@ import os
 import json
 import time
 import base64
-from groq import Groq
+import asyncio
+import threading
+import pandas as pd
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from utils.cache_manager import CacheManager, content_hash
+from utils.llm_gateway import get_async_llm, get_llm
+from io import BytesIO
+from utils.image_prep import prepare_image_for_vlm
+from utils.pdf_pages import is_pdf, map_concurrently, split_pdf_pages
+from utils.drug_index import create_drug_index, normalise_drug_name
+from utils.medicine_lookup import create_medicine_lookup
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
 # --- Cache Configuration ---
+# Disease trends are precomputed once per version of the epidemiology store and
+# invalidated by its mtime/size + content hash rather than a wall-clock TTL.
+EPIDEMIOLOGY_STORE = os.path.join(os.path.dirname(__file__), '..', 'india_epidemiology_data.json')
 _TRENDS_CACHE = None
-_CACHE_TIMESTAMP = 0
-CACHE_DURATION = 3600  # 1 hour
+_TRENDS_PAYLOAD = {'signature': None, 'source_hash': None, 'body': None, 'etag': None}
+_TRENDS_LOCK = threading.Lock()
+
+# Analyzer results keyed by SHA-256 of the upload, one entry per core/stage.
+# Bump ANALYZER_CACHE_VERSION whenever a prompt or model changes so stale
+# results are not served.
+ANALYZER_CACHE_VERSION = 'v4'
+_ANALYZER_CACHE = CacheManager(
+    expiration_hours=float(os.getenv('ANALYZER_CACHE_TTL_HOURS', 24)),
+    max_entries=int(os.getenv('ANALYZER_CACHE_MAX_ENTRIES', 512)),
+    max_bytes=int(os.getenv('ANALYZER_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+)
+
+# Drug-name corrections learnt from the Feedback AI. Documents whose every
+# medication it already knows get a clinical-only audit (see `_index_corrections`).
+_DRUG_INDEX = create_drug_index()
+_VERIFICATION_SOURCES = {'model': 0, 'index': 0}
+
+# Local brand/generic dictionary. Its closest names for each raw medication are
+# handed to the Feedback AI as candidates to choose from (see `_dictionary_candidates`).
+_MEDICINE_LOOKUP = create_medicine_lookup()
 
 
 # --- Constants ---
@@ -41,140 +73,223 @@ def analyze_report_text(text):
             detected_medications.append(med_info)
     return {"diseases": detected_diseases, "medications": detected_medications}
 
-def get_trends_data():
-    """Authoritative Intelligence Source with Hardened Mapping."""
-    global _TRENDS_CACHE, _CACHE_TIMESTAMP
-    
-    # Check cache
-    if _TRENDS_CACHE and (time.time() - _CACHE_TIMESTAMP < CACHE_DURATION):
-        # Optional: Print cache hit debug if needed, but keeping it clean
-        return _TRENDS_CACHE
-
-    instance_id = int(time.time() % 1000)
-    print(f"--- [SURVEILLANCE PIPELINE v2.2] Instance {instance_id} Active at {time.strftime('%H:%M:%S')} ---")
-    EPIDEMIOLOGY_STORE = os.path.join(os.path.dirname(__file__), '..', 'india_epidemiology_data.json')
-    
-    if not os.path.exists(EPIDEMIOLOGY_STORE):
-        print(f"CRITICAL: Epidemiology store not found at {EPIDEMIOLOGY_STORE}")
+# --- Protocol Medicines (first matching disease-name keyword wins) ---
+_MEDICINE_RULES = [
+    (('tuberculosis', 'tb'), ['Rifampicin', 'Isoniazid', 'Pyrazinamide', 'Ethambutol']),
+    (('diabetes',), ['Metformin', 'Insulin', 'Sitagliptin']),
+    (('hypertension',), ['Telmisartan', 'Amlodipine', 'Losartan']),
+    (('respiratory', 'ari'), ['Amoxicillin', 'Azithromycin', 'Paracetamol']),
+    (('diarrheal', 'add'), ['ORS', 'Zinc', 'Loperamide']),
+    (('fever',), ['Paracetamol', 'Fluids', 'Supportive Care']),
+    (('cardiac', 'ischemic'), ['Aspirin', 'Atorvastatin', 'Clopidogrel']),
+    (('renal', 'kidney'), ['Furosemide', 'Erythropoietin', 'Calcium Supplements']),
+    (('mental', 'anxiety'), ['Sertraline', 'Escitalopram', 'CBT']),
+]
+_DEFAULT_MEDICINES = ['Supportive Care', 'Fluids']
+
+# Synthetic history multipliers relative to the current value (current year = 1.0)
+_HISTORY_FACTORS = {2021: 0.9, 2022: 0.95, 2023: 1.05, 2024: 0.98}
+_HISTORY_CURRENT_YEAR = 2025
+
+def _first_truthy(frame, columns, default):
+    """Column-wise `d.get(a) or d.get(b) or d.get(c, default)` over an object DataFrame built from dicts."""
+    last = columns[-1]
+    result = pd.Series([default] * len(frame), index=frame.index, dtype=object)
+    if last in frame:
+        # Keys a dict lacked are NaN in the frame; an explicit null stays None and is kept, as .get would
+        values = frame[last]
+        result = values.where(values.map(lambda v: not (isinstance(v, float) and v != v)), result)
+    for column in reversed(columns[:-1]):
+        if column in frame:
+            values = frame[column]
+            result = values.where(values.notna() & values.astype(bool), result)
+    return result
+
+def _parse_case_counts(raw_values):
+    """Vectorised metric parsing: 45600 -> 45600.0, '11.4%' -> 11.4, '45,600' -> 45600.0, unparsable -> NaN."""
+    cleaned = (
+        raw_values.astype(str)
+        .str.replace('%', '', regex=False)
+        .str.replace(',', '', regex=False)
+        .str.strip()
+        .str.split(' ')
+        .str[0]
+    )
+    return pd.to_numeric(cleaned, errors='coerce').astype(float)
+
+def _map_medicines(names):
+    """Vectorised keyword -> medicines lookup following `_MEDICINE_RULES` order."""
+    lowered = names.str.lower().str.strip()
+    rule_index = pd.Series(len(_MEDICINE_RULES), index=names.index)
+    for i in reversed(range(len(_MEDICINE_RULES))):
+        keywords = _MEDICINE_RULES[i][0]
+        hit = lowered.str.contains('|'.join(re.escape(k) for k in keywords), regex=True)
+        rule_index = rule_index.mask(hit, i)
+    return [_MEDICINE_RULES[i][1] if i < len(_MEDICINE_RULES) else _DEFAULT_MEDICINES for i in rule_index]
+
+def build_trends_table(intel_data):
+    """Build the /api/disease-trends rows from the epidemiology store with columnar operations."""
+    raw_diseases = intel_data.get('diseases', [])
+    if not raw_diseases:
         return []
 
-    try:
-        with open(EPIDEMIOLOGY_STORE, 'r') as f:
-            intel_data = json.load(f)
-        
-        raw_diseases = intel_data.get('diseases', [])
-        result = []
-
-        for disease in raw_diseases:
-            metrics = disease.get('metrics', {})
-            d_name = str(disease.get('name', ''))
-            segment = disease.get('segment', 'Uncategorized')
-            
-            # 1. Metric Extraction (Robusted for % and strings)
-            raw_val = metrics.get('weekly_reported_cases') or metrics.get('weekly_notified_cases') or metrics.get('prevalence', 0)
-            try:
-                if isinstance(raw_val, str):
-                    numeric_val = float(raw_val.replace('%', '').replace(',', '').strip().split(' ')[0])
-                else:
-                    numeric_val = float(raw_val)
-            except:
-                numeric_val = 0
-
-            # 2. Hardened Medicine Mapping (Explicit match for Section D)
-            d_lower = d_name.lower().strip()
-            if 'tuberculosis' in d_lower or 'tb' in d_lower:
-                meds = ['Rifampicin', 'Isoniazid', 'Pyrazinamide', 'Ethambutol']
-            elif 'diabetes' in d_lower:
-                meds = ['Metformin', 'Insulin', 'Sitagliptin']
-            elif 'hypertension' in d_lower:
-                meds = ['Telmisartan', 'Amlodipine', 'Losartan']
-            elif 'respiratory' in d_lower or 'ari' in d_lower:
-                meds = ['Amoxicillin', 'Azithromycin', 'Paracetamol']
-            elif 'diarrheal' in d_lower or 'add' in d_lower:
-                meds = ['ORS', 'Zinc', 'Loperamide']
-            elif 'fever' in d_lower:
-                meds = ['Paracetamol', 'Fluids', 'Supportive Care']
-            elif 'cardiac' in d_lower or 'ischemic' in d_lower:
-                meds = ['Aspirin', 'Atorvastatin', 'Clopidogrel']
-            elif 'renal' in d_lower or 'kidney' in d_lower:
-                meds = ['Furosemide', 'Erythropoietin', 'Calcium Supplements']
-            elif 'mental' in d_lower or 'anxiety' in d_lower:
-                meds = ['Sertraline', 'Escitalopram', 'CBT']
-            else:
-                meds = ['Supportive Care', 'Fluids']
-
-            # 3. Demographic Extraction (Forcing defaults if missing or non-specific)
-            age_data = disease.get('age_demographics', {})
-            if not age_data or 'all' in age_data or len(age_data) == 0:
-                age_data = DEFAULT_AGE_GROUPS
-            
-            item = {
-                'id': disease.get('id'),
-                'disease': d_name,
-                'segment': segment,
-                'outbreaks': raw_val,
-                'annual_count': metrics.get('annual_confirmed_cases', 0),
-                'burden_estimate': metrics.get('estimated_national_burden', ''),
-                'risk_level': disease.get('risk_level', 'Unknown'),
-                'severity': disease.get('severity', 'Moderate'),
-                'seasonality': disease.get('seasonality', 'Year-round'),
-                'confidence': metrics.get('confidence', 'Medium'),
-                'timeframe': metrics.get('timeframe', 'Monthly Estimate'),
-                'description': disease.get('about', ''),
-                'trends_context': disease.get('trends', ''),
-                'recovery_rate': disease.get('recovery_metrics', {}).get('rate', '95%'),
-                'avg_recovery': disease.get('recovery_metrics', {}).get('avg_time', '7 days'),
-                'age_groups': [{'name': k, 'value': v} for k, v in age_data.items()],
-                'gender_split': [{'name': 'Male', 'value': 52}, {'name': 'Female', 'value': 48}],
-                'source': 'Public Health Intelligence (CureBird Store)',
-                'source_label': 'IDSP + MoHFW Surveillance Metrics',
-                'sources': disease.get('sources', []),
-                'top_medicines': meds,
-                'med_source': 'Clinical Protocols & Intelligence. Disclaimer: Always consult a healthcare professional before starting any medication or treatment.',
-                'v2_fingerprint': 'AUTH_PIPELINE_22'
-            }
-
-            # 4. History Generation
-            item['history'] = [
-                {'year': 2021, 'count': round(numeric_val * 0.9, 1)},
-                {'year': 2022, 'count': round(numeric_val * 0.95, 1)},
-                {'year': 2023, 'count': round(numeric_val * 1.05, 1)},
-                {'year': 2024, 'count': round(numeric_val * 0.98, 1)},
-                {'year': 2025, 'count': numeric_val}
-            ]
-            
-            result.append(item)
-        
-        # Update cache (Outside Loop)
-        _TRENDS_CACHE = result
-        _CACHE_TIMESTAMP = time.time()
-        print(f"--- Cache Updated with {len(result)} items at {time.strftime('%H:%M:%S')} ---")
+    diseases = pd.DataFrame(raw_diseases, dtype=object)
+    metrics = pd.DataFrame([d.get('metrics', {}) for d in raw_diseases], dtype=object)
+
+    # 1. Metric Extraction (Robusted for % and strings)
+    raw_values = _first_truthy(metrics, ['weekly_reported_cases', 'weekly_notified_cases', 'prevalence'], 0)
+    parsed = _parse_case_counts(raw_values)
+    numeric_values = parsed.fillna(0.0)
+
+    # 2. Hardened Medicine Mapping
+    names = diseases['name'].fillna('').astype(str) if 'name' in diseases else pd.Series([''] * len(diseases), dtype=object)
+    medicines = _map_medicines(names)
+
+    # 4. History Generation
+    # Python's round() (not Series.round) so values match the previous output exactly, e.g. 28.5 * 0.9 -> 25.7
+    history_columns = {year: (numeric_values * factor).map(lambda v: round(v, 1)).tolist() for year, factor in _HISTORY_FACTORS.items()}
+    # Unparsable metrics were the int 0, which JSON renders as 0 rather than 0.0
+    history_columns[_HISTORY_CURRENT_YEAR] = [value if ok else 0 for value, ok in zip(numeric_values.tolist(), parsed.notna())]
+
+    def metric(column, default):
+        return metrics[column].where(metrics[column].notna(), default).tolist() if column in metrics else [default] * len(metrics)
+
+    annual_counts = metric('annual_confirmed_cases', 0)
+    burden_estimates = metric('estimated_national_burden', '')
+    confidences = metric('confidence', 'Medium')
+    timeframes = metric('timeframe', 'Monthly Estimate')
+
+    result = []
+    for row, disease in enumerate(raw_diseases):
+        # 3. Demographic Extraction (Forcing defaults if missing or non-specific)
+        age_data = disease.get('age_demographics', {})
+        if not age_data or 'all' in age_data:
+            age_data = DEFAULT_AGE_GROUPS
+        recovery = disease.get('recovery_metrics', {})
+
+        result.append({
+            'id': disease.get('id'),
+            'disease': names.iat[row],
+            'segment': disease.get('segment', 'Uncategorized'),
+            'outbreaks': raw_values.iat[row],
+            'annual_count': annual_counts[row],
+            'burden_estimate': burden_estimates[row],
+            'risk_level': disease.get('risk_level', 'Unknown'),
+            'severity': disease.get('severity', 'Moderate'),
+            'seasonality': disease.get('seasonality', 'Year-round'),
+            'confidence': confidences[row],
+            'timeframe': timeframes[row],
+            'description': disease.get('about', ''),
+            'trends_context': disease.get('trends', ''),
+            'recovery_rate': recovery.get('rate', '95%'),
+            'avg_recovery': recovery.get('avg_time', '7 days'),
+            'age_groups': [{'name': k, 'value': v} for k, v in age_data.items()],
+            'gender_split': [{'name': 'Male', 'value': 52}, {'name': 'Female', 'value': 48}],
+            'source': 'Public Health Intelligence (CureBird Store)',
+            'source_label': 'IDSP + MoHFW Surveillance Metrics',
+            'sources': disease.get('sources', []),
+            'top_medicines': medicines[row],
+            'med_source': 'Clinical Protocols & Intelligence. Disclaimer: Always consult a healthcare professional before starting any medication or treatment.',
+            'v2_fingerprint': 'AUTH_PIPELINE_22',
+            'history': [{'year': year, 'count': history_columns[year][row]} for year in sorted(history_columns)],
+        })
+    return result
+
+def _refresh_trends_payload():
+    """Rebuild the precomputed table if the epidemiology store changed. Caller holds _TRENDS_LOCK."""
+    global _TRENDS_CACHE
+
+    stat = os.stat(EPIDEMIOLOGY_STORE)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if signature == _TRENDS_PAYLOAD['signature']:
+        return
+
+    with open(EPIDEMIOLOGY_STORE, 'rb') as f:
+        raw = f.read()
+    source_hash = content_hash(raw)
+    if source_hash == _TRENDS_PAYLOAD['source_hash']:
+        # Touched but unchanged
+        _TRENDS_PAYLOAD['signature'] = signature
+        return
+
+    print(f"--- [SURVEILLANCE PIPELINE v2.2] Rebuilding trends table at {time.strftime('%H:%M:%S')} ---")
+    result = build_trends_table(json.loads(raw))
+    body = json.dumps(result).encode('utf-8')
+
+    _TRENDS_CACHE = result
+    _TRENDS_PAYLOAD.update({
+        'signature': signature,
+        'source_hash': source_hash,
+        'body': body,
+        'etag': content_hash(body),
+    })
+    print(f"--- Cache Updated with {len(result)} items at {time.strftime('%H:%M:%S')} ---")
+
+def get_trends_payload():
+    """
+    Return (json_bytes, etag) for /api/disease-trends.
+    Steady state is an os.stat plus a memory read; the table is only rebuilt when the store changes.
+    """
+    if not os.path.exists(EPIDEMIOLOGY_STORE):
+        print(f"CRITICAL: Epidemiology store not found at {EPIDEMIOLOGY_STORE}")
+        return b"[]", content_hash(b"[]")
 
-        return result
+    with _TRENDS_LOCK:
+        try:
+            _refresh_trends_payload()
+        except Exception as e:
+            print(f"ERROR: Mapping failed: {e}")
+            if _TRENDS_PAYLOAD['body'] is None:
+                return b"[]", content_hash(b"[]")
+        return _TRENDS_PAYLOAD['body'], _TRENDS_PAYLOAD['etag']
 
-    except Exception as e:
-        print(f"ERROR: Mapping failed: {e}")
-        return []
+def get_trends_data():
+    """Authoritative Intelligence Source with Hardened Mapping."""
+    get_trends_payload()
+    return _TRENDS_CACHE or []
 
 # --- OCR Configuration ---
 TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 if os.path.exists(TESSERACT_PATH):
     pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
 
-def perform_ocr(file_stream):
+def perform_ocr(file_stream, with_confidence=False, timeout=0):
+    """
+    Tesseract OCR of an image stream. With `with_confidence=True` returns
+    (text, mean word confidence 0-100, word count) from a single Tesseract run.
+    A run longer than `timeout` seconds (0: no limit) is killed and counts as a failure.
+    """
     try:
         image = Image.open(file_stream)
         # Ensure image is in RGB for best OCR results
         if image.mode != 'RGB':
             image = image.convert('RGB')
         
-        extracted_text = pytesseract.image_to_string(image)
+        if with_confidence:
+            return _ocr_with_confidence(image, timeout)
+
+        extracted_text = pytesseract.image_to_string(image, timeout=timeout)
         if not extracted_text.strip():
             print("OCR WARNING: No text extracted from image.")
         return extracted_text
     except Exception as e:
         print(f"OCR ERROR: Failed to perform extraction: {e}")
-        return ""
+        return ("", 0.0, 0) if with_confidence else ""
+
+def _ocr_with_confidence(image, timeout=0):
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, timeout=timeout)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if not word.strip() or conf < 0:
+            continue
+        confidences.append(conf)
+        line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(line, []).append(word)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence, len(confidences)
 
 def analyze_clinical_groq(file_stream):
     """
@@ -186,7 +301,7 @@ def analyze_clinical_groq(file_stream):
         if not api_key:
             raise ValueError("Groq API key missing")
             
-        client = Groq(api_key=api_key)
+        client = get_llm({'groq': api_key})
         
         # Encode image
         file_stream.seek(0)
@@ -252,32 +367,8 @@ def analyze_clinical_groq(file_stream):
             "medication_adjustments": []
         }
 
-def analyze_with_vlm(file_stream, custom_api_key=None):
-    """
-    Directly analyze medical report images using Groq VLM.
-    """
-    try:
-        # 1. Setup Groq Client
-        api_key = custom_api_key or os.getenv('GROQ_API_KEY_VISION') or os.getenv('GROQ_API_KEY')
-        if not api_key:
-            raise ValueError("Groq API key not found in environment variables.")
-        
-        client = Groq(api_key=api_key)
-        
-        # 2. Encode image to Base64
-        file_stream.seek(0)
-        base64_image = base64.b64encode(file_stream.read()).decode('utf-8')
-        
-        # 3. Call Groq VLM
-        completion = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": """You are a Senior Chief Medical Officer and Document Digitization Expert. Analyze this medical image with extreme attention to detail and high precision.
+# Core 1 extraction schema, shared by the vision path and the PDF text-layer path
+_EXTRACTION_PROMPT = """You are a Senior Chief Medical Officer and Document Digitization Expert. Analyze this medical image with extreme attention to detail and high precision.
                             Determine if it is a "prescription" or a "lab_report".
                             
                             Extract the following data into strict JSON format:
@@ -303,260 +394,820 @@ def analyze_with_vlm(file_stream, custom_api_key=None):
                             4. If it is likely NOT a medical image, set is_medical: false.
                             5. If date is not found, use null.
                             6. Return ONLY valid JSON."""
+
+def _normalise_extraction(structured_data):
+    return {
+        "is_medical": structured_data.get("is_medical", True),
+        "patient_name": structured_data.get("patient_name", ""),
+        "doctor_name": structured_data.get("doctor_name", ""),
+        "hospital_name": structured_data.get("hospital_name", "") or structured_data.get("clinic_name", ""),
+        "date": structured_data.get("date", ""),
+        "medications": structured_data.get("medications", []),
+        "diseases": structured_data.get("diseases", []) or structured_data.get("conditions", []),
+        "digital_copy": structured_data.get("digital_copy", ""),
+        "document_type": structured_data.get("document_type", "prescription"),
+        "test_results": structured_data.get("test_results", [])
+    }
+
+_FAILED_EXTRACTION = {"is_medical": False, "medications": [], "diseases": [], "digital_copy": "", "test_results": []}
+
+def _failed_extraction(error):
+    return dict(_FAILED_EXTRACTION, error=str(error))
+
+def _vision_api_key(custom_api_key=None):
+    api_key = custom_api_key or os.getenv('GROQ_API_KEY_VISION') or os.getenv('GROQ_API_KEY')
+    if not api_key:
+        raise ValueError("Groq API key not found in environment variables.")
+    return api_key
+
+def _vlm_request(data, prepared=None):
+    """
+    Chat completion arguments for a Core 1 vision call on raw image bytes, plus
+    the base64 payload size and preprocessing stats for logging. `prepared` is
+    the `prepare_image_for_vlm` result when the caller already has it.
+    """
+    # Downscale/re-encode, then Base64 (raw phone photos are several MB)
+    image_bytes, mime_type, prep = prepared or prepare_image_for_vlm(data)
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    request = {
+        "model": "meta-llama/llama-4-scout-17b-16e-instruct",
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text", 
+                        "text": _EXTRACTION_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{base64_image}",
                         },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            temperature=0.1,
-            max_tokens=4096,
-            response_format={"type": "json_object"}
-        )
+                    },
+                ],
+            }
+        ],
+        "temperature": 0.1,
+        "max_tokens": 4096,
+        "response_format": {"type": "json_object"},
+    }
+    return request, len(base64_image), prep
+
+def _log_vlm_call(payload_size, prep, started):
+    print(
+        f"[VLM] {payload_size / 1024:.0f} KB payload (original {prep['original_bytes'] / 1024:.0f} KB),"
+        f" call took {time.time() - started:.2f}s"
+    )
+
+def analyze_with_vlm(file_stream, custom_api_key=None, call_slots=None, prepared=None):
+    """
+    Directly analyze medical report images using Groq VLM.
+    `call_slots`, a semaphore, is held for the model call (see `analyze_batch`);
+    `prepared` skips preprocessing the image again (see `_vlm_request`).
+    """
+    try:
+        # 1. Setup Groq Client
+        client = get_llm({'groq': _vision_api_key(custom_api_key)})
+        
+        # 2. Build the (downscaled) image request
+        file_stream.seek(0)
+        request, payload_size, prep = _vlm_request(file_stream.read(), prepared)
+        
+        # 3. Call Groq VLM
+        vlm_start = time.time()
+        with call_slots or nullcontext():
+            completion = client.chat.completions.create(**request)
+        _log_vlm_call(payload_size, prep, vlm_start)
         
         raw_response = completion.choices[0].message.content
         structured_data = json.loads(raw_response)
         
-        return {
-            "is_medical": structured_data.get("is_medical", True),
-            "patient_name": structured_data.get("patient_name", ""),
-            "doctor_name": structured_data.get("doctor_name", ""),
-            "hospital_name": structured_data.get("hospital_name", "") or structured_data.get("clinic_name", ""),
-            "date": structured_data.get("date", ""),
-            "medications": structured_data.get("medications", []),
-            "diseases": structured_data.get("diseases", []) or structured_data.get("conditions", []),
-            "digital_copy": structured_data.get("digital_copy", ""),
-            "document_type": structured_data.get("document_type", "prescription"),
-            "test_results": structured_data.get("test_results", [])
-        }
+        return _normalise_extraction(structured_data)
     except Exception as e:
         print(f"VLM ERROR (CRITICAL): {e}")
         # Return empty dict so logs show failure but app doesn't crash
-        return {"is_medical": False, "medications": [], "diseases": [], "digital_copy": "", "test_results": []}
+        return _failed_extraction(e)
 
-def verify_and_correct_medical_data(extracted_data):
+async def analyze_with_vlm_async(data, custom_api_key=None, prepared=None):
+    """`analyze_with_vlm` on raw bytes for the ASGI app; image preprocessing runs in a worker thread."""
+    try:
+        client = get_async_llm({'groq': _vision_api_key(custom_api_key)})
+        request, payload_size, prep = await asyncio.to_thread(_vlm_request, data, prepared)
+
+        vlm_start = time.time()
+        completion = await client.chat.completions.create(**request)
+        _log_vlm_call(payload_size, prep, vlm_start)
+
+        return _normalise_extraction(json.loads(completion.choices[0].message.content))
+    except Exception as e:
+        print(f"VLM ERROR (CRITICAL): {e}")
+        return _failed_extraction(e)
+
+# Model that structures text we already have (PDF text layers) into the Core 1 schema
+TEXT_STRUCTURING_MODEL = os.getenv('TEXT_STRUCTURING_MODEL', 'llama-3.1-8b-instant')
+
+def _structuring_request(text):
+    return {
+        "model": TEXT_STRUCTURING_MODEL,
+        "messages": [
+            {"role": "system", "content": _EXTRACTION_PROMPT},
+            {"role": "user", "content": f"The document's text (the 'image' above refers to this):\n\n{text[:20000]}"},
+        ],
+        "temperature": 0.1,
+        "max_tokens": 4096,
+        "response_format": {"type": "json_object"},
+    }
+
+def _text_api_key(custom_api_key=None):
+    api_key = custom_api_key or os.getenv('GROQ_API_KEY')
+    if not api_key:
+        raise ValueError("Groq API key not found in environment variables.")
+    return api_key
+
+def structure_medical_text(text, custom_api_key=None, call_slots=None):
     """
-    CORE 2: FEEDBACK AI (Llama 3.3 70B Versatile)
-    
-    This layer acts as a 'Senior Medical Auditor'.
-    It takes the raw extraction and uses deep medical knowledge to correct OCR errors.
+    Core 1 for documents whose text is already available: same JSON schema as
+    `analyze_with_vlm`, produced by a text-only model instead of a vision call.
     """
     try:
-        api_key = os.getenv('GROQ_API_KEY')
-        if not api_key:
-            return extracted_data 
+        client = get_llm({'groq': _text_api_key(custom_api_key)})
+        with call_slots or nullcontext():
+            completion = client.chat.completions.create(**_structuring_request(text))
+        return _normalise_extraction(json.loads(completion.choices[0].message.content))
+    except Exception as e:
+        print(f"TEXT STRUCTURING ERROR: {e}")
+        return _failed_extraction(e)
 
-        client = Groq(api_key=api_key)
-        
-        # 1. Construct the context for the AI
-        diseases_context = ", ".join(extracted_data.get('diseases', []))
-        if not diseases_context:
-            diseases_context = "Not specifically detected, infer from medications if possible."
-            
-        medications_json = json.dumps(extracted_data.get('medications', []))
-        
-        system_prompt = """
-        You are CureBird’s Clinical Feedback & Validation AI.
-
-        Your job is to receive OCR-extracted medical text from prescriptions and convert it into a medically correct, verified, and structured form.
-
-        You MUST act like a combination of:
-        • A physician (disease & symptom reasoning)
-        • A pharmacist (drug names, salts, alternatives)
-        • A medical data validator (guideline-based logic)
-
-        You must NEVER hallucinate or invent drugs or diseases.
-        If something is unclear, mark it as "uncertain" instead of guessing.
-
-        ------------------------------------
-        YOUR TASKS
-        ------------------------------------
-
-        You will receive OCR-extracted text which may contain:
-        • Misspelled disease names
-        • Wrong or garbled drug names
-        • Incomplete information
-        • Formatting errors
-
-        You must:
-
-        1) Identify all diseases and symptoms
-        2) Correct disease names using standard medical terminology (ICD / SNOMED style)
-        3) Identify all medicines
-        4) Correct medicine names. **CRITICAL: If the input appears to be a Brand Name (e.g. 'Lonazep', 'Stamol'), the 'corrected' output MUST remain that Brand Name (spelling fixed). Do NOT replace a Brand Name with its Generic Name.**
-        5) Validate whether each medicine is medically appropriate for the disease
-        6) If not appropriate, flag it
-        7) For each medicine, provide therapeutically equivalent alternatives (same salt or same drug class)
-        8) Estimate confidence for each correction
-        9) Produce structured JSON output only
-
-        You must reason using globally accepted medical practice guidelines (WHO, ICMR, NICE, FDA-style logic).
-
-        ------------------------------------
-        ------------------------------------
-        ------------------------------------
-        CORRECTION RULES
-        ------------------------------------
-
-        • **Brand Name Priority**: If OCR says "cenzep", and you identify it as "Lonazep", output "Lonazep". Do NOT output "Clonazepam" as the main name.
-        • If a medicine name does not exist, use fuzzy matching + disease context to find the closest real medicine.
-        
-        **UNIVERSAL PHONETIC RECONSTRUCTION ENGINE (Applies to ALL drugs):**
-        1. **Principle**: OCR usually captures the "shape" or "sound" of the word but messes up specific letters.
-        2. **Action**: For EVERY unrecognized input string:
-           a. "Sound it out" phonetically.
-           b. Look at the **Identified Diseases**.
-           c. Search your internal database of **Indian & Global Brand Names** for a match that:
-              - Sounds/looks similar to the input.
-              - Is a standard treatment for the identified disease.
-        3. **Example Logic (Mental Model)**: 
-           - Input "Stamol" + Disease "Hypertension" -> Match found: "Stamlo" (Amlodipine).
-           - Input "Zylor" + Disease "Gout" -> Match found: "Zyloric".
-           - Input "Trazodic" + Disease "Anxiety" -> Match found: "Trazodone" or Brand "Trazonil".
-
-        **ALTERNATIVES GENERATION RULES:**
-        1. **Real-World Brands**: When suggesting alternatives, do NOT just list Generics. Suggest **Market-Leading Brand Names** available in pharmacies (e.g. for 'Stamlo', suggest 'Amlokind', 'Amlopres').
-        2. **Exact Match**: Ensure the alternative has the EXACT same active salt and mechanism.
-        3. **Availability**: Prioritize brands that are widely distributed in the Indian/Global market.
-        
-        • If a disease name does not exist, use symptom context to infer the correct medical term.
-        • If multiple possibilities exist, list them and mark confidence accordingly.
-        • Never invent new drugs or diseases.
+async def structure_medical_text_async(text, custom_api_key=None):
+    """`structure_medical_text` for the ASGI app."""
+    try:
+        client = get_async_llm({'groq': _text_api_key(custom_api_key)})
+        completion = await client.chat.completions.create(**_structuring_request(text))
+        return _normalise_extraction(json.loads(completion.choices[0].message.content))
+    except Exception as e:
+        print(f"TEXT STRUCTURING ERROR: {e}")
+        return _failed_extraction(e)
+
+def _unique(items, key):
+    seen = set()
+    unique = []
+    for item in items:
+        marker = key(item)
+        if marker not in seen:
+            seen.add(marker)
+            unique.append(item)
+    return unique
+
+def _merge_extractions(parts):
+    """Combine per-page Core 1 results (in page order) into one document-level result."""
+    ok = [part for part in parts if not part.get('error')]
+    if not ok:
+        return parts[0] if parts else _failed_extraction("No pages could be analysed")
+
+    medical = [part for part in ok if part.get('is_medical', True)] or ok
+
+    def first(field):
+        return next((part[field] for part in medical if part.get(field)), "")
+
+    merged = {
+        "is_medical": any(part.get('is_medical', True) for part in ok),
+        "patient_name": first('patient_name'),
+        "doctor_name": first('doctor_name'),
+        "hospital_name": first('hospital_name'),
+        "date": first('date'),
+        "medications": _unique(
+            [m for part in medical for m in part.get('medications', [])],
+            lambda m: str(m.get('name', m) if isinstance(m, dict) else m).strip().lower(),
+        ),
+        "diseases": _unique([d for part in medical for d in part.get('diseases', [])], lambda d: str(d).strip().lower()),
+        "digital_copy": "\n\n---\n\n".join(part['digital_copy'] for part in medical if part.get('digital_copy')),
+        "document_type": first('document_type') or "prescription",
+        "test_results": _unique(
+            [t for part in medical for t in part.get('test_results', [])],
+            lambda t: json.dumps(t, sort_keys=True) if isinstance(t, dict) else str(t),
+        ),
+    }
+    if len(ok) < len(parts):
+        merged["page_errors"] = [part['error'] for part in parts if part.get('error')]
+    return merged
+
+def _pdf_text(text_pages):
+    return "\n\n".join(f"--- Page {page['page']} ---\n{page['text']}" for page in text_pages)
+
+def _merge_pdf_parts(pages, text_pages, image_pages, parts):
+    merged = _merge_extractions(parts)
+    merged["pages"] = {
+        "total": len(pages),
+        "text_layer": [page['page'] for page in text_pages],
+        "vision": [page['page'] for page in image_pages],
+    }
+    return merged
+
+def analyze_pdf(data, custom_api_key=None, call_slots=None):
+    """
+    Core 1 for PDFs. Pages with a text layer are structured together by the text
+    model; only pages without one are rasterised and sent to the VLM, one call per
+    page, all running concurrently. The results are merged in page order.
+    """
+    pages = split_pdf_pages(data)
+    text_pages = [page for page in pages if page['text']]
+    image_pages = [page for page in pages if page['image']]
+    print(f"[PDF] {len(pages)} pages: {len(text_pages)} from text layer, {len(image_pages)} via VLM")
+
+    jobs = []
+    if text_pages:
+        text = _pdf_text(text_pages)
+        jobs.append((text_pages[0]['page'], lambda: structure_medical_text(text, custom_api_key, call_slots)))
+    for page in image_pages:
+        jobs.append((page['page'], lambda image=page['image']: analyze_with_vlm(BytesIO(image), custom_api_key, call_slots)))
+    jobs.sort(key=lambda job: job[0])
+
+    parts = map_concurrently(lambda job: job[1](), jobs)
+    return _merge_pdf_parts(pages, text_pages, image_pages, parts)
+
+async def analyze_pdf_async(data, custom_api_key=None):
+    """`analyze_pdf` for the ASGI app: pages are split in a worker thread, model calls are gathered."""
+    pages = await asyncio.to_thread(split_pdf_pages, data)
+    text_pages = [page for page in pages if page['text']]
+    image_pages = [page for page in pages if page['image']]
+    print(f"[PDF] {len(pages)} pages: {len(text_pages)} from text layer, {len(image_pages)} via VLM")
+
+    jobs = []
+    if text_pages:
+        jobs.append((text_pages[0]['page'], structure_medical_text_async(_pdf_text(text_pages), custom_api_key)))
+    for page in image_pages:
+        jobs.append((page['page'], analyze_with_vlm_async(page['image'], custom_api_key)))
+    jobs.sort(key=lambda job: job[0])
+
+    parts = await asyncio.gather(*(job[1] for job in jobs))
+    return _merge_pdf_parts(pages, text_pages, image_pages, list(parts))
+
+# Triage: scans whose Tesseract output is confident enough skip the vision model
+ANALYZER_OCR_FAST_PATH = os.getenv('ANALYZER_OCR_FAST_PATH', '1') != '0'
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', 85))
+OCR_MIN_WORDS = int(os.getenv('OCR_MIN_WORDS', 30))
+# Uploads larger than this (camera photos) rarely pass the OCR bar, so go straight to the VLM
+OCR_MAX_INPUT_BYTES = int(os.getenv('OCR_MAX_INPUT_BYTES', 3 * 1024 * 1024))
+# Seconds a triage OCR run may take before the upload goes to the VLM anyway
+OCR_TRIAGE_TIMEOUT = float(os.getenv('OCR_TRIAGE_TIMEOUT', 4))
+
+# Per-path counts and Core 1 latency, to measure what the fast paths save
+_EXTRACTION_PATH_STATS = {}
+_EXTRACTION_PATH_LOCK = threading.Lock()
+
+def _record_extraction_path(path, seconds):
+    with _EXTRACTION_PATH_LOCK:
+        stats = _EXTRACTION_PATH_STATS.setdefault(path, {'documents': 0, 'total_seconds': 0.0})
+        stats['documents'] += 1
+        stats['total_seconds'] += seconds
+
+def get_analyzer_metrics():
+    """Extraction path counts/latencies, Core 2 sources (model vs drug index) and cache stats, for /api/analyzer/metrics."""
+    with _EXTRACTION_PATH_LOCK:
+        paths = {
+            path: {
+                'documents': stats['documents'],
+                'avg_seconds': round(stats['total_seconds'] / stats['documents'], 3),
+            }
+            for path, stats in _EXTRACTION_PATH_STATS.items()
+        }
+        verification = dict(_VERIFICATION_SOURCES)
+    metrics = {'extraction_paths': paths, 'verification_sources': verification, 'cache': _ANALYZER_CACHE.stats()}
+    if _DRUG_INDEX:
+        metrics['drug_index'] = _DRUG_INDEX.stats()
+    if _MEDICINE_LOOKUP:
+        metrics['medicine_lookup'] = _MEDICINE_LOOKUP.stats()
+    return metrics
+
+def _confident_ocr_text(prepared):
+    """
+    Tesseract text of a `prepare_image_for_vlm` result if it is confident and
+    long enough to skip the VLM, else None. Only flat scans and screenshots are
+    tried: not camera photos (by EXIF, or by look when a messenger stripped it),
+    nor very large uploads. OCR almost never clears the bar on those, and the
+    attempt would only delay the VLM, as would a run past OCR_TRIAGE_TIMEOUT.
+    """
+    if not ANALYZER_OCR_FAST_PATH:
+        return None
+    # OCR the downscaled copy: plenty for printed text and much faster than the original
+    image_bytes, _, prep = prepared
+    if prep.get('camera_photo') or not prep.get('scan_like', True) or prep['original_bytes'] > OCR_MAX_INPUT_BYTES:
+        print("[TRIAGE] photo or large upload, skipping OCR")
+        return None
+    text, confidence, words = perform_ocr(BytesIO(image_bytes), with_confidence=True, timeout=OCR_TRIAGE_TIMEOUT)
+    print(f"[TRIAGE] OCR confidence {confidence:.1f} over {words} words")
+    if confidence >= OCR_MIN_CONFIDENCE and words >= OCR_MIN_WORDS:
+        return text
+    return None
+
+def _pdf_extraction_path(result):
+    pages = result['pages']
+    return 'vision' if not pages['text_layer'] else ('mixed' if pages['vision'] else 'text_layer')
+
+def _finish_extraction(result, path, started):
+    elapsed = time.time() - started
+    result['extraction_path'] = path
+    if not result.get('error'):
+        _record_extraction_path(path, elapsed)
+    print(f"[TRIAGE] Core 1 via {path} in {elapsed:.2f}s")
+    return result
+
+def analyze_document(file_stream, custom_api_key=None, call_slots=None):
+    """
+    Core 1 for any upload, routed to the cheapest path that can read it:
+      - "text_layer": a PDF whose pages all have a text layer (text model only)
+      - "mixed" / "vision": a PDF with some / only scanned pages (see `analyze_pdf`)
+      - "ocr": an image Tesseract reads with high confidence (text model only)
+      - "vision": everything else goes to the VLM
+    The chosen path is stored in the result's "extraction_path". Every model
+    call holds one of `call_slots` (a semaphore) when given.
+    """
+    started = time.time()
+    file_stream.seek(0)
+    data = file_stream.read()
+    file_stream.seek(0)
+
+    if is_pdf(data):
+        try:
+            result = analyze_pdf(data, custom_api_key, call_slots)
+            path = _pdf_extraction_path(result)
+        except Exception as e:
+            print(f"PDF ANALYSIS ERROR: {e}")
+            return _failed_extraction(e)
+    else:
+        result, path = None, 'vision'
+        # Prepared once, for the OCR attempt and (if it falls short) the VLM call
+        prepared = prepare_image_for_vlm(data)
+        ocr_text = _confident_ocr_text(prepared)
+        if ocr_text:
+            result = structure_medical_text(ocr_text, custom_api_key, call_slots)
+            path = 'ocr'
+            if result.get('error'):
+                result, path = None, 'vision'
+        if result is None:
+            result = analyze_with_vlm(file_stream, custom_api_key, call_slots, prepared)
+
+    return _finish_extraction(result, path, started)
+
+async def analyze_document_async(data, custom_api_key=None):
+    """`analyze_document` on raw bytes for the ASGI app; OCR and PDF splitting run in worker threads."""
+    started = time.time()
+
+    if is_pdf(data):
+        try:
+            result = await analyze_pdf_async(data, custom_api_key)
+            path = _pdf_extraction_path(result)
+        except Exception as e:
+            print(f"PDF ANALYSIS ERROR: {e}")
+            return _failed_extraction(e)
+    else:
+        result, path = None, 'vision'
+        prepared = await asyncio.to_thread(prepare_image_for_vlm, data)
+        ocr_text = await asyncio.to_thread(_confident_ocr_text, prepared)
+        if ocr_text:
+            result = await structure_medical_text_async(ocr_text, custom_api_key)
+            path = 'ocr'
+            if result.get('error'):
+                result, path = None, 'vision'
+        if result is None:
+            result = await analyze_with_vlm_async(data, custom_api_key, prepared)
+
+    return _finish_extraction(result, path, started)
+
+_VERIFICATION_PROMPT_HEAD = """
+    You are CureBird’s Clinical Feedback & Validation AI.
+
+    Your job is to receive OCR-extracted medical text from prescriptions and convert it into a medically correct, verified, and structured form.
+
+    You MUST act like a combination of:
+    • A physician (disease & symptom reasoning)
+    • A pharmacist (drug names, salts, alternatives)
+    • A medical data validator (guideline-based logic)
+
+    You must NEVER hallucinate or invent drugs or diseases.
+    If something is unclear, mark it as "uncertain" instead of guessing.
+
+    ------------------------------------
+    YOUR TASKS
+    ------------------------------------
+
+    You will receive OCR-extracted text which may contain:
+    • Misspelled disease names
+    • Wrong or garbled drug names
+    • Incomplete information
+    • Formatting errors
+
+    You must:
+
+    1) Identify all diseases and symptoms
+    2) Correct disease names using standard medical terminology (ICD / SNOMED style)
+    3) Identify all medicines
+    4) Correct medicine names. **CRITICAL: If the input appears to be a Brand Name (e.g. 'Lonazep', 'Stamol'), the 'corrected' output MUST remain that Brand Name (spelling fixed). Do NOT replace a Brand Name with its Generic Name.**
+    5) Validate whether each medicine is medically appropriate for the disease
+    6) If not appropriate, flag it
+    7) For each medicine, provide therapeutically equivalent alternatives (same salt or same drug class)
+    8) Estimate confidence for each correction
+    9) Produce structured JSON output only
+
+    You must reason using globally accepted medical practice guidelines (WHO, ICMR, NICE, FDA-style logic).
+
+    ------------------------------------
+    ------------------------------------
+    ------------------------------------
+    CORRECTION RULES
+    ------------------------------------
+
+    • **Brand Name Priority**: If OCR says "cenzep", and you identify it as "Lonazep", output "Lonazep". Do NOT output "Clonazepam" as the main name.
+    • If a medicine name does not exist, use fuzzy matching + disease context to find the closest real medicine.
+    """
 
-        ------------------------------------
-        OUTPUT FORMAT (MANDATORY)
-        ------------------------------------
+_PHONETIC_RECONSTRUCTION_RULES = """
+    **UNIVERSAL PHONETIC RECONSTRUCTION ENGINE (Applies to ALL drugs):**
+    1. **Principle**: OCR usually captures the "shape" or "sound" of the word but messes up specific letters.
+    2. **Action**: For EVERY unrecognized input string:
+       a. "Sound it out" phonetically.
+       b. Look at the **Identified Diseases**.
+       c. Search your internal database of **Indian & Global Brand Names** for a match that:
+          - Sounds/looks similar to the input.
+          - Is a standard treatment for the identified disease.
+    3. **Example Logic (Mental Model)**: 
+       - Input "Stamol" + Disease "Hypertension" -> Match found: "Stamlo" (Amlodipine).
+       - Input "Zylor" + Disease "Gout" -> Match found: "Zyloric".
+       - Input "Trazodic" + Disease "Anxiety" -> Match found: "Trazodone" or Brand "Trazonil".
+    """
 
-        Return ONLY valid JSON in this exact format:
+_ALTERNATIVES_RULES = """
+    **ALTERNATIVES GENERATION RULES:**
+    1. **Real-World Brands**: When suggesting alternatives, do NOT just list Generics. Suggest **Market-Leading Brand Names** available in pharmacies (e.g. for 'Stamlo', suggest 'Amlokind', 'Amlopres').
+    2. **Exact Match**: Ensure the alternative has the EXACT same active salt and mechanism.
+    3. **Availability**: Prioritize brands that are widely distributed in the Indian/Global market.
+    """
+
+# Replaces the reconstruction rules when every medication has dictionary candidates
+_DICTIONARY_GROUNDING_RULES = """
+    **DICTIONARY CANDIDATES:**
+    1. Each raw medication comes with "Dictionary candidates": real Indian brands and generics whose spelling or sound is closest to it, best first, written "Name (Generic)".
+    2. Choose the candidate that is a standard treatment for the identified diseases. It is the corrected name and its generic is the salt.
+    3. Only if no candidate fits, correct the name yourself and lower its confidence.
+    """
 
+_VERIFICATION_PROMPT_TAIL = """
+    • If a disease name does not exist, use symptom context to infer the correct medical term.
+    • If multiple possibilities exist, list them and mark confidence accordingly.
+    • Never invent new drugs or diseases.
+
+    ------------------------------------
+    OUTPUT FORMAT (MANDATORY)
+    ------------------------------------
+
+    Return ONLY valid JSON in this exact format:
+
+    {
+      "diseases": [
         {
-          "diseases": [
-            {
-              "input": "<raw OCR disease>",
-              "corrected": "<standard medical disease name>",
-              "confidence": 0.95
-            }
-          ],
-          "medicines": [
-            {
-              "input": "<raw OCR drug>",
-              "corrected": "<Corrected BRAND NAME if input was Brand, or Generic if input was Generic>",
-              "dosage": "<preserve original dosage or correct if obvious>",
-              "frequency": "<preserve original frequency>",
-              "salt_or_composition": "<active ingredient / generic name>",
-              "valid_for_disease": true,
-              "alternatives": ["<equivalent drug 1>", "<equivalent drug 2>"],
-              "confidence": 0.95,
-              "is_corrected": true
-            }
-          ],
-          "warnings": [
-            "<any safety or mismatch warning>"
-          ]
+          "input": "<raw OCR disease>",
+          "corrected": "<standard medical disease name>",
+          "confidence": 0.95
+        }
+      ],
+      "medicines": [
+        {
+          "input": "<raw OCR drug>",
+          "corrected": "<Corrected BRAND NAME if input was Brand, or Generic if input was Generic>",
+          "dosage": "<preserve original dosage or correct if obvious>",
+          "frequency": "<preserve original frequency>",
+          "salt_or_composition": "<active ingredient / generic name>",
+          "valid_for_disease": true,
+          "alternatives": ["<equivalent drug 1>", "<equivalent drug 2>"],
+          "confidence": 0.95,
+          "is_corrected": true
         }
+      ],
+      "warnings": [
+        "<any safety or mismatch warning>"
+      ]
+    }
+
+    ------------------------------------
+    BEHAVIORAL RULES
+    ------------------------------------
+
+    • Be extremely strict.
+    • Do not simplify.
+    • Do not explain in natural language.
+    • Do not output anything outside JSON.
+    • When unsure, say "uncertain".
+    """
 
-        ------------------------------------
-        BEHAVIORAL RULES
-        ------------------------------------
+_VERIFICATION_PROMPT = (
+    _VERIFICATION_PROMPT_HEAD + _PHONETIC_RECONSTRUCTION_RULES + _ALTERNATIVES_RULES + _VERIFICATION_PROMPT_TAIL
+)
+_GROUNDED_VERIFICATION_PROMPT = (
+    _VERIFICATION_PROMPT_HEAD + _DICTIONARY_GROUNDING_RULES + _ALTERNATIVES_RULES + _VERIFICATION_PROMPT_TAIL
+)
 
-        • Be extremely strict.
-        • Do not simplify.
-        • Do not explain in natural language.
-        • Do not output anything outside JSON.
-        • When unsure, say "uncertain".
-        """
-        
-        user_prompt = f"""
-        AUDIT THIS EXTRACTION:
-        
-        Context (Diseases): {diseases_context}
-        Raw Medications: {medications_json}
-        """
-        
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1, 
-            max_tokens=2048,
-            response_format={"type": "json_object"}
-        )
-        
-        result_json = json.loads(completion.choices[0].message.content)
-        
-        # Merge back into a clean structure for the frontend
-        final_meds = []
+def _raw_medication_name(med):
+    return med.get('name', '') if isinstance(med, dict) else str(med)
+
+# Lookup matches that identify the product itself. Prefix and leading-word
+# matches do not: "Pan DSR" would be grounded on plain Pan and lose its domperidone.
+_GROUNDING_MATCHES = {'exact', 'fuzzy', 'phonetic'}
+
+def _dictionary_candidates(extracted_data):
+    """
+    (prompt lines, grounded) for an extraction's medications: the medicine
+    dictionary's closest names for each, and whether every medication has a
+    candidate that matches its whole name.
+    """
+    medications = extracted_data.get('medications', [])
+    if not _MEDICINE_LOOKUP or not medications:
+        return '', False
+    lines, grounded = [], True
+    for med in medications:
+        raw = _raw_medication_name(med)
+        hits = _MEDICINE_LOOKUP.lookup(raw)
+        if not any(hit['match'] in _GROUNDING_MATCHES for hit in hits):
+            grounded = False
+        if not hits:
+            continue
+        names = ", ".join(hit['name'] if hit['kind'] == 'generic' else f"{hit['name']} ({hit['generic']})" for hit in hits)
+        lines.append(f"    - {json.dumps(raw)}: {names}")
+    return "\n".join(lines), grounded
+
+# Stands in for the dictionary candidates when the drug index already named every medication
+_INDEXED_NAMES_NOTE = """
+    Medication names are already verified: keep each medicine's "corrected" equal to its
+    input and return empty "alternatives". Audit the diseases, whether each medicine is
+    valid for them, and warnings."""
+
+def _audit_context(extracted_data):
+    """
+    Diseases, raw medications and dictionary candidates of one extraction, as the
+    audit prompts present them, and whether every medication has candidates. When
+    the drug index knows every medication, they are given by their learnt names and
+    the audit is asked for the clinical check only.
+    """
+    diseases_context = ", ".join(extracted_data.get('diseases', []))
+    if not diseases_context:
+        diseases_context = "Not specifically detected, infer from medications if possible."
+    indexed = _index_corrections(extracted_data)
+    if indexed is not None:
+        medications = [
+            dict(med, name=hit['corrected']) if isinstance(med, dict) else hit['corrected']
+            for med, hit in zip(extracted_data['medications'], indexed)
+        ]
+        return diseases_context, json.dumps(medications), _INDEXED_NAMES_NOTE, True
+    candidates, grounded = _dictionary_candidates(extracted_data)
+    if candidates:
+        candidates = f"\n    Dictionary candidates:\n{candidates}"
+    return diseases_context, json.dumps(extracted_data.get('medications', [])), candidates, grounded
+
+def _verification_request(extracted_data):
+    """Chat completion arguments for the Core 2 audit of a Core 1 extraction."""
+    # 1. Construct the context for the AI
+    diseases_context, medications_json, candidates, grounded = _audit_context(extracted_data)
+    
+    user_prompt = f"""
+    AUDIT THIS EXTRACTION:
+    
+    Context (Diseases): {diseases_context}
+    Raw Medications: {medications_json}{candidates}
+    """
+
+    return {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [
+            {"role": "system", "content": _GROUNDED_VERIFICATION_PROMPT if grounded else _VERIFICATION_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.1,
+        "max_tokens": 2048,
+        "response_format": {"type": "json_object"},
+    }
+
+def _with_dictionary_alternatives(name, alternatives):
+    """The model's alternatives for `name`, followed by any dictionary brands it did not list."""
+    alternatives = list(alternatives or [])
+    listed = {str(alt).lower() for alt in alternatives} | {str(name).lower()}
+    for brand in _MEDICINE_LOOKUP.alternatives(name):
+        if brand.lower() not in listed:
+            alternatives.append(brand)
+    return alternatives
+
+def _indexed_medications(extracted_data, indexed, result_json):
+    """Medications named by the drug index, with the audit's verdict on whether each fits the diseases."""
+    verdicts = {
+        normalise_drug_name(med.get('corrected') or med.get('input')): med.get('valid_for_disease')
+        for med in result_json.get('medicines', []) if isinstance(med, dict)
+    }
+    final_meds = []
+    for med, hit in zip(extracted_data['medications'], indexed):
+        final_meds.append({
+            "name": hit['corrected'],
+            "dosage": med.get('dosage', '') if isinstance(med, dict) else '',
+            "frequency": med.get('frequency', '') if isinstance(med, dict) else '',
+            "alternatives": hit['alternatives'],
+            "is_corrected": normalise_drug_name(hit['corrected']) != normalise_drug_name(_raw_medication_name(med)),
+            "confidence": hit['confidence'],
+            "valid": verdicts.get(normalise_drug_name(hit['corrected']))
+        })
+    return final_meds
+
+def _apply_verification(extracted_data, result_json):
+    """
+    Fold the audit's corrections, warnings and verdicts into a copy of
+    `extracted_data` (and teach the name corrections to the drug index). Dictionary
+    brands with the same generic are appended to the model's alternatives. When the
+    index named every medication, its names and alternatives are kept and the audit
+    only contributes the clinical check.
+    """
+    indexed = _index_corrections(extracted_data)
+    if indexed is not None:
+        _count_verification('index')
+        verified_data = dict(extracted_data)
+        verified_data['medications'] = _indexed_medications(extracted_data, indexed, result_json)
+        return _apply_clinical_audit(verified_data, result_json)
+
+    _count_verification('model')
+    if _MEDICINE_LOOKUP:
         for med in result_json.get('medicines', []):
-            final_meds.append({
-                "name": med.get('corrected', med.get('input')),
-                "dosage": med.get('dosage', ''),
-                "frequency": med.get('frequency', ''),
-                "alternatives": med.get('alternatives', []),
-                "is_corrected": med.get('is_corrected', False),
-                # Storing extra metadata if needed for future
-                "confidence": med.get('confidence'),
-                "valid": med.get('valid_for_disease')
-            })
-            
-        # Update extracted data with corrected values
-        extracted_data['medications'] = final_meds
+            if med.get('corrected'):
+                med['alternatives'] = _with_dictionary_alternatives(med['corrected'], med.get('alternatives'))
+    if _DRUG_INDEX:
+        try:
+            _DRUG_INDEX.learn(result_json.get('medicines', []))
+        except Exception as e:
+            print(f"[DrugIndex] could not record corrections: {e}")
+
+    # Merge back into a clean structure for the frontend
+    final_meds = []
+    for med in result_json.get('medicines', []):
+        final_meds.append({
+            "name": med.get('corrected', med.get('input')),
+            "dosage": med.get('dosage', ''),
+            "frequency": med.get('frequency', ''),
+            "alternatives": med.get('alternatives', []),
+            "is_corrected": med.get('is_corrected', False),
+            # Storing extra metadata if needed for future
+            "confidence": med.get('confidence'),
+            "valid": med.get('valid_for_disease')
+        })
         
-        corrected_diseases = [d.get('corrected') for d in result_json.get('diseases', [])]
-        if corrected_diseases:
-            extracted_data['diseases'] = corrected_diseases
-            
-        return extracted_data
+    # Copy extracted data with corrected values (the raw extraction may be cached)
+    verified_data = dict(extracted_data)
+    verified_data['medications'] = final_meds
+    return _apply_clinical_audit(verified_data, result_json)
+
+def _apply_clinical_audit(verified_data, result_json):
+    """Corrected diseases and validator warnings; marks the medications' "valid" as assessed."""
+    corrected_diseases = [d.get('corrected') for d in result_json.get('diseases', [])]
+    if corrected_diseases:
+        verified_data['diseases'] = corrected_diseases
+    verified_data['warnings'] = result_json.get('warnings', [])
+    verified_data['validity_assessed'] = True
+    return verified_data
+
+def _count_verification(source):
+    with _EXTRACTION_PATH_LOCK:
+        _VERIFICATION_SOURCES[source] += 1
+
+def _index_corrections(extracted_data):
+    """
+    The drug index's entry for every medication in the document when it trusts the
+    correction for all of them, else None. Only names come from it: whether each
+    medicine fits the diagnosed disease is still for the audit to judge.
+    """
+    medications = extracted_data.get('medications', [])
+    if not _DRUG_INDEX or not medications:
+        return None
+    hits = []
+    for med in medications:
+        hit = _DRUG_INDEX.lookup(_raw_medication_name(med))
+        if hit is None:
+            return None
+        hits.append(hit)
+    return hits
+
+def verify_and_correct_medical_data(extracted_data):
+    """
+    CORE 2: FEEDBACK AI (Llama 3.3 70B Versatile)
+    
+    This layer acts as a 'Senior Medical Auditor'.
+    It takes the raw extraction and uses deep medical knowledge to correct OCR errors.
+    Returns a new dict (with "validity_assessed": True); on failure the original
+    `extracted_data` object is returned as-is. Documents whose medications are all
+    in the drug index take their names from it and get a clinical-only audit.
+    """
+    try:
+        api_key = os.getenv('GROQ_API_KEY')
+        if not api_key:
+            return extracted_data 
+
+        client = get_llm({'groq': api_key})
+        completion = client.chat.completions.create(**_verification_request(extracted_data))
+        return _apply_verification(extracted_data, json.loads(completion.choices[0].message.content))
 
     except Exception as e:
         print(f"FEEDBACK AI ERROR: {e}")
         return extracted_data # Return original on error
 
-def analyze_comprehensive(file_stream):
-    """
-    Step 1: Extract data using VLM (Core 1).
-    Step 2: Verify & Correct using Feedback AI (Core 2 - Llama 70B).
-    Step 3: Explain results (Core 3 - Summary).
-    """
+async def verify_and_correct_medical_data_async(extracted_data):
+    """`verify_and_correct_medical_data` for the ASGI app."""
     try:
-        # Use dedicated analyzer key if available
-        analyzer_key = os.getenv('GROQ_API_KEY_ANALYZER') or os.getenv('GROQ_API_KEY')
-        
-        # Phase 1: Structured Extraction (Core 1)
-        extracted_data = analyze_with_vlm(file_stream, custom_api_key=analyzer_key)
-        
-        # Guardrail: Check if it's medical
-        if not extracted_data.get('is_medical', True):
-             return {
-                "analysis": {"medications": [], "diseases": [], "test_results": []},
-                "summary": "Please upload a valid medical document (e.g., prescription, lab report, or doctor's notes). I am programmed to only analyze medical records and cannot process non-medical images."
-            }
-            
-        # Phase 2: Feedback & Correction Loop (Core 2)
-        # This is where we fix the 'cenzep' -> 'Lonazep' errors
-        print("--- Engaging Core 2: Feedback AI ---")
-        verified_data = verify_and_correct_medical_data(extracted_data)
-        
-        # Phase 3: User-friendly Summary (Core 3)
-        # Phase 3: User-friendly Summary (Core 3)
-        if not verified_data['diseases'] and not verified_data['medications'] and not extracted_data.get('test_results'):
-            return {
-                "analysis": verified_data,
-                "summary": "We analyzed your document but couldn't detect any specific medical conditions, medications, or lab results. It appears to be a medical document, but the details might be unclear. Please try uploading a clearer image."
-            }
+        api_key = os.getenv('GROQ_API_KEY')
+        if not api_key:
+            return extracted_data
 
-        client = Groq(api_key=analyzer_key)
-        
-        # Branching Logic based on Document Type
-        doc_type = extracted_data.get('document_type', 'prescription')
+        client = get_async_llm({'groq': api_key})
+        completion = await client.chat.completions.create(**_verification_request(extracted_data))
+        return _apply_verification(extracted_data, json.loads(completion.choices[0].message.content))
+
+    except Exception as e:
+        print(f"FEEDBACK AI ERROR: {e}")
+        return extracted_data
+
+def _analyzer_cache_key(file_hash, stage):
+    return f"analyzer:{ANALYZER_CACHE_VERSION}:{file_hash}:{stage}"
+
+_NON_MEDICAL_SUMMARY = "Please upload a valid medical document (e.g., prescription, lab report, or doctor's notes). I am programmed to only analyze medical records and cannot process non-medical images."
+_NOTHING_DETECTED_SUMMARY = "We analyzed your document but couldn't detect any specific medical conditions, medications, or lab results. It appears to be a medical document, but the details might be unclear. Please try uploading a clearer image."
 
-        if doc_type == 'lab_report':
-            summary_prompt = f"""
+def _hash_stream(file_stream):
+    file_stream.seek(0)
+    file_hash = content_hash(file_stream.read())
+    file_stream.seek(0)
+    return file_hash
+
+def _cacheable(extracted_data):
+    """
+    Whether a Core 1 result, and everything built on it, may be cached: not when
+    it failed, nor when only some of its pages could be read (`page_errors`), so
+    the next upload of the document retries it.
+    """
+    return not extracted_data.get('error') and not extracted_data.get('page_errors')
+
+def _extraction_stage(file_stream, file_hash, analyzer_key, call_slots=None):
+    """Core 1 (VLM / PDF extraction), served from the analyzer cache when possible."""
+    extraction_key = _analyzer_cache_key(file_hash, 'extraction')
+    extracted_data = _ANALYZER_CACHE.get(extraction_key)
+    if extracted_data is None:
+        extracted_data = analyze_document(file_stream, analyzer_key, call_slots)
+        if _cacheable(extracted_data):
+            _ANALYZER_CACHE.set(extraction_key, extracted_data)
+    return extracted_data
+
+def _verification_stage(extracted_data, file_hash):
+    """
+    Core 2 (Feedback AI), served from the analyzer cache when possible. Returns
+    (verified_data, ok); ok is False when the audit failed and `verified_data`
+    is the unverified extraction, which must not be cached downstream either.
+    """
+    verification_key = _analyzer_cache_key(file_hash, 'verification')
+    verified_data = _ANALYZER_CACHE.get(verification_key)
+    if verified_data is not None:
+        return verified_data, True
+    print("--- Engaging Core 2: Feedback AI ---")
+    verified_data = verify_and_correct_medical_data(extracted_data)
+    # The Feedback AI hands back the untouched input when it fails
+    ok = verified_data is not extracted_data
+    if ok and _cacheable(extracted_data):
+        _ANALYZER_CACHE.set(verification_key, verified_data)
+    return verified_data, ok
+
+async def _extraction_stage_async(data, file_hash, analyzer_key):
+    """`_extraction_stage` for the ASGI app. The analyzer cache is memory-only, so it is used inline."""
+    extraction_key = _analyzer_cache_key(file_hash, 'extraction')
+    extracted_data = _ANALYZER_CACHE.get(extraction_key)
+    if extracted_data is None:
+        extracted_data = await analyze_document_async(data, custom_api_key=analyzer_key)
+        if _cacheable(extracted_data):
+            _ANALYZER_CACHE.set(extraction_key, extracted_data)
+    return extracted_data
+
+async def _verification_stage_async(extracted_data, file_hash):
+    """`_verification_stage` for the ASGI app."""
+    verification_key = _analyzer_cache_key(file_hash, 'verification')
+    verified_data = _ANALYZER_CACHE.get(verification_key)
+    if verified_data is not None:
+        return verified_data, True
+    print("--- Engaging Core 2: Feedback AI ---")
+    verified_data = await verify_and_correct_medical_data_async(extracted_data)
+    ok = verified_data is not extracted_data
+    if ok and _cacheable(extracted_data):
+        _ANALYZER_CACHE.set(verification_key, verified_data)
+    return verified_data, ok
+
+def _has_findings(extracted_data, verified_data):
+    return bool(verified_data['diseases'] or verified_data['medications'] or extracted_data.get('test_results'))
+
+def _build_summary_prompt(extracted_data, verified_data):
+    """Core 3 prompt, branched on the detected document type."""
+    # Branching Logic based on Document Type
+    doc_type = extracted_data.get('document_type', 'prescription')
+
+    if doc_type == 'lab_report':
+        summary_prompt = f"""
 You are a senior medical AI that transforms complex lab reports into clear, actionable health insights any patient can instantly understand.
 
 PATIENT DATA:
@@ -602,14 +1253,15 @@ List all in-range tests as a brief bullet list:
 ---
 *AI-assisted interpretation. Always verify findings with your treating physician before making health decisions.*
 """
-        else:
-            summary_prompt = f"""
+    else:
+        summary_prompt = f"""
 You are a senior medical AI that decodes complex prescriptions into clear, simple, and immediately actionable information for patients.
 
 PATIENT DATA:
 Diagnosed Conditions: {', '.join(verified_data['diseases']) if verified_data['diseases'] else 'Not explicitly stated'}
 Verified Medications: {json.dumps(verified_data['medications'])}
 AI Validator Warnings: {json.dumps(verified_data.get('warnings', []))}
+Suitability Checked: {'yes' if verified_data.get('validity_assessed') else 'no'}
 
 ---
 
@@ -621,6 +1273,7 @@ STRICT RULES:
 - For every medical term, immediately provide the plain-English translation in parentheses.
 - Be empathetic, precise, and professional.
 - Do NOT mention internal AI system names or product branding inside the summary.
+- Each medication's "valid" says whether it suits the diagnosed conditions: true (it does), false (flagged: say so and advise confirming with the doctor) or null (not checked: never describe it as checked or safe for the condition). If "Suitability Checked" is no, say that these medicines could not be checked against the diagnosis.
 
 ---
 
@@ -650,19 +1303,73 @@ If no warnings: **"No drug conflicts, interactions, or mismatches detected."**
 *AI-assisted prescription summary. Always follow your doctor's original instructions. This is not a substitute for professional medical advice.*
 """
 
-        summary_completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": summary_prompt}],
-            temperature=0.4,
-            max_tokens=1200
-        )
+    return summary_prompt
+
+def _summary_params(summary_prompt, stream=False):
+    return {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [{"role": "user", "content": summary_prompt}],
+        "temperature": 0.4,
+        "max_tokens": 1200,
+        "stream": stream,
+    }
+
+def _summary_request(analyzer_key, summary_prompt, stream=False):
+    client = get_llm({'groq': analyzer_key})
+    return client.chat.completions.create(**_summary_params(summary_prompt, stream))
+
+def analyze_comprehensive(file_stream):
+    """
+    Step 1: Extract data using VLM (Core 1).
+    Step 2: Verify & Correct using Feedback AI (Core 2 - Llama 70B).
+    Step 3: Explain results (Core 3 - Summary).
+
+    Each core's output is cached by the SHA-256 of the upload, so a repeat upload
+    is served from memory and a run that failed midway resumes from the last
+    completed stage.
+    """
+    try:
+        # Use dedicated analyzer key if available
+        analyzer_key = os.getenv('GROQ_API_KEY_ANALYZER') or os.getenv('GROQ_API_KEY')
+        file_hash = _hash_stream(file_stream)
+
+        cached_result = _ANALYZER_CACHE.get(_analyzer_cache_key(file_hash, 'summary'))
+        if cached_result is not None:
+            print(f"--- Analyzer cache hit ({file_hash[:12]}) ---")
+            return cached_result
+        
+        # Phase 1: Structured Extraction (Core 1)
+        extracted_data = _extraction_stage(file_stream, file_hash, analyzer_key)
         
+        # Guardrail: Check if it's medical
+        if not extracted_data.get('is_medical', True):
+             return {
+                "analysis": {"medications": [], "diseases": [], "test_results": []},
+                "summary": _NON_MEDICAL_SUMMARY
+            }
+            
+        # Phase 2: Feedback & Correction Loop (Core 2)
+        # This is where we fix the 'cenzep' -> 'Lonazep' errors
+        verified_data, verified = _verification_stage(extracted_data, file_hash)
+        
+        # Phase 3: User-friendly Summary (Core 3)
+        if not _has_findings(extracted_data, verified_data):
+            return {
+                "analysis": verified_data,
+                "summary": _NOTHING_DETECTED_SUMMARY
+            }
+
+        summary_completion = _summary_request(analyzer_key, _build_summary_prompt(extracted_data, verified_data))
         summary_text = summary_completion.choices[0].message.content
         
-        return {
+        result = {
             "analysis": verified_data,
             "summary": summary_text
         }
+        # An unverified analysis is not cached, so the next upload retries Core 2
+        if verified and _cacheable(extracted_data):
+            _ANALYZER_CACHE.set(_analyzer_cache_key(file_hash, 'summary'), result)
+        return result
         
     except Exception as e:
         print(f"COMPREHENSIVE ANALYZER ERROR: {e}")
@@ -671,3 +1378,299 @@ If no warnings: **"No drug conflicts, interactions, or mismatches detected."**
             "summary": "An error occurred while creating your medical summary. Please try again."
         }
 
+async def analyze_comprehensive_async(data):
+    """
+    `analyze_comprehensive` for the ASGI app, taking the upload's bytes. The
+    three cores await the async gateway, so a worker holds no thread while
+    the models run; OCR and PDF rendering use threads.
+    """
+    try:
+        analyzer_key = os.getenv('GROQ_API_KEY_ANALYZER') or os.getenv('GROQ_API_KEY')
+        file_hash = content_hash(data)
+        summary_key = _analyzer_cache_key(file_hash, 'summary')
+
+        cached_result = _ANALYZER_CACHE.get(summary_key)
+        if cached_result is not None:
+            print(f"--- Analyzer cache hit ({file_hash[:12]}) ---")
+            return cached_result
+
+        extracted_data = await _extraction_stage_async(data, file_hash, analyzer_key)
+        if not extracted_data.get('is_medical', True):
+            return {
+                "analysis": {"medications": [], "diseases": [], "test_results": []},
+                "summary": _NON_MEDICAL_SUMMARY
+            }
+
+        verified_data, verified = await _verification_stage_async(extracted_data, file_hash)
+        if not _has_findings(extracted_data, verified_data):
+            return {"analysis": verified_data, "summary": _NOTHING_DETECTED_SUMMARY}
+
+        client = get_async_llm({'groq': analyzer_key})
+        summary_completion = await client.chat.completions.create(
+            **_summary_params(_build_summary_prompt(extracted_data, verified_data))
+        )
+        result = {"analysis": verified_data, "summary": summary_completion.choices[0].message.content}
+        if verified and _cacheable(extracted_data):
+            _ANALYZER_CACHE.set(summary_key, result)
+        return result
+
+    except Exception as e:
+        print(f"COMPREHENSIVE ANALYZER ERROR: {e}")
+        return {
+            "analysis": {"medications": [], "diseases": []},
+            "summary": "An error occurred while creating your medical summary. Please try again."
+        }
+
+def analyze_comprehensive_stream(file_stream):
+    """
+    Streaming variant of `analyze_comprehensive`.
+
+    Yields `(event, payload)` tuples as each core finishes:
+      - "extraction":    Core 1 output (raw VLM JSON)
+      - "verification":  Core 2 output (verified medications/diseases)
+      - "summary_delta": {"text": ...} token chunks from Core 3 (Groq stream=True)
+      - "done":          the same {"analysis", "summary"} dict the blocking endpoint returns
+      - "error":         {"message": ...} followed by a fallback "done"
+    """
+    try:
+        analyzer_key = os.getenv('GROQ_API_KEY_ANALYZER') or os.getenv('GROQ_API_KEY')
+        file_hash = _hash_stream(file_stream)
+
+        cached_result = _ANALYZER_CACHE.get(_analyzer_cache_key(file_hash, 'summary'))
+        if cached_result is not None:
+            print(f"--- Analyzer cache hit ({file_hash[:12]}) ---")
+            yield "verification", cached_result["analysis"]
+            yield "summary_delta", {"text": cached_result["summary"]}
+            yield "done", cached_result
+            return
+
+        extracted_data = _extraction_stage(file_stream, file_hash, analyzer_key)
+        yield "extraction", extracted_data
+
+        if not extracted_data.get('is_medical', True):
+            yield "done", {
+                "analysis": {"medications": [], "diseases": [], "test_results": []},
+                "summary": _NON_MEDICAL_SUMMARY
+            }
+            return
+
+        verified_data, verified = _verification_stage(extracted_data, file_hash)
+        yield "verification", verified_data
+
+        if not _has_findings(extracted_data, verified_data):
+            yield "done", {"analysis": verified_data, "summary": _NOTHING_DETECTED_SUMMARY}
+            return
+
+        stream = _summary_request(analyzer_key, _build_summary_prompt(extracted_data, verified_data), stream=True)
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield "summary_delta", {"text": delta}
+
+        result = {"analysis": verified_data, "summary": "".join(parts)}
+        # An unverified analysis is not cached, so the next upload retries Core 2
+        if verified and _cacheable(extracted_data):
+            _ANALYZER_CACHE.set(_analyzer_cache_key(file_hash, 'summary'), result)
+        yield "done", result
+
+    except Exception as e:
+        print(f"COMPREHENSIVE ANALYZER STREAM ERROR: {e}")
+        yield "error", {"message": str(e)}
+        yield "done", {
+            "analysis": {"medications": [], "diseases": []},
+            "summary": "An error occurred while creating your medical summary. Please try again."
+        }
+
+# Batch analysis: every document's Core 1 runs concurrently, then Core 2 audits
+# the stack a few documents per call and one Core 3 summary covers all of it
+ANALYZER_BATCH_MAX_FILES = int(os.getenv('ANALYZER_BATCH_MAX_FILES', 20))
+ANALYZER_BATCH_CONCURRENCY = int(os.getenv('ANALYZER_BATCH_CONCURRENCY', 4))
+ANALYZER_BATCH_RETRIES = int(os.getenv('ANALYZER_BATCH_RETRIES', 2))
+# Documents per Core 2 call, so each audit's JSON fits its max_tokens
+ANALYZER_BATCH_AUDIT_SIZE = int(os.getenv('ANALYZER_BATCH_AUDIT_SIZE', 4))
+# Held for each Core 1 model call (every scanned PDF page is one) and shared by all
+# batches, so concurrent uploads together stay under the provider's rate limit
+_BATCH_CALL_SLOTS = threading.BoundedSemaphore(ANALYZER_BATCH_CONCURRENCY)
+
+_BATCH_VERIFICATION_INSTRUCTIONS = """
+    BATCH MODE: you will receive several documents from the same patient, each
+    labelled "DOCUMENT <n>". Audit each one independently with the rules above and
+    return ONLY valid JSON of the form:
+
+    {"documents": [{"document": <n>, "diseases": [...], "medicines": [...], "warnings": [...]}]}
+
+    where each entry's "diseases", "medicines" and "warnings" follow the OUTPUT FORMAT above.
+    """
+
+def _is_rate_limited(error):
+    error = str(error).lower()
+    return '429' in error or 'rate limit' in error or 'rate_limit' in error
+
+def _batch_extraction(item, analyzer_key):
+    """Core 1 for one document of a batch, its model calls holding shared slots, backing off when rate limited."""
+    data, file_hash = item
+    for attempt in range(ANALYZER_BATCH_RETRIES + 1):
+        extracted = _extraction_stage(BytesIO(data), file_hash, analyzer_key, _BATCH_CALL_SLOTS)
+        if not (extracted.get('error') and _is_rate_limited(extracted['error'])) or attempt == ANALYZER_BATCH_RETRIES:
+            return extracted
+        time.sleep(2 ** attempt)
+
+def _batch_verification_request(extractions):
+    documents, all_grounded = [], True
+    for number, extracted in extractions:
+        diseases_context, medications_json, candidates, grounded = _audit_context(extracted)
+        all_grounded = all_grounded and grounded
+        documents.append(f"""
+    DOCUMENT {number}:
+    Context (Diseases): {diseases_context}
+    Raw Medications: {medications_json}{candidates}""")
+    system_prompt = _GROUNDED_VERIFICATION_PROMPT if all_grounded else _VERIFICATION_PROMPT
+    return {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [
+            {"role": "system", "content": system_prompt + _BATCH_VERIFICATION_INSTRUCTIONS},
+            {"role": "user", "content": "AUDIT THESE EXTRACTIONS:\n" + "\n".join(documents)},
+        ],
+        "temperature": 0.1,
+        "max_tokens": min(2048 * len(extractions), 8192),
+        "response_format": {"type": "json_object"},
+    }
+
+def _audit_chunk(chunk, api_key):
+    """{number: audit} for one Core 2 call over a few documents; {} if the call fails."""
+    try:
+        client = get_llm({'groq': api_key})
+        completion = client.chat.completions.create(**_batch_verification_request(chunk))
+        audits = json.loads(completion.choices[0].message.content).get('documents', [])
+        return {audit.get('document'): audit for audit in audits}
+    except Exception as e:
+        print(f"BATCH FEEDBACK AI ERROR (documents {[number for number, _ in chunk]}): {e}")
+        return {}
+
+def verify_medical_data_batch(extractions):
+    """
+    Core 2 for several documents, ANALYZER_BATCH_AUDIT_SIZE per 70B call with
+    the calls running concurrently. `extractions` is a list of
+    (number, extracted_data); returns {number: verified_data}. Documents the
+    model leaves out, or whose call fails, keep their extraction.
+    """
+    verified = {number: extracted for number, extracted in extractions}
+    api_key = os.getenv('GROQ_API_KEY')
+    if not api_key or not extractions:
+        return verified
+    size = max(1, ANALYZER_BATCH_AUDIT_SIZE)
+    chunks = [extractions[i:i + size] for i in range(0, len(extractions), size)]
+    for audits in map_concurrently(lambda chunk: _audit_chunk(chunk, api_key), chunks,
+                                   max_workers=ANALYZER_BATCH_CONCURRENCY):
+        for number, audit in audits.items():
+            if number in verified:
+                verified[number] = _apply_verification(verified[number], audit)
+    return verified
+
+def analyze_batch(files):
+    """
+    Analyse a stack of documents from one patient. `files` is a list of
+    (filename, bytes).
+
+    Core 1 runs for every document concurrently. At most ANALYZER_BATCH_CONCURRENCY
+    of its model calls (one per scanned PDF page) are in flight across all
+    batches. Core 2 audits the medical documents ANALYZER_BATCH_AUDIT_SIZE per
+    call, and Core 3 writes a single summary of the merged, de-duplicated
+    analysis: for N single-page documents, N + N/4 + 1 model calls instead of 3N.
+    Per-file extraction and verification use the same cache as the single-file
+    analyzer.
+    """
+    try:
+        analyzer_key = os.getenv('GROQ_API_KEY_ANALYZER') or os.getenv('GROQ_API_KEY')
+        items = [(data, content_hash(data)) for _, data in files]
+        started = time.time()
+
+        extractions = map_concurrently(
+            lambda item: _batch_extraction(item, analyzer_key), items, max_workers=ANALYZER_BATCH_CONCURRENCY
+        )
+        print(f"[BATCH] Core 1 for {len(items)} documents in {time.time() - started:.2f}s")
+
+        documents = []
+        medical, to_verify, verified = [], [], {}
+        for number, ((filename, _), (_, file_hash), extracted) in enumerate(zip(files, items, extractions), 1):
+            documents.append({
+                "document": number,
+                "filename": filename,
+                "document_type": extracted.get('document_type'),
+                "is_medical": extracted.get('is_medical', True) and not extracted.get('error'),
+                "extraction_path": extracted.get('extraction_path'),
+                "error": extracted.get('error'),
+            })
+            if extracted.get('error') or not extracted.get('is_medical', True):
+                continue
+            medical.append((number, file_hash, extracted))
+            cached = _ANALYZER_CACHE.get(_analyzer_cache_key(file_hash, 'verification'))
+            if cached is not None:
+                verified[number] = cached
+            else:
+                to_verify.append((number, extracted))
+
+        if not medical:
+            return {
+                "analysis": {"medications": [], "diseases": [], "test_results": []},
+                "documents": documents,
+                "summary": _NON_MEDICAL_SUMMARY
+            }
+
+        if to_verify:
+            print(f"--- Engaging Core 2: Feedback AI ({len(to_verify)} documents) ---")
+            audited = verify_medical_data_batch(to_verify)
+            for number, file_hash, extracted in medical:
+                if number in audited:
+                    verified[number] = audited[number]
+                    if audited[number] is not extracted and _cacheable(extracted):
+                        _ANALYZER_CACHE.set(_analyzer_cache_key(file_hash, 'verification'), audited[number])
+
+        merged_extraction = _merge_extractions([extracted for _, _, extracted in medical])
+        merged = _merge_extractions([verified[number] for number, _, _ in medical])
+        doc_types = {extracted.get('document_type') for _, _, extracted in medical}
+        merged_extraction['document_type'] = merged['document_type'] = (
+            'lab_report' if doc_types == {'lab_report'} else 'prescription'
+        )
+
+        if not _has_findings(merged_extraction, merged):
+            return {"analysis": merged, "documents": documents, "summary": _NOTHING_DETECTED_SUMMARY}
+
+        summary_completion = _summary_request(analyzer_key, _build_summary_prompt(merged_extraction, merged))
+        print(f"[BATCH] {len(items)} documents analysed in {time.time() - started:.2f}s")
+        return {
+            "analysis": merged,
+            "documents": documents,
+            "summary": summary_completion.choices[0].message.content
+        }
+
+    except Exception as e:
+        print(f"BATCH ANALYZER ERROR: {e}")
+        return {
+            "analysis": {"medications": [], "diseases": []},
+            "summary": "An error occurred while creating your medical summary. Please try again."
+        }
+
+# Stage reached once each streamed event has arrived
+_JOB_STAGE_AFTER = {'extraction': 'verification', 'verification': 'summary'}
+
+def run_analysis_job(job, set_stage):
+    """
+    Background-job handler for queued analyzer uploads (see utils.job_queue).
+    Drives `analyze_comprehensive_stream` so each finished core advances the
+    job's stage, and returns the same result `analyze_comprehensive` would.
+    """
+    set_stage('extraction')
+    result = None
+    for event, payload in analyze_comprehensive_stream(BytesIO(job['payload'])):
+        if event in _JOB_STAGE_AFTER:
+            set_stage(_JOB_STAGE_AFTER[event])
+        elif event == 'error':
+            raise RuntimeError(payload['message'])
+        elif event == 'done':
+            result = payload
+    return result
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""
+ASGI entry point (uvicorn). Serves the LLM-bound routes as coroutines and
+the rest of the Flask app through a WSGI bridge; see app/asgi.py.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.asgi import create_asgi_app
+
+# uvicorn asgi:application
+application = create_asgi_app()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 8080))
+    uvicorn.run(application, host='0.0.0.0', port=port)
@@ -0,0 +1,142 @@
+"""
+Concurrent load test for the LLM-bound routes, WSGI (gunicorn) vs ASGI (uvicorn).
+
+Usage (from backend/):
+    python -m benchmarks.asgi_load_test --url http://localhost:8080 [-n 400] [-c 200]
+    python -m benchmarks.asgi_load_test --compare [-n 400] [-c 200] [--latency 1.0]
+
+The first form sends `-n` patient-reply requests, `-c` at a time, to a running
+server and prints throughput and latency percentiles. --compare starts both
+servers itself (one worker each: gunicorn with 8 threads as in the Dockerfile,
+and uvicorn) with LLM_GATEWAY_FAKE=1, so every model call is a local sleep of
+--latency seconds, and runs the same load against each.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINT = '/api/chat/patient-reply'
+PAYLOAD = {
+    'history': [{'sender': 'doctor', 'text': 'How has your blood sugar been this week?'}],
+    'patientContext': {'patient': 'Asha', 'condition': 'Type 2 Diabetes', 'status': 'stable'},
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run_load(base_url, requests, concurrency):
+    """Send `requests` POSTs with at most `concurrency` in flight; returns (latencies, errors, wall seconds)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    # One connection per request, like many separate browsers (and pooled keep-alive
+    # connections in httpx's async client can stall against a busy server)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(ENDPOINT, json=PAYLOAD)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return latencies, errors, time.perf_counter() - started
+
+
+def report(name, latencies, errors, wall):
+    print(f"{name}")
+    print(f"  throughput : {len(latencies) / wall:8.1f} req/s ({len(latencies)} ok, {errors} failed, {wall:.1f}s)")
+    print(
+        f"  latency    : p50 {percentile(latencies, 50):.2f}s  p95 {percentile(latencies, 95):.2f}s"
+        f"  p99 {percentile(latencies, 99):.2f}s"
+    )
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{base_url}/api/llm/metrics", timeout=2)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+def _start_server(command, latency):
+    env = dict(
+        os.environ,
+        LLM_GATEWAY_FAKE='1',
+        LLM_GATEWAY_FAKE_LATENCY=str(latency),
+        GROQ_API_KEY=os.getenv('GROQ_API_KEY', 'load-test'),
+    )
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def compare(requests, concurrency, latency):
+    servers = {
+        'gunicorn (1 worker x 8 threads)': lambda port: [
+            sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}",
+            '--workers', '1', '--threads', '8', '--timeout', '300', 'wsgi:application',
+        ],
+        'uvicorn (1 worker, async routes)': lambda port: [
+            sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', '1', '--log-level', 'warning',
+        ],
+    }
+    print(f"{requests} requests, {concurrency} concurrent, fake model latency {latency}s\n")
+    for name, command in servers.items():
+        port = _free_port()
+        process = _start_server(command(port), latency)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            _wait_until_up(base_url)
+            report(name, *asyncio.run(run_load(base_url, requests, concurrency)))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server')
+    parser.add_argument('--compare', action='store_true', help='start gunicorn and uvicorn with the fake provider')
+    parser.add_argument('-n', '--requests', type=int, default=400)
+    parser.add_argument('-c', '--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=1.0, help='fake model latency for --compare (seconds)')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.requests, args.concurrency, args.latency)
+    elif args.url:
+        report(args.url, *asyncio.run(run_load(args.url.rstrip('/'), args.requests, args.concurrency)))
+    else:
+        parser.error('pass --url or --compare')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+"""
+Lookup throughput and recall of the medicine dictionary's fuzzy index.
+
+Usage (from backend/):
+    python -m benchmarks.medicine_lookup_bench [--names 50000] [--queries 20000] [--seed 7]
+
+Builds a `MedicineLookup` over the bundled indian_medicines.json plus
+--names synthetic brand names (pronounceable syllable strings mapped to the
+bundled generics), then looks up --queries misspellings of random names: a
+swapped, dropped, replaced or extra letter, or the name cut short. Prints the
+build time, lookups per second, top-1/top-3 recall, and the same queries
+against a linear edit-distance scan for comparison.
+"""
+import sys
+import json
+import time
+import random
+import string
+import argparse
+
+from utils.medicine_lookup import DEFAULT_MEDICINE_DATA, MedicineLookup, osa_distance
+from utils.drug_index import normalise_drug_name
+
+SYLLABLES = [
+    'am', 'lo', 'dip', 'tel', 'ma', 'zy', 'lor', 'ic', 'pan', 'to', 'cid', 'ra', 'zo', 'met', 'for', 'glu',
+    'co', 'nor', 'di', 'vas', 'cal', 'pres', 'kind', 'ta', 'ni', 'fen', 'sar', 'tan', 'flox', 'mox', 'ce',
+    'fi', 'xi', 'mo', 'ne', 'pril', 'bi', 'sol', 'to', 'ril', 'ven', 'dex', 'mol', 'pa', 'ra', 'ci',
+]
+
+
+def synthetic_medicines(count, generics, rng):
+    names, medicines = set(), []
+    while len(medicines) < count:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        if name.lower() not in names:
+            names.add(name.lower())
+            medicines.append({'brand': name, 'generic': rng.choice(generics)})
+    return medicines
+
+
+def misspell(name, rng):
+    letters = list(name.lower())
+    position = rng.randrange(len(letters))
+    kind = rng.choice(['swap', 'drop', 'replace', 'insert', 'truncate'])
+    if kind == 'swap' and position < len(letters) - 1:
+        letters[position], letters[position + 1] = letters[position + 1], letters[position]
+    elif kind == 'drop' and len(letters) > 5:
+        del letters[position]
+    elif kind == 'replace':
+        letters[position] = rng.choice(string.ascii_lowercase)
+    elif kind == 'insert':
+        letters.insert(position, rng.choice(string.ascii_lowercase))
+    elif kind == 'truncate' and len(letters) > 6:
+        letters = letters[:max(5, len(letters) - 2)]
+    return ''.join(letters)
+
+
+def linear_scan(keys, query, limit=3):
+    """Baseline: edit distance to every name in the dictionary."""
+    query = normalise_drug_name(query)
+    return sorted(keys, key=lambda key: osa_distance(query, key, 3))[:limit]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--names', type=int, default=50000, help='synthetic brand names to add')
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--scan-queries', type=int, default=10, help='queries for the linear-scan baseline')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with open(DEFAULT_MEDICINE_DATA, 'r', encoding='utf-8') as f:
+        bundled = json.load(f)['medicines']
+    medicines = bundled + synthetic_medicines(args.names, sorted({m['generic'] for m in bundled}), rng)
+
+    started = time.perf_counter()
+    lookup = MedicineLookup(medicines)
+    build_seconds = time.perf_counter() - started
+
+    targets = [rng.choice(medicines)['brand'] for _ in range(args.queries)]
+    queries = [misspell(target, rng) for target in targets]
+
+    started = time.perf_counter()
+    results = [lookup.lookup(query) for query in queries]
+    elapsed = time.perf_counter() - started
+
+    top1 = sum(bool(hits) and hits[0]['name'] == target for hits, target in zip(results, targets))
+    top3 = sum(any(hit['name'] == target for hit in hits) for hits, target in zip(results, targets))
+
+    print(f"dictionary : {len(lookup)} names ({len(bundled)} bundled brands), built in {build_seconds:.2f}s")
+    print(f"index      : {lookup.stats()}")
+    print(f"lookups    : {args.queries / elapsed:,.0f}/s ({elapsed / args.queries * 1e6:.1f} us each)")
+    print(f"recall     : top-1 {top1 / args.queries:.1%}, top-3 {top3 / args.queries:.1%}")
+    for query in ('Stamol', 'Zylor', 'Lonazep 0.5mg', 'Glycomat'):
+        print(f"  {query!r:16} -> {[(hit['name'], hit['generic']) for hit in lookup.lookup(query)]}")
+
+    if args.scan_queries:
+        keys = [entry[3] for entry in lookup._entries]
+        started = time.perf_counter()
+        for query in queries[:args.scan_queries]:
+            linear_scan(keys, query)
+        scan = (time.perf_counter() - started) / args.scan_queries
+        print(f"linear scan: {1 / scan:,.1f}/s ({scan * 1e3:.1f} ms each) over the same dictionary")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
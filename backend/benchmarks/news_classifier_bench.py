@@ -0,0 +1,222 @@
+"""
+Micro-benchmark: single-pass news classifier vs the per-facet keyword helpers it replaced.
+
+Usage (from backend/):
+    python -m benchmarks.news_classifier_bench [corpus.json] [--repeat N]
+
+`corpus.json` is a list of NewsAPI article dicts, or a saved NewsAPI response
+({"articles": [...]}) / a list of such responses. Without one, the curated
+fallback articles plus synthetic recombinations of them are used.
+
+Before timing, every article is checked to classify identically under both
+implementations.
+"""
+import json
+import random
+import re
+import sys
+import time
+
+from app.news_classifier import (
+    _CAT_KW, _CITY_COORDS, _DEFAULT_GLOBAL_LOCS, _DEFAULT_LOCS, _GLOBAL_COORDS,
+    _HEALTH_TAGS, _URGENT_KW, classify_article, default_global_location, default_location,
+)
+
+
+# --- Reference implementation (the helpers previously in app/routes.py) ---
+
+def _detect_global_location(text, idx):
+    t = text.lower()
+    for place, coords in _GLOBAL_COORDS.items():
+        if place in t:
+            return coords
+    return _DEFAULT_GLOBAL_LOCS[idx % len(_DEFAULT_GLOBAL_LOCS)]
+
+
+def _categorize(text):
+    t = text.lower()
+    for cat, kws in _CAT_KW.items():
+        if any(k in t for k in kws):
+            return cat
+    return 'UPDATE'
+
+def _detect_location(text, idx):
+    t = text.lower()
+    for city, coords in _CITY_COORDS.items():
+        if city in t:
+            return coords
+    return _DEFAULT_LOCS[idx % len(_DEFAULT_LOCS)]
+
+def _is_urgent(text):
+    t = text.lower()
+    return any(k in t for k in _URGENT_KW)
+
+def _extract_tags(title, desc):
+    combined = (title + ' ' + (desc or '')).lower()
+    tags = []
+    for kw, tag in _HEALTH_TAGS.items():
+        if kw in combined and tag not in tags:
+            tags.append(tag)
+        if len(tags) >= 3:
+            break
+    return tags or ['Health', 'India']
+
+
+def _is_indian_article(title, desc, source_name):
+    combined = f"{title} {desc or ''} {source_name or ''}".lower()
+    
+    # Match India, Indian, Bharat with word boundaries to avoid matching Indiana
+    if re.search(r'\b(india|indian|bharat)\b', combined):
+        return True
+    
+    # Check major cities/states from _CITY_COORDS
+    for place in _CITY_COORDS.keys():
+        if re.search(rf'\b{re.escape(place)}\b', combined):
+            return True
+            
+    # Check other Indian states/keywords
+    indian_keywords = [
+        'maharashtra', 'uttar pradesh', 'bihar', 'punjab', 'haryana', 
+        'assam', 'odisha', 'madhya pradesh', 'telangana', 'andhra pradesh', 
+        'goa', 'kashmir', 'himachal', 'uttarakhand', 'jharkhand', 
+        'chhattisgarh', 'sikkim', 'manipur', 'meghalaya', 'mizoram', 
+        'nagaland', 'tripura', 'arunachal'
+    ]
+    for kw in indian_keywords:
+        if re.search(rf'\b{re.escape(kw)}\b', combined):
+            return True
+            
+    return False
+def _is_health_article(title, desc):
+    combined = f"{title} {desc or ''}".lower()
+    health_keywords = [
+        'health', 'healthcare', 'disease', 'hospital', 'medical', 'medicine', 
+        'vaccine', 'vaccination', 'outbreak', 'virus', 'infection', 'patient', 
+        'doctor', 'clinical', 'drug', 'treatment', 'pharma', 'epidemic', 
+        'pandemic', 'illness', 'dengue', 'malaria', 'covid', 'cancer', 
+        'diabetes', 'tuberculosis', 'cholera', 'zika', 'mpox', 'surgeon', 
+        'cardiac', 'hiv', 'aids', 'pathogen', 'fda', 'icmr', 'who', 
+        'ayushman', 'hygiene', 'sanitation', 'pediatric', 'nursing', 'nurse', 
+        'physician', 'clinic', 'flu', 'fever', 'symptoms', 'diagnose', 
+        'diagnosis', 'antibiotic', 'allergy', 'asthma', 'mental', 'nutrition', 
+        'vitamin', 'diet', 'covid-19', 'h5n1', 'h1n1', 'heart', 'brain', 
+        'lung', 'stroke', 'wellness', 'pfizer', 'moderna', 'astrazeneca', 
+        'covaxin', 'covishield', 'surgery', 'surgical', 'therapy', 'therapeutic', 
+        'infectious', 'epidemiology', 'pathology', 'sleep', 'fitness', 
+        'exercise', 'workout', 'obesity', 'overweight', 'calorie', 'calories', 
+        'injury', 'injuries', 'pain', 'aches', 'kidney', 'liver', 'kidneys', 
+        'stomach', 'intestinal', 'digestive', 'digestion', 'nutritionist', 
+        'medicinal', 'pulse', 'blood', 'anatomy', 'hygienic', 'immune', 
+        'immunity', 'vaccines', 'medicines', 'hospitals', 'doctors', 'patients',
+        'diseases', 'viruses', 'infections', 'clinics', 'symptom', 'therapies',
+        'telemedicine', 'biomedicine', 'ehealth', 'mhealth', 'healthtech'
+    ]
+    for kw in health_keywords:
+        if re.search(rf'\b{re.escape(kw)}\b', combined):
+            return True
+    return False
+
+
+def legacy_classify(title, desc, source_name, idx):
+    combined = title + ' ' + desc
+    return {
+        'is_health': _is_health_article(title, desc),
+        'is_indian': _is_indian_article(title, desc, source_name),
+        'category': _categorize(combined),
+        'urgent': _is_urgent(combined),
+        'tags': _extract_tags(title, desc),
+        'location': _detect_location(combined, idx),
+        'global_location': _detect_global_location(combined, idx),
+    }
+
+
+def engine_classify(title, desc, source_name, idx):
+    facets = classify_article(title, desc, source_name)
+    facets['location'] = facets['location'] or default_location(idx)
+    facets['global_location'] = facets['global_location'] or default_global_location(idx)
+    return facets
+
+
+# --- Corpus ---
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    responses = data if isinstance(data, list) else [data]
+    articles = []
+    for item in responses:
+        if isinstance(item, dict) and 'articles' in item:
+            articles.extend(item['articles'])
+        elif isinstance(item, dict):
+            articles.append(item)
+    return [
+        (
+            (a.get('title') or a.get('headline') or '').strip(),
+            (a.get('description') or a.get('excerpt') or '').strip(),
+            a.get('source', {}).get('name', '') if isinstance(a.get('source'), dict) else (a.get('source') or ''),
+        )
+        for a in articles
+    ]
+
+
+def synthetic_corpus(size=500, seed=7):
+    from app.routes import _FALLBACK_ARTICLES
+
+    rng = random.Random(seed)
+    prose = ' '.join(a['headline'] + ' ' + a['excerpt'] for a in _FALLBACK_ARTICLES).split()
+    keywords = list(_CITY_COORDS) + list(_GLOBAL_COORDS) + list(_HEALTH_TAGS) + _URGENT_KW
+    keywords += [kw for kws in _CAT_KW.values() for kw in kws] + ['Indiana', 'whole', 'cdcs', 'India,', '(WHO)']
+    sources = [a['source'] for a in _FALLBACK_ARTICLES] + ['Reuters', 'Times of India', 'BBC News', '']
+
+    def sentence(n):
+        # Mostly real headline prose with roughly one injected keyword in ten words
+        return ' '.join(rng.choice(keywords) if rng.random() < 0.1 else rng.choice(prose) for _ in range(n))
+
+    corpus = [(a['headline'], a['excerpt'], a['source']) for a in _FALLBACK_ARTICLES]
+    while len(corpus) < size:
+        title = sentence(rng.randint(6, 14))
+        desc = sentence(rng.randint(20, 45))
+        corpus.append((title, desc, rng.choice(sources)))
+    return corpus
+
+
+# --- Runner ---
+
+def _time(fn, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for idx, (title, desc, source) in enumerate(corpus):
+            fn(title, desc, source, idx)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv):
+    repeat = 5
+    if '--repeat' in argv:
+        i = argv.index('--repeat')
+        repeat = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    corpus = load_corpus(argv[0]) if argv else synthetic_corpus()
+
+    mismatches = 0
+    for idx, (title, desc, source) in enumerate(corpus):
+        old, new = legacy_classify(title, desc, source, idx), engine_classify(title, desc, source, idx)
+        if old != new:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH: {title[:60]!r}\n  legacy: {old}\n  engine: {new}")
+    print(f"{len(corpus)} articles, {mismatches} mismatches")
+
+    legacy_s = _time(legacy_classify, corpus, repeat)
+    engine_s = _time(engine_classify, corpus, repeat)
+    per = 1e6 / max(len(corpus), 1)
+    print(f"legacy helpers : {legacy_s * 1000:8.2f} ms  ({legacy_s * per:7.1f} us/article)")
+    print(f"single-pass    : {engine_s * 1000:8.2f} ms  ({engine_s * per:7.1f} us/article)")
+    print(f"speedup        : {legacy_s / engine_s:8.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
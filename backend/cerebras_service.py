@@ -1,16 +1,61 @@
 import os
+import time
+import asyncio
 import requests
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
 import fitz  # PyMuPDF
 from io import BytesIO
 from dotenv import load_dotenv
-from cerebras.cloud.sdk import Cerebras
 from app.services import analyze_with_vlm
+from utils.cache_manager import CACHE_DIR, CacheManager, content_hash
+from utils.llm_gateway import get_async_llm, get_llm
 
 load_dotenv()
 
 CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
 
+# File ingestion concurrency (download + PyMuPDF/VLM extraction per record)
+INGEST_MAX_WORKERS = int(os.getenv("SUMMARY_INGEST_WORKERS", 4))
+INGEST_FILE_TIMEOUT = float(os.getenv("SUMMARY_FILE_TIMEOUT", 60))
+
+# Record text sent to the summary model per call; records past it wait for the next one
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", 30000))
+
+# Stored records are immutable, so extractions are cached on disk for a long time.
+# Keys are "url:<url>|<etag>|<length>" (no download needed on a hit) and
+# "content:<sha256>" (fallback when the server sends neither header).
+_EXTRACTION_CACHE = CacheManager(
+    expiration_hours=float(os.getenv("EXTRACTION_CACHE_TTL_HOURS", 24 * 30)),
+    max_entries=int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 500)),
+    cache_dir=os.path.join(CACHE_DIR, 'extractions'),
+    max_disk_entries=int(os.getenv("EXTRACTION_CACHE_MAX_DISK_ENTRIES", 5000)),
+)
+_EXTRACTION_FAILURES = ("[Error extracting content]", "[Unknown File Type]")
+
+# Last summary per (signed-in user, patient) plus the fingerprints of the records it covered
+_SUMMARY_STATE = CacheManager(
+    expiration_hours=float(os.getenv("SUMMARY_STATE_TTL_HOURS", 24 * 30)),
+    max_entries=int(os.getenv("SUMMARY_STATE_MAX_ENTRIES", 500)),
+    cache_dir=os.path.join(CACHE_DIR, 'summaries'),
+    max_disk_entries=int(os.getenv("SUMMARY_STATE_MAX_DISK_ENTRIES", 5000)),
+)
+
+def _url_cache_key(url):
+    """Cheap HEAD request for a validator-based cache key, or None if the server gives no ETag/length."""
+    try:
+        response = requests.head(url, timeout=5, allow_redirects=True)
+        if response.status_code != 200:
+            return None
+        etag = response.headers.get('ETag', '')
+        length = response.headers.get('Content-Length', '')
+        if not etag and not length:
+            return None
+        return f"url:{url}|{etag}|{length}"
+    except Exception as e:
+        print(f"HEAD failed for {url}: {e}")
+        return None
+
 def download_file(url):
     try:
         response = requests.get(url, timeout=15)
@@ -37,6 +82,8 @@ def extract_text_from_file(file_stream, content_type, url):
             # Use VLM for Deep Analysis of Medical Images
             print(f"Analyzing Image with VLM: {url}")
             analysis = analyze_with_vlm(file_stream)
+            if analysis.get('error'):
+                return "[Error extracting content]"
             # Prefer digital_copy if available, else fallback to structured data
             content = analysis.get('digital_copy')
             if not content:
@@ -48,37 +95,171 @@ def extract_text_from_file(file_stream, content_type, url):
         print(f"Extraction Error for {url}: {e}")
         return "[Error extracting content]"
 
-def generate_medical_summary(texts=None, file_urls=None):
+def _ingest_file(url):
+    """Download and extract one record, returning (extracted_text, timing)."""
+    started = time.perf_counter()
+    timing = {"url": url, "status": "ok"}
+
+    url_key = _url_cache_key(url)
+    if url_key:
+        cached = _EXTRACTION_CACHE.get(url_key)
+        if cached is not None:
+            timing["status"] = "cached"
+            timing["download_ms"] = round((time.perf_counter() - started) * 1000)
+            return cached, timing
+
+    file_stream, content_type = download_file(url)
+    downloaded = time.perf_counter()
+    timing["download_ms"] = round((downloaded - started) * 1000)
+    if not file_stream:
+        timing["status"] = "download_failed"
+        return None, timing
+
+    content_key = f"content:{content_hash(file_stream.getvalue())}"
+    extracted = _EXTRACTION_CACHE.get(content_key)
+    if extracted is not None:
+        timing["status"] = "cached"
+    else:
+        extracted = extract_text_from_file(file_stream, content_type, url)
+        if extracted and extracted not in _EXTRACTION_FAILURES:
+            _EXTRACTION_CACHE.set(content_key, extracted)
+        else:
+            timing["status"] = "extraction_failed"
+    if url_key and extracted and extracted not in _EXTRACTION_FAILURES:
+        _EXTRACTION_CACHE.set(url_key, extracted)
+
+    timing["extract_ms"] = round((time.perf_counter() - downloaded) * 1000)
+    return extracted, timing
+
+def ingest_files(file_urls):
     """
-    Generates a medical summary from a list of text records AND deep analysis of file URLs.
+    Download and extract every file concurrently (bounded by SUMMARY_INGEST_WORKERS).
+
+    Returns (texts, timings), both in the order of `file_urls`; a file that yielded no
+    text has None in `texts`. All files share one
+    deadline, SUMMARY_FILE_TIMEOUT seconds after submission; any file not finished by
+    then is skipped and reported with status "timeout".
     """
-    if not CEREBRAS_API_KEY:
-        print("Error: CEREBRAS_API_KEY not found.")
-        return "AI Summary unavailable (Missing API Key)."
+    urls = [url for url in file_urls if url]
+    texts, timings = [], []
+    if not urls:
+        return texts, timings
+
+    print(f"Processing {len(urls)} files for deep summary...")
+    executor = ThreadPoolExecutor(max_workers=min(INGEST_MAX_WORKERS, len(urls)))
+    try:
+        futures = [executor.submit(_ingest_file, url) for url in urls]
+        done, _ = wait(futures, timeout=INGEST_FILE_TIMEOUT)
+        # Collect in input order so the combined text stays chronological
+        for url, future in zip(urls, futures):
+            if future not in done:
+                print(f"Ingestion timed out for {url}")
+                texts.append(None)
+                timings.append({"url": url, "status": "timeout"})
+                continue
+            try:
+                extracted, timing = future.result()
+            except Exception as e:
+                print(f"Ingestion failed for {url}: {e}")
+                extracted, timing = None, {"url": url, "status": "error"}
+            texts.append(extracted or None)
+            timings.append(timing)
+    finally:
+        # Do not block the request on stragglers that already timed out
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return texts, timings
+
+def _record_fingerprints(texts, file_urls):
+    """Stable fingerprints for inline texts (content hash) and stored files (URL hash)."""
+    text_fps = [f"text:{content_hash(text)}" for text in texts]
+    url_fps = [f"url:{content_hash(url)}" for url in file_urls]
+    return text_fps, url_fps
+
+def _combine_records(records):
+    """
+    Join (fingerprint, text) records into at most SUMMARY_MAX_CHARS of prompt text.
+    Returns (text, fingerprints of the records the model sees in full): records cut
+    off by the limit stay new for the next incremental summary. A single record longer
+    than the limit is sent truncated and counted as covered, or it would never be.
+    """
+    parts, summarised, used = [], [], 0
+    for fp, text in records:
+        if used + len(text) > SUMMARY_MAX_CHARS:
+            parts.append(text[:max(SUMMARY_MAX_CHARS - used, 0)] + "...(truncated)")
+            if not used and fp:
+                summarised.append(fp)
+            break
+        parts.append(text)
+        used += len(text) + 2
+        if fp:
+            summarised.append(fp)
+    return "\n\n".join(parts), summarised
+
+def _prepare_summary(texts, file_urls, file_timings, uid, patient_id, refresh):
+    """
+    Everything before the model call: incremental record selection and file
+    ingestion. Returns {"summary": ...} when no call is needed, otherwise the
+    prompt and the state to store once the summary is written.
+    """
+    texts = list(texts or [])
+    file_urls = file_urls_all = [url for url in (file_urls or []) if url]
+    text_fps, url_fps = _record_fingerprints(texts, file_urls)
+    # (fingerprint, text) per record; None for a file that failed or timed out, so it
+    # is retried next time rather than marked as covered
+    records = list(zip(text_fps, texts))
+
+    # Only kept for a verified user, so one caller cannot read another's summaries
+    state_key = f"summary:{uid}:{patient_id or uid}" if uid else None
+    previous = _SUMMARY_STATE.get(state_key) if state_key and not refresh else None
+    if previous:
+        covered = set(previous['fingerprints'])
+        records = [(fp, text) for fp, text in records if fp not in covered]
+        file_urls = [url for url, fp in zip(file_urls, url_fps) if fp not in covered]
+        if not records and not file_urls:
+            print(f"Summary for {patient_id}: no new records, reusing previous summary")
+            return {'summary': previous['summary']}
+        print(f"Summary for {patient_id}: {len(records) + len(file_urls)} new records since last summary")
 
-    texts = texts or []
-    
     # Process Files
     if file_urls:
-        print(f"Processing {len(file_urls)} files for deep summary...")
-        for url in file_urls:
-            if not url: continue
-            file_stream, content_type = download_file(url)
-            if file_stream:
-                extracted = extract_text_from_file(file_stream, content_type, url)
-                if extracted:
-                    texts.append(extracted)
-
-    if not texts:
-        return "No recent records available to summarize."
-
-    combined_text = "\n\n".join(texts)
-    
-    # Truncate if too long (Cerebras has large context, but safe limit)
-    if len(combined_text) > 30000:
-        combined_text = combined_text[:30000] + "...(truncated)"
+        file_texts, timings = ingest_files(file_urls)
+        if file_timings is not None:
+            file_timings.extend(timings)
+        url_fp = dict(zip(file_urls_all, url_fps))
+        for text, timing in zip(file_texts, timings):
+            if text:
+                covered = timing.get('status') in ('ok', 'cached')
+                records.append((url_fp[timing['url']] if covered else None, text))
+
+    if not records:
+        return {'summary': previous['summary'] if previous else "No recent records available to summarize."}
 
-    prompt = f"""
+    combined_text, summarised = _combine_records(records)
+
+    if previous:
+        prompt = f"""
+    You are an expert medical AI assistant. 
+    Below is the existing summary of a patient's medical history, followed by the contents (including OCR/VLM extracted text from images/PDFs) of records added since it was written.
+    Please rewrite it as a CONCISE, single-paragraph summary of their recent medical history that incorporates the new records.
+    
+    CRITICAL INSTRUCTIONS:
+    - Keep the important findings from the existing summary unless the new records supersede them.
+    - Identify main diagnoses, key trends (improving/worsening), and any critical alerts.
+    - If a new report shows abnormal values, mention them.
+    - Write in a professional, empathetic tone.
+    - Do NOT use bullet points.
+    
+    Existing Summary:
+    {previous['summary']}
+    
+    New Records Content:
+    {combined_text}
+    
+    Summary:
+    """
+    else:
+        prompt = f"""
     You are an expert medical AI assistant. 
     Below are the contents (including OCR/VLM extracted text from images/PDFs) of a patient's last few medical records.
     Please write a CONCISE, single-paragraph summary of their recent medical history based on these records.
@@ -96,22 +277,75 @@ def generate_medical_summary(texts=None, file_urls=None):
     Summary:
     """
 
+    fingerprints = set(summarised)
+    if previous:
+        fingerprints.update(previous['fingerprints'])
+    return {'prompt': prompt, 'state_key': state_key, 'fingerprints': sorted(fingerprints)}
+
+def _summary_request(prompt):
+    return {
+        "model": "llama-3.1-8b",
+        "messages": [
+            {"role": "system", "content": "You are a helpful medical assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 600,
+        "temperature": 0.7,
+        "top_p": 1,
+        "stream": False,
+    }
+
+def _store_summary(job, response):
+    summary = response.choices[0].message.content.strip()
+    if job['state_key']:
+        _SUMMARY_STATE.set(job['state_key'], {'summary': summary, 'fingerprints': job['fingerprints']})
+    return summary
+
+def generate_medical_summary(texts=None, file_urls=None, file_timings=None, uid=None, patient_id=None, refresh=False):
+    """
+    Generates a medical summary from a list of text records AND deep analysis of file URLs.
+    If `file_timings` is a list, per-file ingestion timings are appended to it.
+
+    With a verified `uid`, the summary and the fingerprints of the records it covered are
+    kept for that user (and `patient_id`, default their own records), and the next call
+    only feeds records not seen before together with the previous summary to the model
+    (`refresh=True` rebuilds from scratch).
+    """
+    if not CEREBRAS_API_KEY:
+        print("Error: CEREBRAS_API_KEY not found.")
+        return "AI Summary unavailable (Missing API Key)."
+
+    job = _prepare_summary(texts, file_urls, file_timings, uid, patient_id, refresh)
+    if 'summary' in job:
+        return job['summary']
+
     try:
-        client = Cerebras(api_key=CEREBRAS_API_KEY)
-        
-        response = client.chat.completions.create(
-            model="llama-3.1-8b",
-            messages=[
-                {"role": "system", "content": "You are a helpful medical assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=600,
-            temperature=0.7,
-            top_p=1,
-            stream=False
-        )
-        
-        return response.choices[0].message.content.strip()
+        client = get_llm({'cerebras': CEREBRAS_API_KEY})
+        response = client.chat.completions.create(**_summary_request(job['prompt']))
+        return _store_summary(job, response)
+    except Exception as e:
+        print(f"Cerebras API Error: {e}")
+        return "Unable to generate summary at this time."
+
+async def generate_medical_summary_async(texts=None, file_urls=None, file_timings=None, uid=None, patient_id=None,
+                                         refresh=False):
+    """
+    `generate_medical_summary` for the ASGI app. File ingestion keeps its thread
+    pool (downloads, PyMuPDF, VLM calls) and runs off the event loop; the summary
+    call itself is awaited.
+    """
+    if not CEREBRAS_API_KEY:
+        print("Error: CEREBRAS_API_KEY not found.")
+        return "AI Summary unavailable (Missing API Key)."
+
+    job = await asyncio.to_thread(_prepare_summary, texts, file_urls, file_timings, uid, patient_id, refresh)
+    if 'summary' in job:
+        return job['summary']
+
+    try:
+        client = get_async_llm({'cerebras': CEREBRAS_API_KEY})
+        response = await client.chat.completions.create(**_summary_request(job['prompt']))
+        return await asyncio.to_thread(_store_summary, job, response)
     except Exception as e:
         print(f"Cerebras API Error: {e}")
-        return "Unable to generate summary at this time."
\ No newline at end of file
+        return "Unable to generate summary at this time."
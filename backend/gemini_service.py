@@ -3,10 +3,18 @@ import json
 import google.generativeai as genai
 from datetime import datetime
 from dotenv import load_dotenv
+from utils.conversation_store import create_conversation_store
 
 # Load environment variables explicitly
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+def _chat_session_bytes(chat):
+    """Approximate memory held by a Gemini chat session's text history."""
+    try:
+        return sum(len(getattr(part, 'text', '') or '') for content in chat.history for part in content.parts)
+    except Exception:
+        return 0
+
 class GeminiHealthAssistant:
     def __init__(self):
         """Initialize Gemini 2.0 Flash for health assistance."""
@@ -45,8 +53,8 @@ class GeminiHealthAssistant:
             ]
         )
         
-        # Initialize conversation history
-        self.conversations = {}
+        # Chat sessions are live SDK objects, so they always stay in process memory
+        self.conversations = create_conversation_store(sizer=_chat_session_bytes, backend='memory')
     
     def load_disease_context(self):
         """Load current disease trends from cache."""
@@ -107,17 +115,17 @@ Remember: You are an informational assistant, not a replacement for professional
             if conversation_id is None:
                 conversation_id = f"conv_{datetime.now().timestamp()}"
             
-            if conversation_id not in self.conversations:
+            chat = self.conversations.get(conversation_id)
+            if chat is None:
                 # Start new conversation with system prompt
-                self.conversations[conversation_id] = self.model.start_chat(history=[])
+                chat = self.model.start_chat(history=[])
                 
                 # Send system prompt as first message
                 system_prompt = self.create_system_prompt()
-                self.conversations[conversation_id].send_message(
+                chat.send_message(
                     f"[SYSTEM CONTEXT - Do not respond to this, just acknowledge]\n{system_prompt}"
                 )
-            
-            chat = self.conversations[conversation_id]
+                self.conversations.create(conversation_id, chat)
             
             # Send user message and get response
             response = chat.send_message(user_message)
@@ -228,10 +236,7 @@ Remember: You are an informational assistant, not a replacement for professional
 
     def clear_conversation(self, conversation_id):
         """Clear a specific conversation history."""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
-            return True
-        return False
+        return self.conversations.delete(conversation_id)
 
 # Global singleton instance
 _health_assistant = None
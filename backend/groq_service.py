@@ -1,14 +1,24 @@
 import os
 import json
 import time
-import random
-from groq import Groq, RateLimitError, APIError
+import asyncio
+from groq import RateLimitError, APIError
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
+from utils.conversation_store import create_conversation_store
+from utils.llm_gateway import LLMGatewayError, get_async_llm, get_llm
+from utils.image_prep import prepare_image_for_vlm
+from utils.pdf_pages import is_pdf, map_concurrently, split_pdf_pages
 
 # Load environment variables explicitly
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+SUMMARY_MARKER = "CONVERSATION SUMMARY (earlier turns)"
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English Llama tokenizers)."""
+    return len(text or '') // 4 + 1
+
 class GroqHealthAssistant:
     def __init__(self):
         """Initialize Groq for health assistance."""
@@ -16,14 +26,21 @@ class GroqHealthAssistant:
         if not api_key:
             raise ValueError("GROQ_API_KEY not found in environment variables")
         
-        self.client = Groq(api_key=api_key)
+        # Shared gateway: routes to the fastest healthy provider for each model tier
+        self.client = get_llm()
+        self.async_client = get_async_llm()
         
         # Models
         self.MODEL_70B = "llama-3.3-70b-versatile"
         self.MODEL_8B = "llama-3.1-8b-instant"
         
-        # Initialize conversation history
-        self.conversations = {}
+        # Conversation history (bounded LRU/TTL store; the system prompt is not stored per conversation)
+        self.conversations = create_conversation_store()
+        
+        # History compaction: recent turns are sent verbatim within this budget,
+        # older turns are folded into a running summary written by the 8B model
+        self.history_token_budget = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', 3000))
+        self.history_keep_turns = int(os.getenv('CHAT_HISTORY_KEEP_TURNS', 8))
         
         # Cache disease context
         self.disease_context_cache = None
@@ -141,90 +158,233 @@ Current Date: {datetime.now(ist).strftime('%B %d, %Y')}
         # Default to 70B for everything else to be safe with clinical queries
         return self.MODEL_70B
 
-    def generate_response(self, user_message, conversation_id=None, medical_context=None):
-        """Generate response with retry logic and model fallback."""
+    def _prepare_conversation(self, user_message, conversation_id=None, medical_context=None):
+        """Create/extend the conversation history with the new user turn and return its id."""
         ist = timezone(timedelta(hours=5, minutes=30))
         
         # Create or get conversation
         if conversation_id is None:
             conversation_id = f"conv_{datetime.now(ist).timestamp()}"
         
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = [
-                {"role": "system", "content": self.create_system_prompt()}
-            ]
+        history = self.conversations.get(conversation_id) or []
+        new_messages = []
         
         # Inject medical context if provided and not already present
         if medical_context:
-            context_exists = any("PATIENT MEDICAL CONTEXT" in msg.get('content', '') for msg in self.conversations[conversation_id])
+            context_exists = any("PATIENT MEDICAL CONTEXT" in msg.get('content', '') for msg in history)
             if not context_exists:
-                self.conversations[conversation_id].append({
+                new_messages.append({
                     "role": "system", 
                     "content": f"PATIENT MEDICAL CONTEXT (Use this to personalized answers):\n{medical_context}"
                 })
         
         # Add user message to history
-        self.conversations[conversation_id].append({"role": "user", "content": user_message})
+        new_messages.append({"role": "user", "content": user_message})
+        self.conversations.append(conversation_id, *new_messages)
+        return conversation_id
+
+    def _summarize_turns(self, previous_summary, turns):
+        """Fold older turns (plus any earlier summary) into a short running summary using the 8B model."""
+        transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in turns)
+        prompt = f"""Update the running summary of a conversation between a patient and the Cure AI health assistant.
+
+Previous summary:
+{previous_summary or 'None'}
+
+New turns to fold in:
+{transcript}
+
+Write at most 150 words. Keep every symptom, condition, medication (with corrected brand names), dosage and piece of advice already given. Output only the summary."""
+
+        completion = self.client.chat.completions.create(
+            model=self.MODEL_8B,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=300,
+        )
+        return completion.choices[0].message.content.strip()
+
+    def _compact_history(self, conversation_id, history):
+        """
+        Keep the pinned system messages plus the most recent turns that fit the token budget.
+        Older turns are summarised once and written back to the store, so the summary is
+        reused (and extended) on later requests instead of resending the full transcript.
+        Only the `history` snapshot is replaced: turns appended while the summary was being
+        written are kept, and if another request compacted first this one's write is dropped.
+        """
+        summaries = [m for m in history if m['role'] == 'system' and m['content'].startswith(SUMMARY_MARKER)]
+        pinned = [m for m in history if m['role'] == 'system' and m not in summaries]
+        summary = summaries[-1]['content'][len(SUMMARY_MARKER) + 2:] if summaries else None
+        turns = [m for m in history if m['role'] != 'system']
+
+        if sum(estimate_tokens(m['content']) for m in turns) <= self.history_token_budget:
+            return history
+
+        # Newest turns first, until either limit is hit (the latest user turn is always kept)
+        recent = turns[-self.history_keep_turns:]
+        while len(recent) > 1 and sum(estimate_tokens(m['content']) for m in recent) > self.history_token_budget:
+            recent = recent[1:]
+        older = turns[:len(turns) - len(recent)]
+
+        try:
+            summary = self._summarize_turns(summary, older)
+        except Exception as e:
+            # Plain sliding window for this request; retry the summary next turn
+            print(f"History summary failed for {conversation_id}: {e}")
+            summary_messages = [{"role": "system", "content": f"{SUMMARY_MARKER}:\n{summary}"}] if summary else []
+            return pinned + summary_messages + recent
+
+        compacted = pinned + [{"role": "system", "content": f"{SUMMARY_MARKER}:\n{summary}"}] + recent
+        if self.conversations.replace_prefix(conversation_id, history, compacted):
+            print(f"[Chat] {conversation_id}: folded {len(older)} older messages into summary")
+        else:
+            print(f"[Chat] {conversation_id}: history changed during compaction, summary not stored")
+        return compacted
+
+    def _build_messages(self, conversation_id):
+        """System prompt followed by the (compacted) conversation history."""
+        history = self.conversations.get(conversation_id) or []
+        history = self._compact_history(conversation_id, history)
+        messages = [{"role": "system", "content": self.create_system_prompt()}] + history
+
+        prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+        print(f"[Chat] {conversation_id}: ~{prompt_tokens} prompt tokens across {len(messages)} messages")
+        return messages
+
+    def _reply_request(self, model, messages, stream=False):
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 1024, # Increased for detailed Feedback AI responses
+            "top_p": 1,
+            "stream": stream,
+        }
+
+    def _reply_success(self, conversation_id, response_text):
+        # Add AI response to history
+        self.conversations.append(conversation_id, {"role": "assistant", "content": response_text})
         
-        # Determine initial model
-        target_model = self._determine_model(user_message)
+        return {
+            'success': True,
+            'response': response_text,
+            'conversation_id': conversation_id,
+            'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        }
+
+    @staticmethod
+    def _reply_failure(conversation_id, error, partial=""):
+        return {
+            'success': False,
+            # Return user-friendly message, log the real error
+            'error': str(error),
+            'response': partial or "CureBird is thinking, Please try again.",
+            'conversation_id': conversation_id
+        }
+
+    def _reply_models(self, target_model):
+        """
+        Models to try in order. The gateway already fails over within a tier, so the
+        only step here is 70B -> 8B once the whole large tier is unavailable.
+        """
+        if target_model == self.MODEL_70B:
+            return [target_model, self.MODEL_8B]
+        return [target_model]
+
+    def generate_response(self, user_message, conversation_id=None, medical_context=None):
+        """Generate a response, falling back from the 70B to the 8B tier."""
+        conversation_id = self._prepare_conversation(user_message, conversation_id, medical_context)
         
-        # Retry logic parameters
-        max_retries = 3
-        base_delay = 1 # seconds
+        messages = self._build_messages(conversation_id)
+        models = self._reply_models(self._determine_model(user_message))
         
-        for attempt in range(max_retries + 1):
+        for target_model in models:
             try:
-                completion = self.client.chat.completions.create(
-                    model=target_model,
-                    messages=self.conversations[conversation_id],
-                    temperature=0.7,
-                    max_tokens=1024, # Increased for detailed Feedback AI responses
-                    top_p=1,
-                    stream=False,
-                )
-                
-                response_text = completion.choices[0].message.content
-                
-                # Add AI response to history
-                self.conversations[conversation_id].append({"role": "assistant", "content": response_text})
-                
-                return {
-                    'success': True,
-                    'response': response_text,
-                    'conversation_id': conversation_id,
-                    'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-                }
+                completion = self.client.chat.completions.create(**self._reply_request(target_model, messages))
+                return self._reply_success(conversation_id, completion.choices[0].message.content)
             
-            except (RateLimitError, APIError) as e:
-                print(f"[Attempt {attempt+1}] Error with model {target_model}: {e}")
-                
-                # If we hit a rate limit or error on 70B, switch to 8B for the next attempt
-                if target_model == self.MODEL_70B:
-                    print("Switching to fallback model (8B)...")
-                    target_model = self.MODEL_8B
-                
-                if attempt < max_retries:
-                    sleep_time = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(sleep_time)
-                else:
-                    # Final failure
-                    print("Max retries reached.")
-                    return {
-                        'success': False,
-                        # Return user-friendly message, log the real error above
-                        'error': str(e), 
-                        'response': "CureBird is thinking, Please try again.",
-                        'conversation_id': conversation_id
-                    }
+            except (RateLimitError, APIError, LLMGatewayError) as e:
+                print(f"Error with model {target_model}: {e}")
+                if target_model == models[-1]:
+                    return self._reply_failure(conversation_id, e)
+                print("Switching to fallback model (8B)...")
             except Exception as e:
                 print(f"Unexpected error: {e}")
-                return {
-                    'success': False,
-                    'error': str(e),
-                    'response': "CureBird is thinking, Please try again.",
-                    'conversation_id': conversation_id
-                }
+                return self._reply_failure(conversation_id, e)
+
+    async def agenerate_response(self, user_message, conversation_id=None, medical_context=None):
+        """
+        `generate_response` for the ASGI app: the model call is awaited on the event
+        loop; the conversation store and history compaction (which may call the
+        summariser) run in a worker thread.
+        """
+        conversation_id = await asyncio.to_thread(
+            self._prepare_conversation, user_message, conversation_id, medical_context
+        )
+        messages = await asyncio.to_thread(self._build_messages, conversation_id)
+        models = self._reply_models(self._determine_model(user_message))
+
+        for target_model in models:
+            try:
+                completion = await self.async_client.chat.completions.create(
+                    **self._reply_request(target_model, messages)
+                )
+                return await asyncio.to_thread(
+                    self._reply_success, conversation_id, completion.choices[0].message.content
+                )
+
+            except (RateLimitError, APIError, LLMGatewayError) as e:
+                print(f"Error with model {target_model}: {e}")
+                if target_model == models[-1]:
+                    return self._reply_failure(conversation_id, e)
+                print("Switching to fallback model (8B)...")
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+                return self._reply_failure(conversation_id, e)
+
+    def generate_response_stream(self, user_message, conversation_id=None, medical_context=None):
+        """
+        Streaming variant of `generate_response`.
+
+        Yields `(event, payload)` tuples: "start" with the conversation id, one "delta"
+        per token chunk, then "done" with the same dict `generate_response` returns.
+        A failure before the first token falls back from 70B to 8B; a failure
+        mid-stream ends with an "error" event since the partial reply has already
+        been sent.
+        """
+        conversation_id = self._prepare_conversation(user_message, conversation_id, medical_context)
+        yield "start", {'conversation_id': conversation_id}
+
+        messages = self._build_messages(conversation_id)
+        models = self._reply_models(self._determine_model(user_message))
+
+        for target_model in models:
+            parts = []
+            try:
+                stream = self.client.chat.completions.create(**self._reply_request(target_model, messages, stream=True))
+
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield "delta", {'text': delta}
+
+                yield "done", self._reply_success(conversation_id, "".join(parts))
+                return
+
+            except Exception as e:
+                print(f"Stream error with model {target_model}: {e}")
+                retryable = isinstance(e, (RateLimitError, APIError, LLMGatewayError)) and not parts
+
+                if retryable and target_model != models[-1]:
+                    print("Switching to fallback model (8B)...")
+                    continue
+
+                yield "error", {'error': str(e)}
+                yield "done", self._reply_failure(conversation_id, e, "".join(parts))
+                return
 
     def get_disease_context(self):
         """Get formatted disease context for frontend display."""
@@ -259,23 +419,16 @@ Current Date: {datetime.now(ist).strftime('%B %d, %Y')}
     
     def clear_conversation(self, conversation_id):
         """Clear a specific conversation history."""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
-            return True
-        return False
+        return self.conversations.delete(conversation_id)
 
-    def analyze_disease_progress(self, disease_name, metrics):
-        """
-        Generate a dual-view insight (Patient vs Doctor) for a specific disease trend.
-        Uses 70B model for clinical accuracy.
-        """
-        try:
-            # Format metrics for prompt
-            metrics_str = "Recent Readings:\n"
-            for m in metrics[:10]: # Limit to last 10
-                 metrics_str += f"- {m.get('value')} {m.get('unit')} on {m.get('timestamp')}\n"
+    def _disease_progress_request(self, disease_name, metrics):
+        """Chat completion arguments for `analyze_disease_progress`."""
+        # Format metrics for prompt
+        metrics_str = "Recent Readings:\n"
+        for m in metrics[:10]: # Limit to last 10
+             metrics_str += f"- {m.get('value')} {m.get('unit')} on {m.get('timestamp')}\n"
 
-            system_prompt = """You are an expert Medical AI Assistant. 
+        system_prompt = """You are an expert Medical AI Assistant. 
 Your task is to analyze disease progression data and output a JSON response.
 Do NOT output markdown. Output ONLY valid JSON in the following format:
 {
@@ -297,20 +450,38 @@ CRITICAL SAFETY:
 - Do NOT sugest changing medication dosages.
 - If data is critical/dangerous, advise immediate doctor consult.
 """
-            
-            user_prompt = f"Analyze progress for Condition: {disease_name}.\n{metrics_str}"
+        
+        user_prompt = f"Analyze progress for Condition: {disease_name}.\n{metrics_str}"
 
-            completion = self.client.chat.completions.create(
-                model=self.MODEL_70B,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.5,
-                max_tokens=500,
-                response_format={"type": "json_object"} 
-            )
-            
+        return {
+            "model": self.MODEL_70B,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.5,
+            "max_tokens": 500,
+            "response_format": {"type": "json_object"},
+        }
+
+    def analyze_disease_progress(self, disease_name, metrics):
+        """
+        Generate a dual-view insight (Patient vs Doctor) for a specific disease trend.
+        Uses 70B model for clinical accuracy.
+        """
+        try:
+            completion = self.client.chat.completions.create(**self._disease_progress_request(disease_name, metrics))
+            return json.loads(completion.choices[0].message.content)
+
+        except Exception as e:
+            print(f"Disease Analysis Error: {e}")
+            raise e
+
+    async def analyze_disease_progress_async(self, disease_name, metrics):
+        """`analyze_disease_progress` for the ASGI app."""
+        try:
+            request = self._disease_progress_request(disease_name, metrics)
+            completion = await self.async_client.chat.completions.create(**request)
             return json.loads(completion.choices[0].message.content)
 
         except Exception as e:
@@ -320,36 +491,29 @@ CRITICAL SAFETY:
     def analyze_clinical_document(self, file_stream):
         """
         Analyze a clinical document/image and extract structured metrics.
-        Uses Llama 3.2 90B Vision for high precision extraction.
+        Uses Llama 3.2 90B Vision for high precision extraction; PDFs are read
+        page by page (see `_analyze_clinical_pdf`).
         """
         try:
-            import base64
-            import mimetypes
-            
-            # Determine mime type
-            # file_stream is likely a SpooledTemporaryFile from Flask
-            # We can't easily get the filename usage here unless passed, 
-            # so we'll try to guess or read header, but simplest is to assume common formats
-            # or pass filename from route.
-            # For now, let's just peek? No, simple hack:
-            # Most safe bet for APIs is often accepting generic or specific.
-            # Let's try to detect from the stream if possible or just use image/jpeg as most robust default 
-            # BUT if input is PNG, explicit png mime is better.
-            
-            # Let's default to jpeg but if it fails we might need better handling.
-            # Actually, standard way is:
-            mime_type = "image/jpeg" # Default
-            
-            # Encode image
             file_stream.seek(0)
             file_bytes = file_stream.read()
-            base64_image = base64.b64encode(file_bytes).decode('utf-8')
-            
-            # Simple magic number check for PNG
-            if file_bytes.startswith(b'\x89PNG'):
-                mime_type = "image/png"
-            
-            system_prompt = """You are an expert Clinical Data Extractor.
+            if is_pdf(file_bytes):
+                return self._analyze_clinical_pdf(file_bytes)
+            return self._extract_clinical_metrics(image_bytes=file_bytes)
+
+        except Exception as e:
+            print(f"Groq Extraction Error: {e}")
+            return {
+                "error": str(e),
+                "test_results": [],
+                "summary": "Failed to extract data."
+            }
+
+    def _extract_clinical_metrics(self, image_bytes=None, text=None):
+        """One extraction call: the vision model for an image, the 8B model for text we already have."""
+        import base64
+
+        system_prompt = """You are an expert Clinical Data Extractor.
             Your job is to extract quantitative medical test results from lab reports with 100% precision.
             
             Extract the following in strict JSON format:
@@ -373,34 +537,76 @@ CRITICAL SAFETY:
             3. Ignore descriptive text, focus on the table of results.
             4. Output ONLY valid JSON.
             """
-            
-            user_prompt = "Extract data from this medical report image."
-            
-            completion = self.client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": system_prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
-                        ]
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=2048,
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(completion.choices[0].message.content)
+        
+        if text is not None:
+            model = self.MODEL_8B
+            content = f"{system_prompt}\n\nExtract data from this medical report text:\n\n{text[:20000]}"
+            payload_note = f"{len(text)} chars of text"
+        else:
+            # Downscale/re-encode before upload; the helper reports the mime type it
+            # produced (or sniffs the original's when it passes the bytes through)
+            image_bytes, mime_type, prep = prepare_image_for_vlm(image_bytes)
+            base64_image = base64.b64encode(image_bytes).decode('utf-8')
+            model = "meta-llama/llama-4-scout-17b-16e-instruct"
+            content = [
+                {"type": "text", "text": system_prompt},
+                {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+            ]
+            payload_note = f"{len(base64_image) / 1024:.0f} KB payload (original {prep['original_bytes'] / 1024:.0f} KB)"
+        
+        call_start = time.time()
+        completion = self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            temperature=0.1,
+            max_tokens=2048,
+            response_format={"type": "json_object"}
+        )
+        print(f"[VLM] clinical document: {payload_note}, call took {time.time() - call_start:.2f}s")
+        return json.loads(completion.choices[0].message.content)
 
-        except Exception as e:
-            print(f"Groq Extraction Error: {e}")
-            return {
-                "error": str(e),
-                "test_results": [],
-                "summary": "Failed to extract data."
-            }
+    def _analyze_clinical_pdf(self, pdf_bytes):
+        """
+        Text-layer pages are extracted together in one text call; pages without a
+        text layer are rasterised and sent to the vision model concurrently. Results
+        are merged in page order.
+        """
+        pages = split_pdf_pages(pdf_bytes)
+        text_pages = [page for page in pages if page['text']]
+        jobs = []
+        if text_pages:
+            text = "\n\n".join(f"--- Page {page['page']} ---\n{page['text']}" for page in text_pages)
+            jobs.append((text_pages[0]['page'], lambda: self._extract_clinical_metrics(text=text)))
+        for page in pages:
+            if page['image']:
+                jobs.append((page['page'], lambda image=page['image']: self._extract_clinical_metrics(image_bytes=image)))
+        jobs.sort(key=lambda job: job[0])
+
+        def run(job):
+            try:
+                return job[1]()
+            except Exception as e:
+                print(f"Groq Extraction Error (page {job[0]}): {e}")
+                return {"error": str(e)}
+
+        parts = [part for part in map_concurrently(run, jobs) if not part.get('error')]
+        if not parts:
+            raise ValueError("No pages of the PDF could be analysed")
+
+        seen = set()
+        test_results = []
+        for part in parts:
+            for result in part.get('test_results', []):
+                marker = json.dumps(result, sort_keys=True)
+                if marker not in seen:
+                    seen.add(marker)
+                    test_results.append(result)
+        return {
+            "date": next((part['date'] for part in parts if part.get('date')), None),
+            "patient_name": next((part['patient_name'] for part in parts if part.get('patient_name')), ""),
+            "test_results": test_results,
+            "summary": " ".join(part['summary'] for part in parts if part.get('summary')),
+        }
 
 # Global singleton instance
 _health_assistant = None
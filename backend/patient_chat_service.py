@@ -1,11 +1,13 @@
 import os
 import json
-from groq import Groq
+from utils.llm_gateway import get_async_llm, get_llm
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+_FALLBACK_REPLY = "I'm sorry, I didn't verify that properly. Could you repeat it?"
+
 class PatientPersonaService:
     def __init__(self):
         """Initialize Groq for Patient Roleplay."""
@@ -14,27 +16,18 @@ class PatientPersonaService:
             # Fallback or error - relying on the one in .env
             print("Warning: GROQ_API_KEY not found in environment for Patient Service")
         
-        self.client = Groq(api_key=api_key)
+        self.client = get_llm()
+        self.async_client = get_async_llm()
         self.MODEL = "llama-3.1-8b-instant" # Fast, efficient model for chat
 
-    def generate_patient_reply(self, history, patient_context):
-        """
-        Generate a reply from the patient's perspective.
-        
-        Args:
-            history (list): List of message objects {sender: 'doctor'|'patient', text: '...'}
-            patient_context (dict): {patient: 'Name', age: 34, condition: '...', status: '...'}
+    def _build_request(self, history, patient_context):
+        """Chat completion arguments for the patient's next reply."""
+        # 1. Construct System Prompt
+        name = patient_context.get('patient', 'Patient')
+        condition = patient_context.get('condition', 'Unknown Condition')
+        age = patient_context.get('age', 'Unknown Age') # Might not be in context, assume generic if missing
         
-        Returns:
-            str: The patient's reply.
-        """
-        try:
-            # 1. Construct System Prompt
-            name = patient_context.get('patient', 'Patient')
-            condition = patient_context.get('condition', 'Unknown Condition')
-            age = patient_context.get('age', 'Unknown Age') # Might not be in context, assume generic if missing
-            
-            system_prompt = f"""You are {name}, a patient with {condition}. 
+        system_prompt = f"""You are {name}, a patient with {condition}. 
 You are chatting with your doctor on a secure messaging app.
 Current Context: You are {patient_context.get('status', 'stable')}.
 
@@ -47,32 +40,55 @@ ROLEPLAY RULES:
 - You are NOT a medical expert. You are the patient.
 """
 
-            # 2. Build Message Chain
-            formatted_messages = [
-                {"role": "system", "content": system_prompt}
-            ]
-            
-            for msg in history:
-                role = "user" if msg.get('sender') == 'doctor' else "assistant"
-                content = msg.get('text', '')
-                if content:
-                    formatted_messages.append({"role": role, "content": content})
+        # 2. Build Message Chain
+        formatted_messages = [
+            {"role": "system", "content": system_prompt}
+        ]
+        
+        for msg in history:
+            role = "user" if msg.get('sender') == 'doctor' else "assistant"
+            content = msg.get('text', '')
+            if content:
+                formatted_messages.append({"role": role, "content": content})
+
+        return {
+            "model": self.MODEL,
+            "messages": formatted_messages,
+            "temperature": 0.7, # Slightly creative for variations
+            "max_tokens": 150,
+            "top_p": 1,
+            "stream": False,
+        }
 
+    def generate_patient_reply(self, history, patient_context):
+        """
+        Generate a reply from the patient's perspective.
+        
+        Args:
+            history (list): List of message objects {sender: 'doctor'|'patient', text: '...'}
+            patient_context (dict): {patient: 'Name', age: 34, condition: '...', status: '...'}
+        
+        Returns:
+            str: The patient's reply.
+        """
+        try:
             # 3. Call LLM
-            completion = self.client.chat.completions.create(
-                model=self.MODEL,
-                messages=formatted_messages,
-                temperature=0.7, # Slightly creative for variations
-                max_tokens=150,
-                top_p=1,
-                stream=False,
-            )
-            
+            completion = self.client.chat.completions.create(**self._build_request(history, patient_context))
+            return completion.choices[0].message.content.strip()
+
+        except Exception as e:
+            print(f"Error generating patient reply: {e}")
+            return _FALLBACK_REPLY
+
+    async def agenerate_patient_reply(self, history, patient_context):
+        """`generate_patient_reply` for the ASGI app, awaiting the async gateway."""
+        try:
+            completion = await self.async_client.chat.completions.create(**self._build_request(history, patient_context))
             return completion.choices[0].message.content.strip()
 
         except Exception as e:
             print(f"Error generating patient reply: {e}")
-            return "I'm sorry, I didn't verify that properly. Could you repeat it?"
+            return _FALLBACK_REPLY
 
 # Singleton Pattern
 _patient_service = None
@@ -0,0 +1,90 @@
+"""
+Analyzer result caching: what is served from `_ANALYZER_CACHE` and what is retried.
+
+Usage (from backend/):
+    python -m pytest -q tests
+"""
+import asyncio
+from io import BytesIO
+
+import pytest
+
+import app.services as services
+from utils.cache_manager import CacheManager
+from utils.llm_gateway import FakeProvider, LLMGateway
+
+EXTRACTION = {
+    'is_medical': True,
+    'document_type': 'prescription',
+    'diseases': ['Hypertension'],
+    'medications': [{'name': 'Amlodipin', 'dosage': '5mg', 'frequency': 'OD'}],
+    'test_results': [],
+}
+AUDIT = '{"diseases": [{"corrected": "Hypertension"}], "medicines": [{"input": "Amlodipin", "corrected": "Amlodipine", "valid_for_disease": true}], "warnings": []}'
+
+
+def is_audit(messages):
+    return 'AUDIT THIS EXTRACTION' in messages[-1]['content']
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    """Offline analyzer whose first Core 2 call fails; returns the fake provider."""
+    state = {'audits': 0}
+
+    def reply(model, messages):
+        if is_audit(messages):
+            state['audits'] += 1
+            if state['audits'] == 1:
+                raise RuntimeError('audit unavailable')
+            return AUDIT
+        return 'summary'
+
+    fake = FakeProvider('groq', reply=reply)
+    gateway = LLMGateway(providers={'groq': fake})
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    monkeypatch.setattr(services, '_ANALYZER_CACHE', CacheManager())
+    monkeypatch.setattr(services, '_DRUG_INDEX', None)
+    monkeypatch.setattr(services, '_MEDICINE_LOOKUP', None)
+    monkeypatch.setattr(services, 'get_llm', gateway.client)
+    monkeypatch.setattr(services, 'get_async_llm', gateway.async_client)
+    monkeypatch.setattr(services, 'analyze_document', lambda *args, **kwargs: dict(EXTRACTION))
+
+    async def analyze_document_async(*args, **kwargs):
+        return dict(EXTRACTION)
+
+    monkeypatch.setattr(services, 'analyze_document_async', analyze_document_async)
+    return fake
+
+
+def audit_calls(fake):
+    return sum(is_audit(call['messages']) for call in fake.calls)
+
+
+def test_failed_verification_is_retried_on_next_upload(analyzer):
+    first = services.analyze_comprehensive(BytesIO(b'scan'))
+    assert first['analysis']['medications'][0]['name'] == 'Amlodipin'
+    assert audit_calls(analyzer) == 1
+
+    second = services.analyze_comprehensive(BytesIO(b'scan'))
+    assert second['analysis']['medications'][0]['name'] == 'Amlodipine'
+    assert audit_calls(analyzer) == 2
+
+    # Verified now, so the whole result is served from the cache
+    services.analyze_comprehensive(BytesIO(b'scan'))
+    assert audit_calls(analyzer) == 2
+
+
+def test_failed_verification_is_retried_on_next_stream(analyzer):
+    for _ in services.analyze_comprehensive_stream(BytesIO(b'scan')):
+        pass
+    done = dict(services.analyze_comprehensive_stream(BytesIO(b'scan')))['done']
+    assert done['analysis']['medications'][0]['name'] == 'Amlodipine'
+    assert audit_calls(analyzer) == 2
+
+
+def test_failed_verification_is_retried_async(analyzer):
+    asyncio.run(services.analyze_comprehensive_async(b'scan'))
+    second = asyncio.run(services.analyze_comprehensive_async(b'scan'))
+    assert second['analysis']['medications'][0]['name'] == 'Amlodipine'
+    assert audit_calls(analyzer) == 2
@@ -0,0 +1,27 @@
+"""
+CacheManager memory and disk tiers.
+
+Usage (from backend/):
+    python -m pytest -q tests
+"""
+import os
+
+from utils.cache_manager import CacheManager
+
+
+def test_delete_removes_disk_only_entry(tmp_path):
+    CacheManager(cache_dir=str(tmp_path)).set('report', {'ok': True})
+    # A fresh instance (another worker, or after a restart) has the entry on disk only
+    cache = CacheManager(cache_dir=str(tmp_path))
+    assert cache.delete('report') is True
+    assert os.listdir(tmp_path) == []
+    assert cache.get('report') is None
+    assert cache.delete('report') is False
+
+
+def test_disk_tier_is_pruned_to_its_bound(tmp_path):
+    cache = CacheManager(cache_dir=str(tmp_path), max_disk_entries=10)
+    for i in range(50):
+        cache.set(f'key{i}', i)
+    assert len(os.listdir(tmp_path)) <= 10
+    assert CacheManager(cache_dir=str(tmp_path)).get('key49') == 49
@@ -0,0 +1,135 @@
+"""
+Routing, failover and circuit-breaker behaviour of the LLM gateway, against FakeProvider.
+
+Usage (from backend/):
+    python -m pytest -q tests
+"""
+import asyncio
+
+import pytest
+
+import utils.llm_gateway as gateway_module
+from utils.llm_gateway import FakeProvider, LLMGateway, LLMGatewayError
+
+TIERS = {'large': [('primary', 'big-a'), ('secondary', 'big-b')]}
+
+
+class ClientError(Exception):
+    status_code = 400
+
+
+def make_gateway(primary_fail=False, explore_rate=0):
+    providers = {
+        'primary': FakeProvider('primary', reply='from primary', fail=primary_fail),
+        'secondary': FakeProvider('secondary', reply='from secondary'),
+    }
+    return LLMGateway(providers=providers, tiers=TIERS, explore_rate=explore_rate), providers
+
+
+def reply(completion):
+    return completion.choices[0].message.content
+
+
+def test_unknown_model_goes_to_primary_provider():
+    gateway, providers = make_gateway()
+    result = gateway.complete('custom-override-model', [{'role': 'user', 'content': 'hi'}])
+    assert reply(result) == 'from primary'
+    assert providers['primary'].calls[0]['model'] == 'custom-override-model'
+    assert providers['secondary'].calls == []
+
+
+def test_cold_start_keeps_configured_order():
+    gateway, providers = make_gateway()
+    for _ in range(gateway_module.LLM_GATEWAY_MIN_SAMPLES + 2):
+        assert reply(gateway.complete('large', [])) == 'from primary'
+    assert providers['secondary'].calls == []
+
+
+def test_measured_candidates_are_ranked_by_latency(monkeypatch):
+    monkeypatch.setattr(gateway_module, 'LLM_GATEWAY_MIN_SAMPLES', 2)
+    gateway, providers = make_gateway()
+    for _ in range(2):
+        gateway._health_for('primary', 'big-a').record(0.5, True)
+        gateway._health_for('secondary', 'big-b').record(0.1, True)
+    assert reply(gateway.complete('large', [])) == 'from secondary'
+
+
+def test_exploration_probes_unmeasured_candidate(monkeypatch):
+    monkeypatch.setattr(gateway_module, 'LLM_GATEWAY_MIN_SAMPLES', 1)
+    gateway, providers = make_gateway(explore_rate=1.0)
+    # Nothing measured yet: no exploration, the primary goes first
+    assert reply(gateway.complete('large', [])) == 'from primary'
+    # Primary measured: the unmeasured secondary gets the probe
+    assert reply(gateway.complete('large', [])) == 'from secondary'
+
+
+def test_fails_over_to_next_tier_member():
+    gateway, providers = make_gateway(primary_fail=True)
+    assert reply(gateway.complete('large', [])) == 'from secondary'
+    assert reply(gateway.complete('big-a', [])) == 'from secondary'
+    assert gateway.stats()['large']['primary/big-a']['error_rate'] == 1.0
+
+
+def test_breaker_opens_then_half_opens_after_cooldown(monkeypatch):
+    monkeypatch.setattr(gateway_module, 'LLM_BREAKER_FAILURES', 2)
+    monkeypatch.setattr(gateway_module, 'LLM_BREAKER_COOLDOWN', 60)
+    clock = [1000.0]
+    monkeypatch.setattr(gateway_module.time, 'time', lambda: clock[0])
+    gateway, providers = make_gateway(primary_fail=True)
+
+    for _ in range(2):
+        gateway.complete('large', [])
+    assert len(providers['primary'].calls) == 2
+    assert gateway.stats()['large']['primary/big-a']['breaker'] == 'open'
+
+    # Open: the failing model is skipped entirely
+    gateway.complete('large', [])
+    assert len(providers['primary'].calls) == 2
+
+    # Half-open after the cooldown: one trial call, which closes the breaker on success
+    clock[0] += 61
+    providers['primary'].fail = False
+    assert reply(gateway.complete('large', [])) == 'from primary'
+    assert gateway.stats()['large']['primary/big-a']['breaker'] == 'closed'
+
+
+def test_failed_trial_reopens_breaker(monkeypatch):
+    monkeypatch.setattr(gateway_module, 'LLM_BREAKER_FAILURES', 1)
+    monkeypatch.setattr(gateway_module, 'LLM_BREAKER_COOLDOWN', 60)
+    clock = [1000.0]
+    monkeypatch.setattr(gateway_module.time, 'time', lambda: clock[0])
+    gateway, providers = make_gateway(primary_fail=True)
+
+    gateway.complete('large', [])
+    clock[0] += 61
+    gateway.complete('large', [])
+    assert len(providers['primary'].calls) == 2
+    assert gateway.stats()['large']['primary/big-a']['breaker'] == 'open'
+
+
+def test_client_errors_are_raised_without_failover():
+    gateway, providers = make_gateway(primary_fail=ClientError('bad request'))
+    with pytest.raises(ClientError):
+        gateway.complete('large', [])
+    assert providers['secondary'].calls == []
+    assert gateway.stats()['large']['primary/big-a']['samples'] == 0
+
+
+def test_all_candidates_failing_raises_gateway_error():
+    gateway, providers = make_gateway(primary_fail=True)
+    providers['secondary'].fail = True
+    with pytest.raises(LLMGatewayError):
+        gateway.complete('large', [])
+
+
+def test_stream_fails_over_before_first_chunk():
+    gateway, _ = make_gateway(primary_fail=True)
+    chunks = gateway.complete('large', [], stream=True)
+    assert ''.join(chunk.choices[0].delta.content for chunk in chunks).strip() == 'from secondary'
+
+
+def test_async_client_fails_over():
+    gateway, providers = make_gateway(primary_fail=True)
+    result = asyncio.run(gateway.async_client().chat.completions.create(model='large', messages=[]))
+    assert reply(result) == 'from secondary'
+    assert len(providers['primary'].calls) == 1
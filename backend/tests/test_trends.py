@@ -0,0 +1,29 @@
+"""
+/api/disease-trends rows: values must serialise exactly as the per-row implementation did.
+
+Usage (from backend/):
+    python -m pytest -q tests
+"""
+import json
+
+from app.services import build_trends_table
+
+
+def history(row):
+    return json.dumps([entry['count'] for entry in row['history']])
+
+
+def test_metric_parsing_matches_previous_json():
+    rows = build_trends_table({'diseases': [
+        {'name': 'Dengue', 'metrics': {'weekly_reported_cases': '45,600 cases'}},
+        {'name': 'Malaria', 'metrics': {'weekly_reported_cases': '1200'}},
+        {'name': 'Typhoid', 'metrics': {'weekly_reported_cases': 'not reported'}},
+        {'name': 'Diabetes', 'metrics': {'weekly_reported_cases': 0, 'prevalence': None}},
+        {'name': 'Asthma', 'metrics': {}},
+    ]})
+    assert history(rows[0]) == '[41040.0, 43320.0, 47880.0, 44688.0, 45600.0]'
+    assert history(rows[1]) == '[1080.0, 1140.0, 1260.0, 1176.0, 1200.0]'
+    # Unparsable counts were the int 0
+    assert history(rows[2]) == '[0.0, 0.0, 0.0, 0.0, 0]'
+    assert rows[3]['outbreaks'] is None and history(rows[3]).endswith(', 0]')
+    assert rows[4]['outbreaks'] == 0 and history(rows[4]).endswith(', 0.0]')
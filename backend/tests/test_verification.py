@@ -0,0 +1,82 @@
+"""
+Core 2 (Feedback AI) verification, with and without the learnt drug index.
+
+Usage (from backend/):
+    python -m pytest -q tests
+"""
+import json
+
+import pytest
+
+import app.services as services
+from utils.llm_gateway import FakeProvider, LLMGateway
+
+EXTRACTION = {
+    'is_medical': True,
+    'document_type': 'prescription',
+    'diseases': ['Hypertensoin'],
+    'medications': [{'name': 'Stamol', 'dosage': '5mg', 'frequency': 'OD'}],
+}
+AUDIT = {
+    'diseases': [{'input': 'Hypertensoin', 'corrected': 'Hypertension'}],
+    'medicines': [{'input': 'Stamlo', 'corrected': 'Stamlo', 'valid_for_disease': False, 'alternatives': []}],
+    'warnings': ['Check blood pressure weekly'],
+}
+
+
+class KnownDrugs:
+    """Drug index that trusts one correction and records what it is taught."""
+
+    def __init__(self):
+        self.learned = []
+
+    def lookup(self, raw):
+        if raw.lower() == 'stamol':
+            return {'corrected': 'Stamlo', 'alternatives': ['Amlokind', 'Amlopres'], 'confidence': 0.97}
+        return None
+
+    def learn(self, medicines):
+        self.learned.extend(medicines)
+
+
+@pytest.fixture
+def audit(monkeypatch):
+    fake = FakeProvider('groq', reply=json.dumps(AUDIT))
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    monkeypatch.setattr(services, '_MEDICINE_LOOKUP', None)
+    monkeypatch.setattr(services, 'get_llm', LLMGateway(providers={'groq': fake}).client)
+    return fake
+
+
+def test_known_drugs_still_get_a_clinical_audit(audit, monkeypatch):
+    index = KnownDrugs()
+    monkeypatch.setattr(services, '_DRUG_INDEX', index)
+
+    verified = services.verify_and_correct_medical_data(dict(EXTRACTION))
+
+    assert len(audit.calls) == 1
+    assert 'Medication names are already verified' in audit.calls[0]['messages'][-1]['content']
+    assert '"Stamlo"' in audit.calls[0]['messages'][-1]['content']
+    med = verified['medications'][0]
+    assert (med['name'], med['alternatives'], med['is_corrected']) == ('Stamlo', ['Amlokind', 'Amlopres'], True)
+    assert med['valid'] is False
+    assert verified['diseases'] == ['Hypertension']
+    assert verified['warnings'] == ['Check blood pressure weekly']
+    assert verified['validity_assessed'] is True
+    # The index is not taught its own answers back
+    assert index.learned == []
+
+
+def test_failed_audit_leaves_validity_unassessed(audit, monkeypatch):
+    monkeypatch.setattr(services, '_DRUG_INDEX', KnownDrugs())
+    audit.fail = True
+    extracted = dict(EXTRACTION)
+    assert services.verify_and_correct_medical_data(extracted) is extracted
+    assert 'validity_assessed' not in extracted
+
+
+def test_summary_prompt_distinguishes_unchecked_medications():
+    verified = dict(EXTRACTION, medications=[{'name': 'Stamlo', 'valid': None}])
+    prompt = services._build_summary_prompt(EXTRACTION, verified)
+    assert 'Suitability Checked: no' in prompt
+    assert 'null (not checked' in prompt
@@ -2,50 +2,223 @@ import json
 import os
 import time
 import hashlib
+import threading
+from collections import OrderedDict
 
 CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
 
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+
+def content_hash(data):
+    """SHA-256 hex digest of raw bytes (or text), used as a content-addressed cache key."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
 
 class CacheManager:
-    def __init__(self, expiration_hours=24):
+    """
+    Thread-safe in-memory cache with TTL expiry and size-bounded LRU eviction.
+
+    Payloads are stored JSON-encoded, so every `get` hands back a fresh copy
+    (callers can mutate results freely) and the byte size of each entry is known
+    for the `max_bytes` bound.
+
+    With `cache_dir` set, entries are also written through to JSON files there so
+    they survive restarts; the directory keeps at most `max_disk_entries` files,
+    dropping the least recently used (by mtime) first. The file count is tracked
+    as entries are written and removed, so the directory is only scanned when it
+    overflows, and then pruned to 90% of the bound so scans stay rare.
+    """
+
+    def __init__(self, expiration_hours=24, max_entries=256, max_bytes=None, cache_dir=None, max_disk_entries=2000):
         self.expiration_seconds = expiration_hours * 3600
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> (timestamp, encoded payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._disk_lock = threading.Lock()
+        self._disk_entries = 0
+
+        if cache_dir:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+            self._disk_entries = len(self._disk_paths())
 
     def _get_cache_path(self, key):
         # Create a safe filename from the key
-        hashed_key = hashlib.md5(key.encode('utf-8')).hexdigest()
-        return os.path.join(CACHE_DIR, f"{hashed_key}.json")
+        return os.path.join(self.cache_dir, f"{content_hash(key)}.json")
 
-    def get(self, key):
+    def _read_disk(self, key):
         cache_path = self._get_cache_path(key)
-        if not os.path.exists(cache_path):
-            return None
-        
         try:
             with open(cache_path, 'r') as f:
                 data = json.load(f)
-            
-            # Check expiration
-            if time.time() - data['timestamp'] > self.expiration_seconds:
-                return None
-            
-            return data['payload']
+        except FileNotFoundError:
+            return None
         except Exception as e:
             print(f"Cache read error: {e}")
             return None
 
-    def set(self, key, payload):
+        if time.time() - data['timestamp'] > self.expiration_seconds:
+            self._remove_disk_entry(cache_path)
+            return None
+
+        # Touch so disk eviction sees this entry as recently used
+        os.utime(cache_path, None)
+        return data['timestamp'], json.dumps(data['payload'])
+
+    def _write_disk(self, key, timestamp, encoded):
         cache_path = self._get_cache_path(key)
-        data = {
-            'timestamp': time.time(),
-            'payload': payload
-        }
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        is_new = not os.path.exists(cache_path)
         try:
-            with open(cache_path, 'w') as f:
-                json.dump(data, f)
+            with open(tmp_path, 'w') as f:
+                f.write(f'{{"timestamp": {timestamp}, "payload": {encoded}}}')
+            os.replace(tmp_path, cache_path)
         except Exception as e:
             print(f"Cache write error: {e}")
+            self._remove_file(tmp_path)
+            return
+        if is_new:
+            with self._disk_lock:
+                self._disk_entries += 1
+                overflowing = self._disk_entries > self.max_disk_entries
+            if overflowing:
+                self._prune_disk()
+
+    def _disk_paths(self):
+        try:
+            return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        except OSError:
+            return []
+
+    def _prune_disk(self):
+        with self._disk_lock:
+            paths = self._disk_paths()
+            keep = int(self.max_disk_entries * 0.9)
+            if len(paths) > self.max_disk_entries:
+                paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+                for path in paths[:len(paths) - keep]:
+                    self._remove_file(path)
+                    self.evictions += 1
+                paths = paths[len(paths) - keep:]
+            # Resynchronise with the directory, which other processes may share
+            self._disk_entries = len(paths)
+
+    def _remove_disk_entry(self, path):
+        if not self._remove_file(path):
+            return False
+        with self._disk_lock:
+            self._disk_entries -= 1
+        return True
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _drop(self, key):
+        _, encoded = self._entries.pop(key)
+        self._bytes -= len(encoded)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.cache_dir:
+            # Read outside the lock so memory hits never wait on disk I/O
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    if key not in self._entries:
+                        self._insert(key, *entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+
+            timestamp, encoded = entry
+            # Check expiration
+            if time.time() - timestamp > self.expiration_seconds:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+                self.misses += 1
+                return None
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+
+        return json.loads(encoded)
+
+    def set(self, key, payload):
+        try:
+            encoded = json.dumps(payload)
+        except (TypeError, ValueError) as e:
+            print(f"Cache write error: {e}")
+            return
+
+        timestamp = time.time()
+        with self._lock:
+            self._insert(key, timestamp, encoded)
+
+        if self.cache_dir:
+            self._write_disk(key, timestamp, encoded)
+
+    def _insert(self, key, timestamp, encoded):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (timestamp, encoded)
+        self._bytes += len(encoded)
+
+        # Evict least recently used entries until both bounds hold
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            existed = key in self._entries
+            if existed:
+                self._drop(key)
+        if self.cache_dir:
+            if self._remove_disk_entry(self._get_cache_path(key)):
+                existed = True
+        return existed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.cache_dir:
+            for path in self._disk_paths():
+                self._remove_disk_entry(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
 
 # Global instance
-cache = CacheManager()
\ No newline at end of file
+cache = CacheManager()
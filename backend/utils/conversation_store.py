@@ -0,0 +1,394 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'conversations.db')
+
+
+def message_bytes(messages):
+    """Approximate memory held by a list of chat messages (sum of content lengths)."""
+    if not isinstance(messages, list):
+        return 0
+    return sum(len(str(m.get('content', ''))) for m in messages if isinstance(m, dict))
+
+
+class ConversationStore:
+    """
+    Interface for chat history persistence.
+
+    A conversation is a list of {"role", "content"} messages keyed by conversation id.
+    Callers must go through `create`/`append` rather than mutating what `get` returns,
+    so the same code works against process-local and shared backends.
+    """
+
+    def get(self, conversation_id):
+        """Return the conversation's messages, or None if unknown/expired."""
+        raise NotImplementedError
+
+    def create(self, conversation_id, messages):
+        """Start (or overwrite) a conversation with the given messages."""
+        raise NotImplementedError
+
+    def append(self, conversation_id, *messages):
+        """Append messages to a conversation, creating it if needed."""
+        raise NotImplementedError
+
+    def replace_prefix(self, conversation_id, expected, messages):
+        """
+        Compare-and-swap: if the conversation still starts with `expected`, replace
+        that prefix with `messages` and keep whatever was appended after it.
+        Returns False, changing nothing, if it no longer does.
+        """
+        raise NotImplementedError
+
+    def delete(self, conversation_id):
+        """Remove a conversation. Returns True if it existed."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Return a dict of store metrics (conversation count, approximate bytes, evictions)."""
+        raise NotImplementedError
+
+    def __contains__(self, conversation_id):
+        return self.get(conversation_id) is not None
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Process-local store with LRU (max_conversations) and TTL (max_idle_seconds) eviction.
+
+    Values need not be message lists (the Gemini assistant keeps chat sessions here),
+    pass a `sizer` callable to account for their memory in `stats()`.
+    """
+
+    def __init__(self, max_conversations=1000, max_idle_seconds=7200, sizer=message_bytes):
+        self.max_conversations = max_conversations
+        self.max_idle_seconds = max_idle_seconds
+        self.sizer = sizer
+        self._conversations = OrderedDict()  # id -> (last_access, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _evict(self):
+        # Entries are kept in access order, so idle ones sit at the front
+        now = time.time()
+        while self._conversations:
+            oldest_id, (last_access, _) = next(iter(self._conversations.items()))
+            if len(self._conversations) > self.max_conversations or now - last_access > self.max_idle_seconds:
+                del self._conversations[oldest_id]
+                self.evictions += 1
+            else:
+                break
+
+    def get(self, conversation_id):
+        with self._lock:
+            self._evict()
+            entry = self._conversations.get(conversation_id)
+            if entry is None:
+                return None
+            value = entry[1]
+            self._conversations[conversation_id] = (time.time(), value)
+            self._conversations.move_to_end(conversation_id)
+        return list(value) if isinstance(value, list) else value
+
+    def create(self, conversation_id, messages):
+        with self._lock:
+            value = list(messages) if isinstance(messages, list) else messages
+            self._conversations[conversation_id] = (time.time(), value)
+            self._conversations.move_to_end(conversation_id)
+            self._evict()
+
+    def append(self, conversation_id, *messages):
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            history = entry[1] if entry else []
+            history.extend(messages)
+            self._conversations[conversation_id] = (time.time(), history)
+            self._conversations.move_to_end(conversation_id)
+            self._evict()
+
+    def replace_prefix(self, conversation_id, expected, messages):
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            if entry is None or entry[1][:len(expected)] != expected:
+                return False
+            self._conversations[conversation_id] = (time.time(), list(messages) + entry[1][len(expected):])
+            self._conversations.move_to_end(conversation_id)
+            return True
+
+    def delete(self, conversation_id):
+        with self._lock:
+            if conversation_id in self._conversations:
+                del self._conversations[conversation_id]
+                return True
+            return False
+
+    def stats(self):
+        with self._lock:
+            self._evict()
+            return {
+                'backend': 'memory',
+                'conversations': len(self._conversations),
+                'approx_bytes': sum(self.sizer(value) for _, value in self._conversations.values()),
+                'evictions': self.evictions,
+                'max_conversations': self.max_conversations,
+                'max_idle_seconds': self.max_idle_seconds,
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    File-backed store shared by every worker process on the host (local stand-in for Firestore).
+
+    Conversations idle longer than `max_idle_seconds` are dropped and only the
+    `max_conversations` most recently active ones are kept.
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, max_conversations=1000, max_idle_seconds=7200):
+        self.path = path
+        self.max_conversations = max_conversations
+        self.max_idle_seconds = max_idle_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at)")
+
+    def _connect(self):
+        # One connection per thread; gunicorn threads must not share a sqlite3 handle
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - self.max_idle_seconds,))
+        conn.execute(
+            "DELETE FROM conversations WHERE id IN ("
+            "SELECT id FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_conversations,),
+        )
+
+    def get(self, conversation_id):
+        row = self._connect().execute(
+            "SELECT messages, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.max_idle_seconds:
+            return None
+        return json.loads(row[0])
+
+    def create(self, conversation_id, messages):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (id, messages, updated_at) VALUES (?, ?, ?)",
+                (conversation_id, json.dumps(messages), time.time()),
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def append(self, conversation_id, *messages):
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front so concurrent appends from
+        # other workers cannot interleave between the read and the write
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT messages, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            history = []
+            if row is not None and time.time() - row[1] <= self.max_idle_seconds:
+                history = json.loads(row[0])
+            history.extend(messages)
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (id, messages, updated_at) VALUES (?, ?, ?)",
+                (conversation_id, json.dumps(history), time.time()),
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def replace_prefix(self, conversation_id, expected, messages):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT messages, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            history = json.loads(row[0]) if row is not None and time.time() - row[1] <= self.max_idle_seconds else None
+            if history is None or history[:len(expected)] != expected:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "UPDATE conversations SET messages = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(list(messages) + history[len(expected):]), time.time(), conversation_id),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, conversation_id):
+        cursor = self._connect().execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        return cursor.rowcount > 0
+
+    def stats(self):
+        count, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(messages)), 0) FROM conversations WHERE updated_at >= ?",
+            (time.time() - self.max_idle_seconds,),
+        ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'conversations': count,
+            'approx_bytes': size,
+            'max_conversations': self.max_conversations,
+            'max_idle_seconds': self.max_idle_seconds,
+        }
+
+
+class FirestoreConversationStore(ConversationStore):
+    """
+    Firestore-backed store shared across Cloud Run instances.
+
+    Each conversation is one document in `collection` holding the message list,
+    `updatedAt` and `expiresAt`. Idle conversations are ignored on read; configure
+    a Firestore TTL policy on `expiresAt` to have them deleted server-side.
+    """
+
+    def __init__(self, collection='chat_conversations', max_idle_seconds=7200):
+        self.collection = collection
+        self.max_idle_seconds = max_idle_seconds
+
+    def _db(self):
+        # Reuse the firebase-admin app initialised for subscriptions
+        from app.payment_routes import _get_db
+
+        db = _get_db()
+        if db is None:
+            raise RuntimeError("Firestore unavailable for conversation store")
+        return db
+
+    def _ref(self, conversation_id, db=None):
+        db = db or self._db()
+        return db.collection(self.collection).document(str(conversation_id).replace('/', '_'))
+
+    def _document(self, messages):
+        from datetime import datetime, timezone, timedelta
+
+        now = time.time()
+        return {
+            'messages': messages,
+            'updatedAt': now,
+            'expiresAt': datetime.now(timezone.utc) + timedelta(seconds=self.max_idle_seconds),
+        }
+
+    def _live_messages(self, snapshot):
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict() or {}
+        if time.time() - data.get('updatedAt', 0) > self.max_idle_seconds:
+            return None
+        return data.get('messages', [])
+
+    def get(self, conversation_id):
+        return self._live_messages(self._ref(conversation_id).get())
+
+    def create(self, conversation_id, messages):
+        self._ref(conversation_id).set(self._document(list(messages)))
+
+    def append(self, conversation_id, *messages):
+        from firebase_admin import firestore
+
+        db = self._db()
+        ref = self._ref(conversation_id, db)
+
+        # ArrayUnion would drop repeated identical turns ("ok", "thanks"), so
+        # read-modify-write inside a transaction instead
+        @firestore.transactional
+        def _append(transaction):
+            history = self._live_messages(ref.get(transaction=transaction)) or []
+            history.extend(messages)
+            transaction.set(ref, self._document(history))
+
+        _append(db.transaction())
+
+    def replace_prefix(self, conversation_id, expected, messages):
+        from firebase_admin import firestore
+
+        db = self._db()
+        ref = self._ref(conversation_id, db)
+
+        @firestore.transactional
+        def _replace(transaction):
+            history = self._live_messages(ref.get(transaction=transaction))
+            if history is None or history[:len(expected)] != expected:
+                return False
+            transaction.set(ref, self._document(list(messages) + history[len(expected):]))
+            return True
+
+        return _replace(db.transaction())
+
+    def delete(self, conversation_id):
+        ref = self._ref(conversation_id)
+        if not ref.get().exists:
+            return False
+        ref.delete()
+        return True
+
+    def stats(self):
+        return {
+            'backend': 'firestore',
+            'collection': self.collection,
+            'max_idle_seconds': self.max_idle_seconds,
+        }
+
+
+def create_conversation_store(sizer=message_bytes, backend=None):
+    """
+    Build the configured conversation store.
+
+    CHAT_STORE_BACKEND selects "memory" (default, per process), "sqlite" (shared by the
+    workers on one host, CHAT_STORE_PATH) or "firestore" (shared across instances).
+    CHAT_MAX_CONVERSATIONS / CHAT_MAX_IDLE_SECONDS bound every backend.
+    """
+    backend = (backend or os.getenv('CHAT_STORE_BACKEND', 'memory')).lower()
+    max_conversations = int(os.getenv('CHAT_MAX_CONVERSATIONS', 1000))
+    max_idle_seconds = int(os.getenv('CHAT_MAX_IDLE_SECONDS', 7200))
+
+    if backend == 'sqlite':
+        return SQLiteConversationStore(
+            path=os.getenv('CHAT_STORE_PATH', DEFAULT_SQLITE_PATH),
+            max_conversations=max_conversations,
+            max_idle_seconds=max_idle_seconds,
+        )
+    if backend == 'firestore':
+        return FirestoreConversationStore(
+            collection=os.getenv('CHAT_STORE_COLLECTION', 'chat_conversations'),
+            max_idle_seconds=max_idle_seconds,
+        )
+    if backend != 'memory':
+        print(f"Unknown CHAT_STORE_BACKEND '{backend}', using in-memory store")
+
+    return InMemoryConversationStore(
+        max_conversations=max_conversations,
+        max_idle_seconds=max_idle_seconds,
+        sizer=sizer,
+    )
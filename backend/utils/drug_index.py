@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+from utils.cache_manager import CACHE_DIR
+
+DEFAULT_INDEX_PATH = os.path.join(CACHE_DIR, 'drug_index.db')
+
+# Words in an extracted medication name that are not part of the drug's name
+_NON_NAME_TOKENS = {
+    'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps', 'capsule', 'capsules', 'syp', 'syrup',
+    'inj', 'injection', 'susp', 'suspension', 'drop', 'drops', 'cream', 'gel', 'oint', 'ointment',
+    'mg', 'mcg', 'ml', 'g', 'gm', 'iu', 'od', 'bd', 'tds', 'sos', 'hs',
+}
+
+# Spellings that sound alike collapse to one form before vowels are dropped
+_PHONETIC_RULES = [
+    (re.compile(pattern), replacement) for pattern, replacement in (
+        (r'ph', 'f'), (r'gh', 'g'), (r'ck', 'k'), (r'qu', 'k'), (r'th', 't'), (r'([bdkg])h', r'\1'),
+        (r'x', 'ks'), (r'z', 's'), (r'c(?=[eiy])', 's'), (r'[cq]', 'k'), (r'w', 'v'), (r'y', 'i'),
+    )
+]
+
+
+def normalise_drug_name(name):
+    """Lowercased letters-only drug name without strengths or dosage forms ("Tab. Dolo 650mg" -> "dolo")."""
+    tokens = re.findall(r'[a-z]+', str(name or '').lower())
+    return ' '.join(token for token in tokens if token not in _NON_NAME_TOKENS)
+
+
+def phonetic_key(name):
+    """
+    Sound-alike key for a drug name: per word, the first letter plus the
+    consonant skeleton after spelling normalisation, with repeats collapsed.
+    "Stamol" and "Stamlo" share a key; so do "Zyloric" and "Ziloric".
+    """
+    codes = []
+    for token in normalise_drug_name(name).split():
+        for pattern, replacement in _PHONETIC_RULES:
+            token = pattern.sub(replacement, token)
+        code = token[0] + re.sub(r'[aeiouh]', '', token[1:])
+        codes.append(re.sub(r'(.)\1+', r'\1', code))
+    return ' '.join(codes)
+
+
+class DrugCorrectionIndex:
+    """
+    SQLite index of drug-name corrections learnt from the Feedback AI's verified answers.
+
+    Each raw (OCR/VLM) spelling, keyed by its normalised form, maps to the
+    canonical name, salt and alternatives the model returned, with its
+    confidence and the number of consistent sightings. `lookup` answers from an
+    exact key first and otherwise from the phonetic key when all names sharing it
+    agree on one canonical drug. An answer is only trusted when its confidence is
+    at least `min_confidence` and it has been seen `min_sightings` times, so a
+    single wrong answer from the model is not replayed.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, min_confidence=0.9, min_sightings=2, phonetic_discount=0.97):
+        self.path = path
+        self.min_confidence = min_confidence
+        self.min_sightings = min_sightings
+        self.phonetic_discount = phonetic_discount
+        self._counters = {'hits': 0, 'phonetic_hits': 0, 'misses': 0, 'learned': 0}
+        self._counter_lock = threading.Lock()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS corrections ("
+            "name_key TEXT PRIMARY KEY, phonetic_key TEXT NOT NULL, corrected TEXT NOT NULL, "
+            "salt TEXT, alternatives TEXT NOT NULL, confidence REAL NOT NULL, "
+            "sightings INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_corrections_phonetic ON corrections(phonetic_key)")
+
+    def _connect(self):
+        # One connection per thread, as concurrent analyses read and learn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter):
+        with self._counter_lock:
+            self._counters[counter] += 1
+
+    def _trusted(self, confidence, sightings):
+        return confidence >= self.min_confidence and sightings >= self.min_sightings
+
+    def lookup(self, name):
+        """
+        Trusted correction for a raw medication name, as
+        {"corrected", "salt", "alternatives", "confidence", "match"}, or None.
+        """
+        name_key = normalise_drug_name(name)
+        if not name_key:
+            return None
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT corrected, salt, alternatives, confidence, sightings FROM corrections WHERE name_key = ?",
+            (name_key,),
+        ).fetchone()
+        if row and self._trusted(row[3], row[4]):
+            self._count('hits')
+            return {'corrected': row[0], 'salt': row[1], 'alternatives': json.loads(row[2]),
+                    'confidence': row[3], 'match': 'exact'}
+
+        rows = conn.execute(
+            "SELECT corrected, salt, alternatives, confidence, sightings FROM corrections WHERE phonetic_key = ?",
+            (phonetic_key(name),),
+        ).fetchall()
+        # Only when every spelling with this sound points at the same drug
+        if rows and len({r[0].lower() for r in rows}) == 1:
+            best = max(rows, key=lambda r: (r[4], r[3]))
+            confidence = best[3] * self.phonetic_discount
+            if self._trusted(confidence, sum(r[4] for r in rows)):
+                self._count('phonetic_hits')
+                return {'corrected': best[0], 'salt': best[1], 'alternatives': json.loads(best[2]),
+                        'confidence': round(confidence, 3), 'match': 'phonetic'}
+
+        self._count('misses')
+        return None
+
+    def learn(self, medicines):
+        """
+        Record the Feedback AI's verified medicines (its raw "medicines" entries:
+        input, corrected, salt_or_composition, alternatives, confidence).
+        Agreeing answers add a sighting; a different answer replaces the entry
+        and starts its count again.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for med in medicines:
+                raw, corrected = med.get('input'), med.get('corrected')
+                name_key = normalise_drug_name(raw)
+                confidence = med.get('confidence')
+                if not name_key or not corrected or not isinstance(confidence, (int, float)):
+                    continue
+                if 'uncertain' in str(corrected).lower():
+                    continue
+                row = conn.execute(
+                    "SELECT corrected, sightings FROM corrections WHERE name_key = ?", (name_key,)
+                ).fetchone()
+                sightings = row[1] + 1 if row and row[0].lower() == str(corrected).lower() else 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO corrections (name_key, phonetic_key, corrected, salt, alternatives, "
+                    "confidence, sightings, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name_key, phonetic_key(raw), str(corrected), med.get('salt_or_composition'),
+                     json.dumps(med.get('alternatives') or []), float(confidence), sightings, now),
+                )
+                self._count('learned')
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        entries, trusted = self._connect().execute(
+            "SELECT COUNT(*), SUM(confidence >= ? AND sightings >= ?) FROM corrections",
+            (self.min_confidence, self.min_sightings),
+        ).fetchone()
+        with self._counter_lock:
+            counters = dict(self._counters)
+        return {'path': self.path, 'entries': entries, 'trusted_entries': trusted or 0, **counters}
+
+
+def create_drug_index():
+    """
+    Build the correction index from DRUG_INDEX_PATH / DRUG_INDEX_MIN_CONFIDENCE /
+    DRUG_INDEX_MIN_SIGHTINGS. Returns None if disabled (DRUG_INDEX=0) or the
+    database cannot be opened.
+    """
+    if os.getenv('DRUG_INDEX', '1') == '0':
+        return None
+    try:
+        return DrugCorrectionIndex(
+            path=os.getenv('DRUG_INDEX_PATH', DEFAULT_INDEX_PATH),
+            min_confidence=float(os.getenv('DRUG_INDEX_MIN_CONFIDENCE', 0.9)),
+            min_sightings=int(os.getenv('DRUG_INDEX_MIN_SIGHTINGS', 2)),
+        )
+    except Exception as e:
+        print(f"[DrugIndex] disabled, could not open index: {e}")
+        return None
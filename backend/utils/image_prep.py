@@ -0,0 +1,136 @@
+import os
+import io
+import time
+
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+# Long-edge cap, output format (JPEG or WEBP) and quality for images sent to vision models.
+# 2048px keeps small print on a full A4 page legible while cutting phone photos ~4x per side.
+VLM_PREPROCESS = os.getenv('VLM_PREPROCESS', '1') != '0'
+VLM_MAX_EDGE = int(os.getenv('VLM_MAX_EDGE', 2048))
+VLM_IMAGE_FORMAT = os.getenv('VLM_IMAGE_FORMAT', 'JPEG').upper()
+VLM_IMAGE_QUALITY = int(os.getenv('VLM_IMAGE_QUALITY', 85))
+
+_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+# Scan/screenshot test: share of near-white pixels (paper) and mean colour saturation
+# of a small thumbnail. Photos of paper have shadows, tinted light and background.
+SCAN_MIN_PAPER_SHARE = float(os.getenv('SCAN_MIN_PAPER_SHARE', 0.5))
+SCAN_MAX_SATURATION = float(os.getenv('SCAN_MAX_SATURATION', 40))
+
+
+def sniff_mime_type(data):
+    """Best-effort mime type from magic bytes, defaulting to JPEG."""
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+def _flatten(image):
+    """RGB copy of the image; transparent areas become white like the paper they stand for."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def _trim_margins(image, tolerance=16, padding=16):
+    """
+    Crop uniform borders (scanner bed, blank page margins) matching the top-left
+    pixel, keeping `padding` pixels around the content.
+    """
+    gray = image.convert('L')
+    background = Image.new('L', gray.size, gray.getpixel((0, 0)))
+    mask = ImageChops.difference(gray, background).point(lambda p: 255 if p > tolerance else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    bbox = (
+        max(left - padding, 0),
+        max(top - padding, 0),
+        min(right + padding, image.width),
+        min(bottom + padding, image.height),
+    )
+    return image.crop(bbox) if bbox != (0, 0, image.width, image.height) else image
+
+
+def _looks_like_scan(image):
+    """
+    Whether an RGB image looks like a flat scan or screenshot of a document: mostly
+    near-white, unsaturated pixels. Costs one 64px thumbnail, whatever the upload's size.
+    """
+    thumb = image.copy()
+    thumb.thumbnail((64, 64))
+    histogram = thumb.convert('L').histogram()
+    paper_share = sum(histogram[200:]) / max(sum(histogram), 1)
+    saturation = ImageStat.Stat(thumb.convert('HSV').getchannel('S')).mean[0]
+    return paper_share >= SCAN_MIN_PAPER_SHARE and saturation <= SCAN_MAX_SATURATION
+
+
+def prepare_image_for_vlm(data, max_edge=None, image_format=None, quality=None):
+    """
+    Shrink an uploaded image before base64-encoding it into a VLM request.
+
+    Applies the EXIF rotation, trims uniform margins, caps the long edge at
+    `max_edge` and re-encodes as JPEG/WebP at `quality`. Returns
+    (bytes, mime_type, stats); stats records sizes, preprocessing time,
+    whether the EXIF data names a camera ("camera_photo") and whether the image
+    looks like a flat scan or screenshot of a document ("scan_like"). Input
+    Pillow cannot decode, or that re-encoding would only grow, is passed through
+    unchanged.
+    """
+    max_edge = max_edge or VLM_MAX_EDGE
+    image_format = (image_format or VLM_IMAGE_FORMAT).upper()
+    quality = quality or VLM_IMAGE_QUALITY
+    if image_format not in ('JPEG', 'WEBP'):
+        image_format = 'JPEG'
+
+    start = time.time()
+    stats = {'original_bytes': len(data), 'sent_bytes': len(data), 'preprocessed': False}
+    if not VLM_PREPROCESS:
+        return data, sniff_mime_type(data), stats
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            stats['original_size'] = source.size
+            exif = source.getexif()
+            rotated = exif.get(0x0112, 1) != 1  # EXIF Orientation
+            stats['camera_photo'] = bool(exif.get(0x010F) or exif.get(0x0110))  # EXIF Make / Model
+            scale = max(source.size) / max_edge
+            if scale > 1:
+                # Let the JPEG decoder skip detail we are about to throw away
+                source.draft('RGB', (int(source.width / scale), int(source.height / scale)))
+            image = ImageOps.exif_transpose(source)
+            image = _trim_margins(_flatten(image))
+            stats['scan_like'] = _looks_like_scan(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            out = io.BytesIO()
+            if image_format == 'WEBP':
+                image.save(out, format='WEBP', quality=quality, method=4)
+            else:
+                image.save(out, format='JPEG', quality=quality, optimize=True)
+            encoded = out.getvalue()
+            stats['sent_size'] = image.size
+    except Exception as e:
+        print(f"[VLM PREP] passing image through unprocessed: {e}")
+        return data, sniff_mime_type(data), stats
+
+    stats['prep_ms'] = round((time.time() - start) * 1000, 1)
+    unchanged_geometry = stats['sent_size'] == stats['original_size'] and not rotated
+    if len(encoded) >= len(data) and unchanged_geometry:
+        # Already compact (e.g. a small scan); the original is the better copy
+        return data, sniff_mime_type(data), stats
+
+    stats.update({'sent_bytes': len(encoded), 'preprocessed': True})
+    print(
+        f"[VLM PREP] {stats['original_bytes'] / 1024:.0f} KB {stats['original_size'][0]}x{stats['original_size'][1]}"
+        f" -> {stats['sent_bytes'] / 1024:.0f} KB {stats['sent_size'][0]}x{stats['sent_size'][1]}"
+        f" {image_format} in {stats['prep_ms']} ms"
+    )
+    return encoded, _MIME_TYPES[image_format], stats
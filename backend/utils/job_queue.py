@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import ipaddress
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+from utils.cache_manager import CACHE_DIR
+
+DEFAULT_QUEUE_PATH = os.path.join(CACHE_DIR, 'jobs.db')
+
+# Priority lanes: higher runs first, FIFO within a lane
+PRIORITY_STANDARD = 0
+PRIORITY_PREMIUM = 10
+
+# Stages a job moves through, with the progress reported on entering each
+JOB_STAGES = {'queued': 0, 'extraction': 10, 'verification': 50, 'summary': 75, 'done': 100}
+
+# Optional comma-separated hosts callbacks may go to; any public host when unset
+CALLBACK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()
+}
+
+_PUBLIC_FIELDS = (
+    'id', 'kind', 'status', 'stage', 'progress', 'priority', 'created_at', 'started_at',
+    'finished_at', 'attempts', 'result', 'error', 'callback_url', 'callback_status',
+)
+
+
+def callback_url_error(url):
+    """
+    Why `url` may not receive a job's result, or None if it may: it must be
+    https, on an allowed host when JOB_CALLBACK_ALLOWED_HOSTS is set, and
+    resolve only to public addresses (no loopback, private, link-local or
+    metadata endpoints).
+    """
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        port = parts.port or 443
+    except ValueError:
+        return "callback_url is not a valid URL"
+    if parts.scheme != 'https' or not host:
+        return "callback_url must be an https URL"
+    if CALLBACK_ALLOWED_HOSTS and host not in CALLBACK_ALLOWED_HOSTS:
+        return "callback_url host is not allowed"
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        return "callback_url host does not resolve"
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%', 1)[0]).is_global:
+            return "callback_url must point to a public host"
+    return None
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue: a local, persistent stand-in for a managed queue.
+
+    Jobs carry their input as a blob, are claimed highest priority first and
+    oldest first within a priority, and record their stage/progress, result or
+    error. Inputs are dropped once a job finishes; finished jobs are kept for
+    `retention_hours` so clients can still poll them. A job whose worker stops
+    heartbeating for `stale_seconds` (e.g. the instance died) is requeued, up to
+    `max_attempts` runs.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, retention_hours=24, stale_seconds=600, max_attempts=2):
+        self.path = path
+        self.retention_seconds = retention_hours * 3600
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT NOT NULL, "
+            "progress INTEGER NOT NULL DEFAULT 0, priority INTEGER NOT NULL DEFAULT 0, "
+            "payload BLOB, params TEXT, result TEXT, error TEXT, "
+            "callback_url TEXT, callback_status TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, updated_at REAL NOT NULL, finished_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, created_at)")
+        # Queues created before jobs had owners
+        if 'owner' not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _connect(self):
+        # One connection per thread: request threads submit/poll while workers claim/update
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def submit(self, kind, payload, priority=PRIORITY_STANDARD, params=None, callback_url=None, owner=None):
+        """Queue a job and return its id. Only `owner` (a user id), if given, may read it back."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, status, stage, progress, priority, payload, params, callback_url, "
+            "owner, created_at, updated_at) VALUES (?, ?, 'queued', 'queued', 0, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, priority, payload, json.dumps(params or {}), callback_url, owner, now, now),
+        )
+        return job_id
+
+    def claim(self):
+        """
+        Atomically take the next job to run (marking it running), or None if the
+        queue is empty. The returned dict includes the payload and params.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._requeue_stale(conn, now)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, updated_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    (now, now, row['id']),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'] or '{}')
+        job.update(status='running', started_at=now, attempts=job['attempts'] + 1)
+        return job
+
+    def _requeue_stale(self, conn, now):
+        cutoff = now - self.stale_seconds
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, updated_at = ? "
+            "WHERE status = 'running' AND updated_at < ? AND attempts < ?",
+            (now, cutoff, self.max_attempts),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', payload = NULL, "
+            "finished_at = ?, updated_at = ? WHERE status = 'running' AND updated_at < ?",
+            (now, now, cutoff),
+        )
+
+    def set_stage(self, job_id, stage):
+        """Record progress (doubles as the worker's heartbeat)."""
+        self._connect().execute(
+            "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+            (stage, JOB_STAGES.get(stage, 0), time.time(), job_id),
+        )
+
+    def complete(self, job_id, result):
+        self._finish(job_id, 'done', result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        self._finish(job_id, 'failed', error=str(error))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "UPDATE jobs SET status = ?, stage = ?, progress = ?, result = ?, error = ?, payload = NULL, "
+            "finished_at = ?, updated_at = ? WHERE id = ?",
+            (status, 'done' if status == 'done' else 'failed', 100, result, error, now, now, job_id),
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (now - self.retention_seconds,),
+        )
+
+    def set_callback_status(self, job_id, callback_status):
+        self._connect().execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id))
+
+    def get(self, job_id):
+        """Public view of a job (no payload), with its place in line while queued; None if unknown."""
+        return self._view(job_id)
+
+    def get_for(self, job_id, uid):
+        """`get` on behalf of user `uid` (None if anonymous): None for jobs another user submitted."""
+        return self._view(job_id, check_owner=True, uid=uid)
+
+    def _view(self, job_id, check_owner=False, uid=None):
+        conn = self._connect()
+        row = conn.execute(
+            f"SELECT {', '.join(_PUBLIC_FIELDS)}, owner FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None or (check_owner and row['owner'] and row['owner'] != uid):
+            return None
+        job = dict(row)
+        del job['owner']
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        if job['status'] == 'queued':
+            job['queue_position'] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                "(priority > ? OR (priority = ? AND created_at < ?))",
+                (job['priority'], job['priority'], job['created_at']),
+            ).fetchone()[0]
+        return job
+
+    def pending(self):
+        """Number of queued jobs."""
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def stats(self):
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        durations = self._connect().execute(
+            "SELECT AVG(started_at - created_at), AVG(finished_at - started_at) FROM jobs WHERE status = 'done'"
+        ).fetchone()
+        return {
+            'path': self.path,
+            'jobs': counts,
+            'avg_wait_seconds': round(durations[0], 3) if durations[0] is not None else None,
+            'avg_run_seconds': round(durations[1], 3) if durations[1] is not None else None,
+        }
+
+
+class JobWorkers:
+    """
+    Background threads that drain a `JobQueue`.
+
+    `handler(job, set_stage)` runs each claimed job and returns its result; an
+    exception fails the job. When a job has a callback URL, its final public
+    view is POSTed there (retried with backoff) once it finishes.
+    """
+
+    def __init__(self, queue, handler, workers=2, poll_interval=2.0, callback_retries=3):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.callback_retries = callback_retries
+        self._wakeup = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            for index in range(self.workers):
+                threading.Thread(target=self._loop, name=f'job-worker-{index}', daemon=True).start()
+
+    def notify(self):
+        """Wake idle workers (call after submitting)."""
+        self._wakeup.set()
+
+    def _loop(self):
+        while True:
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                print(f"[Jobs] claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        started = time.time()
+        try:
+            result = self.handler(job, lambda stage: self.queue.set_stage(job['id'], stage))
+            self.queue.complete(job['id'], result)
+            print(f"[Jobs] {job['kind']} {job['id'][:8]} done in {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"[Jobs] {job['kind']} {job['id'][:8]} failed: {e}")
+            self.queue.fail(job['id'], e)
+        if job.get('callback_url'):
+            self._deliver_callback(job['id'], job['callback_url'])
+
+    def _deliver_callback(self, job_id, url):
+        body = self.queue.get(job_id)
+        for attempt in range(self.callback_retries):
+            # Checked again at delivery: the host may resolve differently than at submission
+            error = callback_url_error(url)
+            if error:
+                self.queue.set_callback_status(job_id, f"refused: {error}")
+                return
+            try:
+                response = requests.post(url, json=body, timeout=10, allow_redirects=False)
+                if response.status_code < 500:
+                    self.queue.set_callback_status(job_id, f"delivered ({response.status_code})")
+                    return
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            print(f"[Jobs] callback for {job_id[:8]} failed ({error}), attempt {attempt + 1}")
+            time.sleep(2 ** attempt)
+        self.queue.set_callback_status(job_id, f"failed: {error}")
+
+
+def create_job_queue():
+    """
+    Build the job queue from JOB_QUEUE_PATH / JOB_RETENTION_HOURS /
+    JOB_STALE_SECONDS. Point the path at a mounted volume for queued jobs to
+    survive redeploys. Returns None if the database cannot be opened.
+    """
+    try:
+        return JobQueue(
+            path=os.getenv('JOB_QUEUE_PATH', DEFAULT_QUEUE_PATH),
+            retention_hours=float(os.getenv('JOB_RETENTION_HOURS', 24)),
+            stale_seconds=float(os.getenv('JOB_STALE_SECONDS', 600)),
+        )
+    except Exception as e:
+        print(f"[Jobs] disabled, could not open job queue: {e}")
+        return None
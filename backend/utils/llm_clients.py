@@ -0,0 +1,115 @@
+import os
+import threading
+
+import httpx
+
+# Connection pool and timeouts shared by every LLM client. The SDK clients are
+# thread-safe, so one per (provider, api key) serves all request threads.
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 32))
+LLM_MAX_KEEPALIVE = int(os.getenv('LLM_MAX_KEEPALIVE', 16))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', 120))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv('LLM_ASYNC_MAX_CONNECTIONS', 512))
+
+_clients = {}  # (provider, api_key) -> SDK client
+_async_clients = {}  # (provider, api_key) -> async SDK client, for the ASGI entry point
+_lock = threading.Lock()
+
+
+def _http_client(default_client_cls, max_connections=LLM_MAX_CONNECTIONS):
+    return default_client_cls(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+
+
+def _build_client(provider, api_key):
+    if provider == 'groq':
+        from groq import DefaultHttpxClient, Groq
+
+        return Groq(api_key=api_key, max_retries=LLM_MAX_RETRIES, http_client=_http_client(DefaultHttpxClient))
+    if provider == 'cerebras':
+        from cerebras.cloud.sdk import Cerebras, DefaultHttpxClient
+
+        return Cerebras(api_key=api_key, max_retries=LLM_MAX_RETRIES, http_client=_http_client(DefaultHttpxClient))
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def _build_async_client(provider, api_key):
+    # One event loop serves every request, so its pool can be far larger than the threaded one
+    if provider == 'groq':
+        from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+        return AsyncGroq(
+            api_key=api_key,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=_http_client(DefaultAsyncHttpxClient, LLM_ASYNC_MAX_CONNECTIONS),
+        )
+    if provider == 'cerebras':
+        from cerebras.cloud.sdk import AsyncCerebras, DefaultAsyncHttpxClient
+
+        return AsyncCerebras(
+            api_key=api_key,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=_http_client(DefaultAsyncHttpxClient, LLM_ASYNC_MAX_CONNECTIONS),
+        )
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def get_llm_client(provider, api_key):
+    """
+    Long-lived client for `provider` ("groq" or "cerebras") and `api_key`,
+    created on first use and reused after, so calls keep their warm
+    connections instead of redoing TLS setup each time.
+    """
+    if not api_key:
+        raise ValueError(f"{provider} API key not provided.")
+    key = (provider, api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _build_client(provider, api_key)
+                _clients[key] = client
+    return client
+
+
+def get_async_llm_client(provider, api_key):
+    """Async counterpart of `get_llm_client`, used by the ASGI routes."""
+    if not api_key:
+        raise ValueError(f"{provider} API key not provided.")
+    key = (provider, api_key)
+    client = _async_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = _build_async_client(provider, api_key)
+                _async_clients[key] = client
+    return client
+
+
+def get_groq_client(api_key):
+    return get_llm_client('groq', api_key)
+
+
+def get_cerebras_client(api_key):
+    return get_llm_client('cerebras', api_key)
+
+
+def client_stats():
+    """Number of pooled clients per provider (keys are never exposed)."""
+    with _lock:
+        counts = {}
+        for provider, _ in _clients:
+            counts[provider] = counts.get(provider, 0) + 1
+        for provider, _ in _async_clients:
+            counts[f"{provider}_async"] = counts.get(f"{provider}_async", 0) + 1
+    return counts
@@ -0,0 +1,426 @@
+import os
+import time
+import random
+import asyncio
+import base64
+import threading
+from collections import deque
+from types import SimpleNamespace
+
+from utils.llm_clients import get_async_llm_client, get_llm_client
+
+# Interchangeable models, in default preference order. Call sites name either a
+# tier or any model in it; the gateway picks the fastest healthy member.
+MODEL_TIERS = {
+    'large': [
+        ('groq', 'llama-3.3-70b-versatile'),
+        ('cerebras', 'llama-3.3-70b'),
+        ('gemini', 'gemini-2.5-flash'),
+    ],
+    'small': [
+        ('groq', 'llama-3.1-8b-instant'),
+        ('cerebras', 'llama-3.1-8b'),
+        ('gemini', 'gemini-2.5-flash-lite'),
+    ],
+    'vision': [
+        ('groq', 'meta-llama/llama-4-scout-17b-16e-instruct'),
+        ('gemini', 'gemini-2.5-flash'),
+    ],
+}
+PROVIDER_KEY_ENV = {'groq': 'GROQ_API_KEY', 'cerebras': 'CEREBRAS_API_KEY', 'gemini': 'GEMINI_API_KEY'}
+
+LLM_GATEWAY_WINDOW = int(os.getenv('LLM_GATEWAY_WINDOW', 100))
+LLM_GATEWAY_MIN_SAMPLES = int(os.getenv('LLM_GATEWAY_MIN_SAMPLES', 5))
+LLM_GATEWAY_EXPLORE_RATE = float(os.getenv('LLM_GATEWAY_EXPLORE_RATE', 0.02))
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 3))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+
+
+class LLMGatewayError(Exception):
+    """Every candidate model for a request failed (or none is configured)."""
+
+
+def _is_client_error(error):
+    # A malformed request fails the same way everywhere: surface it instead of failing over
+    status = getattr(error, 'status_code', None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429)
+
+
+def _completion(text):
+    """Minimal OpenAI-shaped completion for providers with their own response types."""
+    return SimpleNamespace(choices=[SimpleNamespace(
+        message=SimpleNamespace(role='assistant', content=text), finish_reason='stop',
+    )])
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)])
+
+
+# --- Providers ---
+
+class OpenAICompatibleProvider:
+    """Groq and Cerebras: pooled SDK clients with the same chat.completions API."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def default_key(self):
+        return os.getenv(PROVIDER_KEY_ENV[self.name])
+
+    def create(self, model, messages, api_key=None, **params):
+        client = get_llm_client(self.name, api_key or self.default_key())
+        return client.chat.completions.create(model=model, messages=messages, **params)
+
+    async def acreate(self, model, messages, api_key=None, **params):
+        client = get_async_llm_client(self.name, api_key or self.default_key())
+        return await client.chat.completions.create(model=model, messages=messages, **params)
+
+
+class GeminiProvider:
+    """Gemini behind the same call shape: system messages become the system instruction."""
+
+    name = 'gemini'
+
+    def __init__(self):
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def default_key(self):
+        return os.getenv('GEMINI_API_KEY')
+
+    def _configure(self):
+        # genai holds one process-wide key; per-call keys are not supported
+        with self._lock:
+            if not self._configured:
+                import google.generativeai as genai
+
+                genai.configure(api_key=self.default_key())
+                self._configured = True
+
+    @staticmethod
+    def _parts(content):
+        if isinstance(content, str):
+            return [content]
+        parts = []
+        for part in content:
+            if part.get('type') == 'text':
+                parts.append(part['text'])
+            elif part.get('type') == 'image_url':
+                header, data = part['image_url']['url'].split(',', 1)
+                parts.append({'mime_type': header[len('data:'):].split(';')[0], 'data': base64.b64decode(data)})
+        return parts
+
+    def _request(self, model, messages, temperature=None, max_tokens=None, top_p=None, response_format=None, **_):
+        import google.generativeai as genai
+
+        self._configure()
+        system = "\n\n".join(m['content'] for m in messages if m['role'] == 'system')
+        contents = [
+            {'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': self._parts(m['content'])}
+            for m in messages if m['role'] != 'system'
+        ]
+        config = {'temperature': temperature, 'max_output_tokens': max_tokens, 'top_p': top_p}
+        if response_format and response_format.get('type') == 'json_object':
+            config['response_mime_type'] = 'application/json'
+        generative_model = genai.GenerativeModel(model_name=model, system_instruction=system or None)
+        return generative_model, contents, {k: v for k, v in config.items() if v is not None}
+
+    def create(self, model, messages, api_key=None, stream=False, **params):
+        generative_model, contents, config = self._request(model, messages, **params)
+        response = generative_model.generate_content(contents, generation_config=config, stream=stream)
+        if stream:
+            return (_chunk(piece.text) for piece in response)
+        return _completion(response.text)
+
+    async def acreate(self, model, messages, api_key=None, **params):
+        generative_model, contents, config = self._request(model, messages, **params)
+        response = await generative_model.generate_content_async(contents, generation_config=config)
+        return _completion(response.text)
+
+
+class FakeProvider:
+    """
+    Local stand-in for tests and offline development. `reply` is a string or a
+    callable(model, messages) -> str; `latency` seconds are slept per call and
+    `fail` (bool or exception) makes calls raise.
+    """
+
+    def __init__(self, name='fake', reply='{"ok": true}', latency=0.0, fail=False):
+        self.name = name
+        self.reply = reply
+        self.latency = latency
+        self.fail = fail
+        self.calls = []
+
+    def default_key(self):
+        return 'fake'
+
+    def _respond(self, model, messages, stream):
+        if self.fail:
+            raise self.fail if isinstance(self.fail, Exception) else RuntimeError(f"{self.name} unavailable")
+        text = self.reply(model, messages) if callable(self.reply) else self.reply
+        if stream:
+            return iter([_chunk(word + ' ') for word in text.split(' ')])
+        return _completion(text)
+
+    def create(self, model, messages, api_key=None, stream=False, **params):
+        self.calls.append({'model': model, 'messages': messages, 'stream': stream, **params})
+        time.sleep(self.latency)
+        return self._respond(model, messages, stream)
+
+    async def acreate(self, model, messages, api_key=None, **params):
+        self.calls.append({'model': model, 'messages': messages, 'stream': False, **params})
+        await asyncio.sleep(self.latency)
+        return self._respond(model, messages, False)
+
+
+# --- Health tracking ---
+
+class ModelHealth:
+    """Rolling latency/error window plus a circuit breaker for one provider/model."""
+
+    def __init__(self, window=LLM_GATEWAY_WINDOW):
+        self.samples = deque(maxlen=window)  # (latency seconds, ok)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Closed: allow. Open: refuse until the cooldown ends, then let one trial call through (half-open)."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at < LLM_BREAKER_COOLDOWN or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def release(self):
+        """End a call that says nothing about the model's health (e.g. a rejected request)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.samples.append((latency, ok))
+            self.trial_in_flight = False
+            if ok:
+                self.consecutive_failures = 0
+                self.opened_at = None
+            else:
+                self.consecutive_failures += 1
+                if self.opened_at is not None or self.consecutive_failures >= LLM_BREAKER_FAILURES:
+                    self.opened_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self.samples if ok)
+            errors = sum(1 for _, ok in self.samples if not ok)
+            total = len(self.samples)
+            state = 'closed' if self.opened_at is None else (
+                'half_open' if time.time() - self.opened_at >= LLM_BREAKER_COOLDOWN else 'open'
+            )
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        return {
+            'samples': total,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'error_rate': round(errors / total, 3) if total else 0.0,
+            'breaker': state,
+        }
+
+
+# --- Gateway ---
+
+class LLMGateway:
+    """
+    Routes each chat completion to the fastest healthy model of its tier.
+
+    Candidates with at least LLM_GATEWAY_MIN_SAMPLES successful calls are ranked
+    by rolling p50 latency; the rest follow in tier order, so a cold start uses
+    the configured order. An LLM_GATEWAY_EXPLORE_RATE share of requests puts one
+    unmeasured candidate first so it gets measured too. A candidate that fails is recorded and the
+    next one is tried; LLM_BREAKER_FAILURES consecutive failures open its breaker
+    for LLM_BREAKER_COOLDOWN seconds. Streams are timed to the first chunk and
+    can only fail over before it. A model outside every tier (an env override,
+    say) goes straight to the `primary` provider, still behind a breaker.
+    """
+
+    def __init__(self, providers=None, tiers=None, primary=None, explore_rate=None):
+        if providers is None:
+            providers = {'groq': OpenAICompatibleProvider('groq'), 'cerebras': OpenAICompatibleProvider('cerebras'),
+                         'gemini': GeminiProvider()}
+        self.providers = providers
+        self.primary = primary or next(iter(providers))
+        self.tiers = tiers or MODEL_TIERS
+        self.explore_rate = LLM_GATEWAY_EXPLORE_RATE if explore_rate is None else explore_rate
+        self._model_tier = {model: tier for tier, members in self.tiers.items() for _, model in members}
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def _health_for(self, provider, model):
+        key = (provider, model)
+        with self._lock:
+            if key not in self._health:
+                self._health[key] = ModelHealth()
+            return self._health[key]
+
+    def _candidates(self, model, keys):
+        tier = self._model_tier.get(model, model)
+        members = self.tiers.get(tier) or [(self.primary, model)]
+
+        ranked, unmeasured = [], []
+        for order, (provider_name, member) in enumerate(members):
+            provider = self.providers.get(provider_name)
+            if provider is None or not (keys.get(provider_name) or provider.default_key()):
+                continue
+            health = self._health_for(provider_name, member).snapshot()
+            measured = health['samples'] - round(health['error_rate'] * health['samples']) >= LLM_GATEWAY_MIN_SAMPLES
+            if measured:
+                ranked.append(((health['p50'], order), provider_name, member))
+            else:
+                unmeasured.append((provider_name, member))
+        candidates = [(name, member) for _, name, member in sorted(ranked)] + unmeasured
+
+        # Occasionally send one request to an unmeasured fallback so it can be ranked
+        if ranked and unmeasured and random.random() < self.explore_rate:
+            probe = random.choice(unmeasured)
+            candidates.remove(probe)
+            candidates.insert(0, probe)
+        return candidates
+
+    def complete(self, model, messages, keys=None, stream=False, **params):
+        """
+        Chat completion for `model` (a tier name or any model in a tier) returned in
+        the OpenAI/Groq shape; with `stream=True` an iterator of chunks. `keys`
+        optionally overrides API keys per provider for this call.
+        """
+        keys = keys or {}
+        errors = []
+        for provider_name, member in self._candidates(model, keys):
+            health = self._health_for(provider_name, member)
+            if not health.allow():
+                continue
+            started = time.time()
+            try:
+                result = self.providers[provider_name].create(
+                    member, messages, api_key=keys.get(provider_name), stream=stream, **params
+                )
+                if stream:
+                    result = iter(result)
+                    first = next(result, None)
+            except Exception as e:
+                if _is_client_error(e):
+                    health.release()
+                    raise
+                health.record(time.time() - started, False)
+                print(f"[LLM Gateway] {provider_name}/{member} failed, trying next: {e}")
+                errors.append(e)
+                continue
+
+            health.record(time.time() - started, True)
+            if stream:
+                return self._resume(first, result)
+            return result
+
+        detail = "; ".join(str(e) for e in errors) or "no configured model with a closed breaker"
+        raise LLMGatewayError(f"All models for '{model}' failed: {detail}") from (errors[-1] if errors else None)
+
+    async def acomplete(self, model, messages, keys=None, **params):
+        """Async `complete` for the ASGI routes: same routing, health tracking and failover; no streaming."""
+        keys = keys or {}
+        errors = []
+        for provider_name, member in self._candidates(model, keys):
+            health = self._health_for(provider_name, member)
+            if not health.allow():
+                continue
+            started = time.time()
+            try:
+                result = await self.providers[provider_name].acreate(
+                    member, messages, api_key=keys.get(provider_name), **params
+                )
+            except Exception as e:
+                if _is_client_error(e):
+                    health.release()
+                    raise
+                health.record(time.time() - started, False)
+                print(f"[LLM Gateway] {provider_name}/{member} failed, trying next: {e}")
+                errors.append(e)
+                continue
+
+            health.record(time.time() - started, True)
+            return result
+
+        detail = "; ".join(str(e) for e in errors) or "no configured model with a closed breaker"
+        raise LLMGatewayError(f"All models for '{model}' failed: {detail}") from (errors[-1] if errors else None)
+
+    @staticmethod
+    def _resume(first, rest):
+        if first is not None:
+            yield first
+        yield from rest
+
+    def client(self, keys=None):
+        """Drop-in stand-in for a Groq/Cerebras client: `.chat.completions.create(model=..., ...)`."""
+        return GatewayClient(self, keys)
+
+    def async_client(self, keys=None):
+        """Same as `client`, but `create` is a coroutine (AsyncGroq-style)."""
+        return GatewayClient(self, keys, completions_cls=_AsyncCompletions)
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._health)
+        return {
+            tier: {
+                f"{provider}/{member}": self._health_for(provider, member).snapshot()
+                for provider, member in members if (provider, member) in keys
+            }
+            for tier, members in self.tiers.items()
+        }
+
+
+class _Completions:
+    def __init__(self, gateway, keys):
+        self._gateway = gateway
+        self._keys = keys
+
+    def create(self, model, messages, **params):
+        return self._gateway.complete(model, messages, keys=self._keys, **params)
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model, messages, **params):
+        return await self._gateway.acomplete(model, messages, keys=self._keys, **params)
+
+
+class GatewayClient:
+    def __init__(self, gateway, keys=None, completions_cls=_Completions):
+        self.chat = SimpleNamespace(completions=completions_cls(gateway, keys))
+
+
+def _default_gateway():
+    # LLM_GATEWAY_FAKE=1 swaps every provider for the local fake (offline dev, smoke tests)
+    if os.getenv('LLM_GATEWAY_FAKE') == '1':
+        fake = FakeProvider(latency=float(os.getenv('LLM_GATEWAY_FAKE_LATENCY', 0)))
+        return LLMGateway(providers={name: fake for name in PROVIDER_KEY_ENV})
+    return LLMGateway()
+
+
+# Global instance
+llm_gateway = _default_gateway()
+
+
+def get_llm(keys=None):
+    """Client-shaped handle on the shared gateway; `keys` maps provider -> API key overrides."""
+    return llm_gateway.client(keys)
+
+
+def get_async_llm(keys=None):
+    """Async client-shaped handle on the shared gateway, for the ASGI routes."""
+    return llm_gateway.async_client(keys)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+
+from utils.drug_index import normalise_drug_name, phonetic_key
+
+DEFAULT_MEDICINE_DATA = os.path.join(os.path.dirname(__file__), '..', 'indian_medicines.json')
+
+# Shortest truncated name matched against the start of a dictionary name
+MIN_PREFIX = 5
+
+
+def osa_distance(a, b, limit):
+    """
+    Optimal-string-alignment distance (Levenshtein plus adjacent transpositions,
+    so "stamol" -> "stamlo" is 1). Gives up with `limit + 1` once every path
+    exceeds `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # A typo leaves most of the name intact: only the differing middle needs the table
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(len(a) or len(b), limit + 1)
+
+    previous_previous, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] * (len(b) + 1)
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            cost = previous[j - 1] if char_a == char_b else previous[j - 1] + 1
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b and previous_previous[j - 2] + 1 < cost:
+                cost = previous_previous[j - 2] + 1
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _deletes(key):
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+class MedicineLookup:
+    """
+    In-memory fuzzy search over a brand/generic medicine dictionary.
+
+    Every brand and generic name is indexed four ways: by its normalised form
+    (exact hits), by every single-character deletion of it (a symmetric-delete
+    index, so one substitution, insertion, deletion or swap costs two dict
+    probes instead of a scan), by its `phonetic_key` (sound-alike spellings
+    such as "Stamol" for "Stamlo") and by its leading letters (names cut short,
+    "Zylor" for "Zyloric"). Multi-word brands are also reachable by their
+    first word. Candidates are ranked by edit distance, so a lookup
+    touches only a handful of names whatever the dictionary's size.
+    """
+
+    def __init__(self, medicines):
+        # Entry: (display name, generic, kind, normalised key); ids index into self._entries
+        self._entries = []
+        self._exact = {}
+        self._deleted = {}
+        self._phonetic = {}
+        self._prefixes = {}
+        self._brands_by_generic = {}
+        seen = {}
+        for med in medicines:
+            brand, generic = str(med.get('brand') or '').strip(), str(med.get('generic') or '').strip()
+            if not generic:
+                continue
+            if brand:
+                self._add(brand, generic, 'brand', seen)
+                self._brands_by_generic.setdefault(generic.lower(), []).append(brand)
+            self._add(generic, generic, 'generic', seen)
+
+    def _add(self, name, generic, kind, seen):
+        key = normalise_drug_name(name)
+        if not key or (key, kind) in seen:
+            return
+        entry_id = len(self._entries)
+        seen[(key, kind)] = entry_id
+        self._entries.append((name, generic, kind, key))
+        keys = {key}
+        if kind == 'brand' and ' ' in key:
+            keys.add(key.split(' ', 1)[0])
+        for indexed in keys:
+            self._exact.setdefault(indexed, []).append(entry_id)
+            for deleted in _deletes(indexed):
+                self._deleted.setdefault(deleted, []).append(entry_id)
+            for end in range(MIN_PREFIX, len(indexed)):
+                self._prefixes.setdefault(indexed[:end], []).append(entry_id)
+        self._phonetic.setdefault(phonetic_key(name), []).append(entry_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _max_distance(key):
+        # Short names tolerate fewer edits, or "pan" would match half the dictionary
+        return 0 if len(key) < 4 else 1 if len(key) < 7 else 2
+
+    def lookup(self, name, limit=3, min_score=0.6):
+        """
+        Best dictionary matches for a raw medication name, as
+        [{"name", "generic", "kind", "score", "match"}], best first. "match"
+        is "exact", "fuzzy" (within edit distance), "phonetic", "prefix" or
+        "leading_word". The last two only say which products the name starts
+        like: "Glycomet XR 500" may not be plain Glycomet.
+        """
+        key = normalise_drug_name(name)
+        if not key:
+            return []
+        matches = self._matches(key)
+        if not matches and ' ' in key:
+            # "Dolo 650 XR", combinations not in the dictionary: fall back to the leading word
+            matches = [(score, 'leading_word', entry_id)
+                       for score, _, entry_id in self._matches(key.split(' ', 1)[0])]
+
+        results, names = [], set()
+        for score, match, entry_id in sorted(matches, key=lambda m: (-m[0], m[2])):
+            display, generic, kind, _ = self._entries[entry_id]
+            if score < min_score or display.lower() in names:
+                continue
+            names.add(display.lower())
+            results.append({'name': display, 'generic': generic, 'kind': kind,
+                            'score': round(score, 3), 'match': match})
+            if len(results) == limit:
+                break
+        return results
+
+    def _matches(self, key):
+        exact = self._exact.get(key)
+        if exact:
+            return [(1.0, 'exact', entry_id) for entry_id in exact]
+
+        limit = self._max_distance(key)
+        candidates = {}
+        if limit:
+            probes = _deletes(key)
+            probes.add(key)
+            for probe in probes:
+                for entry_id in self._exact.get(probe, ()):
+                    candidates[entry_id] = 'fuzzy'
+                for entry_id in self._deleted.get(probe, ()):
+                    candidates[entry_id] = 'fuzzy'
+        if not candidates:
+            # Sound-alikes only when spelling slips found nothing (the key costs more than the probes)
+            for entry_id in self._phonetic.get(phonetic_key(key), ()):
+                candidates[entry_id] = 'phonetic'
+        for entry_id in self._prefixes.get(key, ()):
+            candidates.setdefault(entry_id, 'prefix')
+
+        matches = []
+        for entry_id, match in candidates.items():
+            indexed = self._entries[entry_id][3]
+            if match == 'prefix':
+                matches.append((len(key) / len(indexed), match, entry_id))
+                continue
+            if match == 'fuzzy' and ' ' in indexed and ' ' not in key:
+                indexed = indexed.split(' ', 1)[0]
+            # Sound-alikes may sit one edit further out than spelling slips
+            allowed = limit + 1 if match == 'phonetic' else limit
+            distance = osa_distance(key, indexed, allowed)
+            if distance <= allowed:
+                matches.append((1.0 - distance / max(len(key), len(indexed)), match, entry_id))
+        return matches
+
+    def alternatives(self, name, limit=3):
+        """Other brands with the same generic as `name` (a brand or generic name)."""
+        hits = self.lookup(name, limit=1, min_score=1.0)
+        if not hits:
+            return []
+        brands = self._brands_by_generic.get(hits[0]['generic'].lower(), [])
+        return [brand for brand in brands if brand.lower() != hits[0]['name'].lower()][:limit]
+
+    def stats(self):
+        return {'names': len(self._entries), 'generics': len(self._brands_by_generic),
+                'delete_keys': len(self._deleted), 'prefix_keys': len(self._prefixes)}
+
+
+def create_medicine_lookup():
+    """
+    Load the medicine dictionary from MEDICINE_DATA_FILE (default
+    indian_medicines.json). Returns None if disabled (MEDICINE_LOOKUP=0) or
+    the file cannot be read.
+    """
+    if os.getenv('MEDICINE_LOOKUP', '1') == '0':
+        return None
+    path = os.getenv('MEDICINE_DATA_FILE', DEFAULT_MEDICINE_DATA)
+    try:
+        started = time.time()
+        with open(path, 'r', encoding='utf-8') as f:
+            lookup = MedicineLookup(json.load(f).get('medicines', []))
+        print(f"[MedicineLookup] {len(lookup)} names indexed in {(time.time() - started) * 1000:.0f}ms")
+        return lookup
+    except Exception as e:
+        print(f"[MedicineLookup] disabled, could not load {path}: {e}")
+        return None
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from utils.cache_manager import CACHE_DIR, content_hash
+
+DEFAULT_ARCHIVE_PATH = os.path.join(CACHE_DIR, 'news_archive.db')
+
+
+def headline_key(headline):
+    """Dedupe key for an article: hash of its case- and whitespace-normalised headline."""
+    return content_hash(' '.join((headline or '').lower().split()))
+
+
+class NewsArchive:
+    """
+    SQLite archive of normalised health-news articles, keyed by headline hash.
+
+    Every successful refresh is upserted here so later refreshes (and freshly
+    started instances) can top up a thin NewsAPI response with recent real news.
+    Articles not seen for `retention_days` are dropped and at most `max_articles`
+    of the most recently seen ones are kept.
+    """
+
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH, retention_days=14, max_articles=500):
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        self.max_articles = max_articles
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            "headline_hash TEXT PRIMARY KEY, article TEXT NOT NULL, "
+            "first_seen REAL NOT NULL, last_seen REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_last_seen ON articles(last_seen)")
+
+    def _connect(self):
+        # One connection per thread, as the refresher and request threads both write
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def add(self, articles):
+        """Upsert articles (dicts with a 'headline'); re-seen ones get their content and last_seen refreshed."""
+        now = time.time()
+        rows = []
+        for position, article in enumerate(articles):
+            stored = {k: v for k, v in article.items() if k != 'id'}
+            # Offset by position so `recent` returns a refresh's articles in their original order
+            seen_at = now - position * 1e-3
+            rows.append((headline_key(article['headline']), json.dumps(stored), seen_at, seen_at))
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO articles (headline_hash, article, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(headline_hash) DO UPDATE SET article = excluded.article, last_seen = excluded.last_seen",
+                rows,
+            )
+            self._prune(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM articles WHERE last_seen < ?", (now - self.retention_seconds,))
+        conn.execute(
+            "DELETE FROM articles WHERE headline_hash IN ("
+            "SELECT headline_hash FROM articles ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_articles,),
+        )
+
+    def recent(self, limit, exclude=()):
+        """Most recently seen articles, newest first, skipping headline hashes in `exclude`."""
+        if limit <= 0:
+            return []
+        rows = self._connect().execute(
+            "SELECT headline_hash, article FROM articles WHERE last_seen >= ? "
+            "ORDER BY last_seen DESC LIMIT ?",
+            (time.time() - self.retention_seconds, limit + len(exclude)),
+        ).fetchall()
+        return [json.loads(article) for key, article in rows if key not in exclude][:limit]
+
+    def contains(self, headline):
+        row = self._connect().execute(
+            "SELECT 1 FROM articles WHERE headline_hash = ?", (headline_key(headline),)
+        ).fetchone()
+        return row is not None
+
+    def last_updated(self):
+        """Timestamp of the latest upsert, or 0 for an empty archive."""
+        row = self._connect().execute("SELECT MAX(last_seen) FROM articles").fetchone()
+        return row[0] or 0
+
+    def stats(self):
+        count, oldest = self._connect().execute(
+            "SELECT COUNT(*), MIN(first_seen) FROM articles"
+        ).fetchone()
+        return {
+            'path': self.path,
+            'articles': count,
+            'oldest': oldest,
+            'last_updated': self.last_updated(),
+            'retention_days': self.retention_seconds / 86400,
+            'max_articles': self.max_articles,
+        }
+
+
+def create_news_archive():
+    """
+    Build the news archive from NEWS_ARCHIVE_PATH / NEWS_ARCHIVE_RETENTION_DAYS /
+    NEWS_ARCHIVE_MAX_ARTICLES. Point the path at a mounted volume for the archive
+    to outlive container redeploys. Returns None if the database cannot be opened.
+    """
+    try:
+        return NewsArchive(
+            path=os.getenv('NEWS_ARCHIVE_PATH', DEFAULT_ARCHIVE_PATH),
+            retention_days=float(os.getenv('NEWS_ARCHIVE_RETENTION_DAYS', 14)),
+            max_articles=int(os.getenv('NEWS_ARCHIVE_MAX_ARTICLES', 500)),
+        )
+    except Exception as e:
+        print(f"[NewsArchive] disabled, could not open archive: {e}")
+        return None
@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+# Pages with at least this much extractable text are read from the text layer;
+# the rest are rasterised for the vision model.
+PDF_MIN_TEXT_CHARS = int(os.getenv('PDF_MIN_TEXT_CHARS', 40))
+PDF_RASTER_DPI = int(os.getenv('PDF_RASTER_DPI', 150))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 20))
+PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', 4))
+
+
+def is_pdf(data):
+    # The header may follow a few junk bytes, which readers tolerate
+    return b'%PDF-' in data[:1024]
+
+
+def split_pdf_pages(data):
+    """
+    Split a PDF into per-page work items, in page order.
+
+    Each item is {"page": n, "text": str | None, "image": png bytes | None}:
+    pages with a usable text layer carry their text, the others a rendering at
+    PDF_RASTER_DPI. At most PDF_MAX_PAGES pages are read.
+    """
+    pages = []
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        if doc.page_count > PDF_MAX_PAGES:
+            print(f"[PDF] {doc.page_count} pages, analysing the first {PDF_MAX_PAGES}")
+        for index, page in enumerate(doc):
+            if index >= PDF_MAX_PAGES:
+                break
+            text = page.get_text().strip()
+            if len(text) >= PDF_MIN_TEXT_CHARS:
+                pages.append({'page': index + 1, 'text': text, 'image': None})
+            else:
+                pixmap = page.get_pixmap(dpi=PDF_RASTER_DPI)
+                pages.append({'page': index + 1, 'text': None, 'image': pixmap.tobytes('png')})
+    return pages
+
+
+def map_concurrently(fn, items, max_workers=PDF_PAGE_WORKERS):
+    """Apply `fn` to every item on a small thread pool, returning results in input order."""
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='pdf-page') as pool:
+        return list(pool.map(fn, items))
@@ -0,0 +1,96 @@
+import json
+import gzip
+import threading
+
+from flask import Response, request
+
+from utils.cache_manager import content_hash
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    brotli = None
+    HAS_BROTLI = False
+
+# Bodies smaller than this go out uncompressed; the framing costs more than it saves
+MIN_COMPRESS_BYTES = 512
+
+
+class EncodedResponse:
+    """
+    A response body encoded once: the raw bytes, their gzip (and brotli, when the
+    package is installed) variants and a strong ETag over the raw bytes.
+    """
+
+    def __init__(self, body, mimetype='application/json'):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = content_hash(body)
+        self.encodings = {}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            if HAS_BROTLI:
+                self.encodings['br'] = brotli.compress(body, quality=9)
+            # mtime=0 keeps the gzip bytes identical across rebuilds of the same body
+            self.encodings['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(json.dumps(data).encode('utf-8'))
+
+    def to_response(self):
+        """
+        Build the Flask response for the current request: 304 on a matching
+        If-None-Match, otherwise the best encoding the client accepts.
+        """
+        if self.etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            encoding = next(
+                (e for e in ('br', 'gzip') if e in self.encodings and request.accept_encodings.quality(e) > 0),
+                None,
+            )
+            response = Response(self.encodings[encoding] if encoding else self.body, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+class ResponseCache:
+    """
+    Encoded responses keyed by endpoint, each tagged with a `version` (file stat,
+    source ETag, refresh timestamp...). An entry is only rebuilt when the caller
+    passes a different version, so hot reads skip loading and serialising.
+    """
+
+    def __init__(self):
+        self._entries = {}  # key -> (version, EncodedResponse)
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        """Return the EncodedResponse for (key, version), calling `build()` to create it on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            # Another request may have rebuilt it while we waited
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            encoded = build()
+            self._entries[key] = (version, encoded)
+            return encoded
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# Global instance
+response_cache = ResponseCache()
@@ -245,7 +245,7 @@ const CureAnalyzer = ({
 
     const analysis = analysisResult.analysis;
     const medList = analysis.medications?.map(m =>
-      `- ${m.name || m.medicine_name || m.input || 'Unknown Medicine'} (Dosage: ${m.dosage && typeof m.dosage === 'object' ? (m.dosage.dosage || JSON.stringify(m.dosage)) : (m.dosage || 'N/A')}, Freq: ${m.frequency || 'N/A'}) ${m.is_corrected ? '[Verified]' : ''}`
+      `- ${m.name || m.medicine_name || m.input || 'Unknown Medicine'} (Dosage: ${m.dosage && typeof m.dosage === 'object' ? (m.dosage.dosage || JSON.stringify(m.dosage)) : (m.dosage || 'N/A')}, Freq: ${m.frequency || 'N/A'}) ${m.is_corrected ? '[Verified]' : ''}${m.valid === false ? ' [Flagged for the diagnosis]' : m.valid == null ? ' [Suitability not checked]' : ''}`
     ).join('\n') || 'None';
 
     const diseaseList = analysis.diseases?.join(', ') || 'None';
@@ -944,6 +944,19 @@ const CureAnalyzer = ({
                                     {med.frequency || 'N/A'}
                                   </span>
                                 </div>
+                                {/* valid: true fits the diagnosis, false is flagged, null/undefined was not assessed */}
+                                {med.valid === false && (
+                                  <div className="flex items-center gap-1.5 px-3 py-1.5 rounded-xl border border-red-500/20 bg-red-500/10">
+                                    <AlertTriangle size={10} className="text-red-400 shrink-0" />
+                                    <span className="font-garet text-[10px] text-red-300 font-bold tracking-wider uppercase">Check with your doctor</span>
+                                  </div>
+                                )}
+                                {med.valid == null && (
+                                  <div className="flex items-center gap-1.5 px-3 py-1.5 rounded-xl border border-white/[0.07] bg-white/[0.03]">
+                                    <Info size={10} className="text-slate-500 shrink-0" />
+                                    <span className="font-garet text-[10px] text-slate-400 tracking-wider uppercase">Suitability not checked</span>
+                                  </div>
+                                )}
                               </div>
 
                               {/* Alternatives — primary focal section */}